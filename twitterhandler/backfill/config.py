@@ -0,0 +1,74 @@
+# --------------------------------------------------------------------------------
+# SoCaTel - Twitter Backfill Container
+# Re-annotates the tweets already stored in the raw twitter index through the
+# Linked Pipes semantic pipeline.
+# --------------------------------------------------------------------------------
+
+
+# ===============================================================================
+# Elastic Search Endpoint Definition
+# ===============================================================================
+# SoCaTel Knowledge Base Deployment
+# ===============================================================================
+elastic_endpoint = "http://<elastic_username>:<elastic_password>@<elastic_host>:9200/"
+elastic_timeline_index = "kb_twitter_raw"
+# ===============================================================================
+
+
+# ===============================================================================
+# Redis Cache Local configuration
+# ===============================================================================
+# SoCaTel Knowledge Base Deployment
+# ===============================================================================
+redis_host = "socatel-redis"
+redis_port = 6379
+redis_password = "default_soca_redis"
+# ===============================================================================
+
+
+# ===============================================================================
+# Linked Pipes ETL Configuration
+# ===============================================================================
+path = "http://<insert_graphql_host>:32800/resources/executions"
+pipeline = "http://<insert_graphql_host>:32800/resources/pipelines/1552388831995"
+# tweets are grouped into executions of at most these many tweets/bytes of input.json
+semantic_batch_max_items = 1000
+semantic_batch_max_bytes = 8388608
+# a batch that is not full is submitted this many seconds after its first tweet
+semantic_flush_interval = 30
+# executions submitted concurrently, the partition workers wait while all of them are busy
+semantic_max_in_flight = 2
+# ===============================================================================
+
+# ===============================================================================
+# Backfill Configuration
+# ===============================================================================
+# the id range of the index is split in these many partitions, read by worker_count workers
+backfill_partitions = 32
+worker_count = 4
+# tweets read per elastic search_after request
+backfill_page_size = 1000
+# redis hash holding the partitions and the last id backfilled in each of them
+backfill_checkpoint_key = "sct:backfill:kb_twitter_raw"
+# set to True to drop the checkpoint and backfill the whole index again
+backfill_reset = False
+# seconds between two checkpoints and progress (docs/sec, ETA) reports
+backfill_report_interval = 30
+# ===============================================================================
+
+# ===============================================================================
+# HTTP Client Configuration
+# ===============================================================================
+# keep-alive connections kept per endpoint (elastic, linked pipes), at least the worker_count
+http_pool_size = 10
+# (connect, read) timeouts in seconds
+elastic_timeout = (10, 60)
+linkedpipes_timeout = (10, 300)
+# ===============================================================================
+
+# ===============================================================================
+# Tweet Encoding Configuration
+# ===============================================================================
+# auto uses orjson when it is installed (python 3.6+) and the standard json module otherwise
+json_backend = "auto"
+# ===============================================================================
@@ -0,0 +1,15 @@
+#!/bin/bash
+PROJECT_NAME=socatel
+CONTAINER_NAME=sct-twitter-backfill
+IMAGE_NAME="$PROJECT_NAME/$CONTAINER_NAME"
+
+# Remove previous socatel-twitter-backfill container (if any)
+echo "Removing $CONTAINER_NAME"
+docker container rm $CONTAINER_NAME
+
+# Build docker image (the build context is the parent folder so that the shared sct_twitter package is included)
+docker build -f Dockerfile -t $IMAGE_NAME:latest ..
+
+# Create docker container but do not run it, start it with docker start to run or resume a backfill
+echo "Creating $CONTAINER_NAME"
+docker create -ti --network=socatel-network --name $CONTAINER_NAME $IMAGE_NAME:latest
@@ -0,0 +1,220 @@
+#/usr/bin/python
+# encoding: utf-8
+
+#-----------------------------------------------------------------------
+# SoCaTel Twitter Backfill
+# twitter-backfill
+#  - re-annotates every tweet of the raw twitter index through the semantic pipeline.
+#-----------------------------------------------------------------------
+
+import os
+import sys
+import time
+import redis
+import datetime
+import threading
+import coloredlogs, logging
+
+# The shared sct_twitter package lives next to the handler directories
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sct_twitter.clients import ELASTIC, LINKED_PIPES, HttpClients
+from sct_twitter.elastic import count_id_range, id_bounds, iter_id_range
+from sct_twitter.ndjson import json_encoder
+from sct_twitter.partitions import DONE, RangeCheckpoint, split_id_range
+from sct_twitter.semantic import SemanticBatcher
+from sct_twitter.workers import AccountWorkerPool
+
+logger = logging.getLogger('TWITTER_HANDLER')
+coloredlogs.install(level='DEBUG', logger=logger)
+
+
+class BackfillProgress(object):
+	"""
+	Backfill progress keeps the last id read in every partition and the number of tweets read so far. The tweets
+	of a position are only in the semantic batcher when it is recorded, a checkpoint is written after a sync
+	"""
+
+	def __init__(self, total):
+		self.total = total
+		self.read = 0
+		self.started = time.time()
+		self.positions = {}
+		self.lock = threading.Lock()
+
+	def advance(self, number, last_id, count):
+		with self.lock:
+			self.positions[number] = last_id
+			self.read += count
+
+	def finish(self, number):
+		with self.lock:
+			self.positions[number] = DONE
+
+	def snapshot(self):
+		with self.lock:
+			return dict(self.positions), self.read
+
+	def report(self, read):
+		"""
+		Report returns the tweets read, the docs/sec and the ETA of the remaining tweets as a log line
+		"""
+		elapsed = max(time.time() - self.started, 0.001)
+		rate = read / elapsed
+		line = str(read) + '/' + str(self.total) + ' tweets, ' + str(round(rate, 1)) + ' docs/sec'
+		if rate > 0 and self.total > read:
+			line += ', ETA ' + str(datetime.timedelta(seconds=int((self.total - read) / rate)))
+		return line
+
+
+def write_checkpoint():
+	"""
+	Write checkpoint method waits until every tweet read so far has been submitted to linked pipes and then stores
+	the partition positions, so that a restarted backfill never skips a tweet. Once a batch was given up on the
+	checkpoint is no longer moved, a restarted backfill reads its tweets again. Returns whether it was stored
+	"""
+	positions, read = progress.snapshot()
+	failed = semantic_batcher.sync()
+	if failed:
+		logger.error(
+			str(failed) + ' semantic batch(es) were given up on, the backfill checkpoint is kept before them: ' +
+			progress.report(read)
+		)
+		return False
+	checkpoint.save(positions)
+	logger.info('Backfill checkpoint: ' + progress.report(read))
+	return True
+
+
+def checkpoint_periodically(stopped):
+	while not stopped.wait(config.get("backfill_report_interval", 30)):
+		try:
+			write_checkpoint()
+		except Exception as ex:
+			logger.error('Writing the backfill checkpoint failed: ' + str(ex))
+
+
+def handle_partition(partition):
+	"""
+	Handle partition method reads a single id range partition in ascending id order, starting right after the last
+	id of its checkpoint, and hands its tweets to the semantic batcher. It runs on the threads of the worker pool
+	"""
+	number, lower, upper, after = partition
+	logger.info('Backfilling partition ' + str(number) + ' [' + str(lower) + ', ' + str(upper) + ')')
+	start = lower if after is None else after + 1
+	for tweets in iter_id_range(
+			elastic_endpoint, elastic_timeline_index, start, upper, config.get("backfill_page_size", 1000),
+			elastic_http):
+		semantic_batcher.add([(tweet['id_str'], json_dumps(tweet)) for tweet in tweets])
+		progress.advance(number, tweets[-1]['id'], len(tweets))
+	progress.finish(number)
+	logger.info('Partition ' + str(number) + ' is now completed')
+
+
+def plan_partitions():
+	"""
+	Plan partitions method returns the (number, lower, upper, last id) partitions that still have tweets to read and
+	the number of tweets left in them. The partitions of an interrupted backfill are read back from its checkpoint
+	"""
+	partitions = None if config.get("backfill_reset") else checkpoint.partitions()
+	if partitions is None:
+		bounds = id_bounds(elastic_endpoint, elastic_timeline_index, elastic_http)
+		if bounds is None:
+			return [], 0
+		partitions = split_id_range(bounds[0], bounds[1] + 1, config.get("backfill_partitions", 32))
+		checkpoint.start(partitions)
+		logger.info('Starting a new backfill over ids [' + str(bounds[0]) + ', ' + str(bounds[1]) + ']')
+	else:
+		logger.info('Resuming the backfill of ' + str(len(partitions)) + ' partitions')
+
+	positions = checkpoint.positions()
+	pending = []
+	remaining = 0
+	for number, (lower, upper) in enumerate(partitions):
+		after = positions.get(number)
+		if after == DONE:
+			continue
+		pending.append((number, lower, upper, after))
+		start = lower if after is None else after + 1
+		remaining += count_id_range(elastic_endpoint, elastic_timeline_index, start, upper, elastic_http)
+	return pending, remaining
+
+
+if __name__ == '__main__':
+	logger.info("==================================================================================================")
+	logger.info("TWITTER BACKFILL STARTED ON " + str(datetime.datetime.now()))
+	logger.info("==================================================================================================")
+	try:
+		# -----------------------------------------------------------------------
+		# Load Config
+		# -----------------------------------------------------------------------
+		config = {}
+		logger.info('Reading Config File')
+		config_path = os.path.join(os.path.dirname(__file__), 'config.py')
+		exec(compile(open(config_path, "rb").read(), config_path, 'exec'), config)
+		logger.info('Config File was read successfully')
+
+		logger.info('Creating Redis Connection Client')
+		redis_client = redis.Redis(
+			host=config["redis_host"], port=config["redis_port"], password=config["redis_password"]
+		)
+		checkpoint = RangeCheckpoint(
+			redis_client, config.get("backfill_checkpoint_key", "sct:backfill:" + config["elastic_timeline_index"])
+		)
+		json_dumps = json_encoder(config.get("json_backend", "auto"))
+
+		#-----------------------------------------------------------------------
+		# pooled keep-alive http sessions for elastic and linked pipes
+		#-----------------------------------------------------------------------
+		worker_count = config.get("worker_count", 4)
+		http_clients = HttpClients(config.get("http_pool_size", 10), {
+			ELASTIC: config.get("elastic_timeout", (10, 60)), LINKED_PIPES: config.get("linkedpipes_timeout", (10, 300))
+		})
+		elastic_http = http_clients.session(ELASTIC)
+		linkedpipes_http = http_clients.session(LINKED_PIPES)
+		elastic_endpoint = config["elastic_endpoint"]
+		elastic_timeline_index = config["elastic_timeline_index"]
+		semantic_batcher = SemanticBatcher(
+			config["path"], config["pipeline"], linkedpipes_http, max_items=config.get("semantic_batch_max_items", 1000),
+			max_bytes=config.get("semantic_batch_max_bytes", 8388608),
+			flush_interval=config.get("semantic_flush_interval", 30),
+			max_in_flight=config.get("semantic_max_in_flight", 2)
+		)
+
+		pending, remaining = plan_partitions()
+		logger.info(str(len(pending)) + ' partition(s) with ' + str(remaining) + ' tweet(s) left to backfill')
+		progress = BackfillProgress(remaining)
+		stopped = threading.Event()
+		checkpointer = threading.Thread(target=checkpoint_periodically, args=(stopped,), name='backfill-checkpoint')
+		checkpointer.daemon = True
+		checkpointer.start()
+
+		# -----------------------------------------------------------------------
+		# every partition is read by a worker of the pool, see sct_twitter.workers
+		# -----------------------------------------------------------------------
+		partitions = iter(pending)
+		AccountWorkerPool(
+			worker_count, handle_partition, credential_key=lambda partition: str(partition[0])
+		).run(lambda: next(partitions, None))
+
+		stopped.set()
+		checkpointer.join()
+		completed = write_checkpoint()
+		semantic_batcher.close()
+		if not completed:
+			raise IOError('Linked Pipes rejected some of the tweets, run the backfill again to resume from its checkpoint')
+		# the pool logs and moves past a partition that raised, it is left unfinished in the checkpoint
+		positions = progress.snapshot()[0]
+		unfinished = [partition[0] for partition in pending if positions.get(partition[0]) != DONE]
+		if unfinished:
+			raise IOError(
+				'Partition(s) ' + ', '.join(str(number) for number in unfinished) + ' failed, run the backfill again ' +
+				'to resume from its checkpoint'
+			)
+		logger.info("Twitter Backfill completed successfully. Exiting....")
+	except KeyError as ex:
+		logger.error('Key' + str(ex.args) + 'does not exists')
+		raise ex
+	except Exception as ex:
+		logger.error('Exception :' + str(ex))
+		logger.error("Twitter Backfill is now exiting")
+		exit(1)
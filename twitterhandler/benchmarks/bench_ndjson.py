@@ -0,0 +1,117 @@
+#/usr/bin/python
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# bench_ndjson
+#  - compares the streaming bulk encoder against the legacy
+#    string concatenation of twitter_bulk_save.
+# -----------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sct_twitter.ndjson import iter_bulk_lines, iter_bulk_chunks, encode_statuses
+
+
+class SyntheticStatus(object):
+	"""
+	Synthetic status mimics the id_str and _json attributes of a tweepy Status
+	"""
+
+	def __init__(self, tweet_id):
+		self.id = tweet_id
+		self.id_str = str(tweet_id)
+		self._json = {
+			"id": tweet_id,
+			"id_str": self.id_str,
+			"created_at": "Wed Oct 10 20:19:24 +0000 2018",
+			"text": "Synthetic tweet " + self.id_str + " " + "lorem ipsum " * 20,
+			"in_reply_to_status_id": None,
+			"in_reply_to_user_id": None,
+			"retweet_count": tweet_id % 17,
+			"favorite_count": tweet_id % 31,
+			"entities": {"hashtags": [{"text": "socatel", "indices": [0, 8]}], "user_mentions": [], "urls": []},
+			"user": {
+				"id": 1234567890,
+				"id_str": "1234567890",
+				"screen_name": "socatel",
+				"name": "SoCaTel",
+				"description": "A multi-stakeholder co-creation platform for better access to Long-Term Care services",
+				"followers_count": 1000,
+				"friends_count": 100
+			}
+		}
+
+
+def legacy_bulk_save(data):
+	"""
+	Legacy bulk save is the original twitter_bulk_save implementation
+	"""
+	to_return = ''
+	for d in data:
+		index = {'index': {'_id': d.id_str}}
+		to_return = to_return + json.dumps(index) + '\n'
+		to_return = to_return + json.dumps(d._json) + '\n'
+	return to_return
+
+
+def streaming_lines(data):
+	"""
+	Consumes the line generator the same way an HTTP body iterator would
+	"""
+	size = 0
+	for line in iter_bulk_lines(data):
+		size += len(line)
+	return size
+
+
+def streaming_chunks(data):
+	"""
+	Consumes bounded chunks from the reusable chunk writer
+	"""
+	size = 0
+	for body, documents in iter_bulk_chunks(encode_statuses(data)):
+		size += len(body)
+	return size
+
+
+def measure(function, data):
+	"""
+	Measure returns the wall time in seconds and the traced peak memory in bytes of a call. The time is taken on a
+	pass of its own without tracemalloc, whose tracing slows every allocation down
+	"""
+	start = time.perf_counter()
+	function(data)
+	elapsed = time.perf_counter() - start
+	tracemalloc.start()
+	function(data)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return elapsed, peak
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Bulk body encoder micro-benchmark')
+	parser.add_argument('--sizes', default='200,3200,50000', help='comma separated tweet counts')
+	parser.add_argument(
+		'--legacy-max', type=int, default=3200,
+		help='skip the legacy encoder above this size, its string concatenation is quadratic'
+	)
+	args = parser.parse_args()
+
+	encoders = [('legacy', legacy_bulk_save), ('lines', streaming_lines), ('chunks', streaming_chunks)]
+	print('{:>8} {:>8} {:>12} {:>14} {:>12}'.format('tweets', 'encoder', 'seconds', 'tweets/sec', 'peak MiB'))
+	for size in [int(size) for size in args.sizes.split(',')]:
+		data = [SyntheticStatus(1000000000000000000 + i) for i in range(size)]
+		for name, function in encoders:
+			if name == 'legacy' and size > args.legacy_max:
+				continue
+			elapsed, peak = measure(function, data)
+			print('{:>8} {:>8} {:>12.4f} {:>14.0f} {:>12.2f}'.format(
+				size, name, elapsed, size / elapsed, peak / 1048576.0))
@@ -0,0 +1,246 @@
+#/usr/bin/python
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# bench_throughput
+#  - end-to-end throughput of the twitter engine against a fake twitter
+#    api and stub elasticsearch/linkedpipes servers, saved per commit.
+# -----------------------------------------------------------------------
+
+import os
+import ast
+import sys
+import json
+import time
+import redis
+import tweepy
+import logging
+import datetime
+import argparse
+import resource
+import subprocess
+import collections
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+HANDLER_DIR = os.path.join(BENCHMARKS_DIR, '..')
+sys.path.insert(0, HANDLER_DIR)
+from sct_twitter.dedup import SET
+from sct_twitter.engine import TwitterEngine
+from sct_twitter.watermarks import REPLIES, TIMELINE
+from fakes import Corpus, FakeTwitterBackend, StubBackendState, start_stub_backend
+
+# Every redis key of a benchmark run starts with this prefix and is deleted before and after the run
+BENCH_PREFIX = 'sct:bench:'
+
+# accounts, tweets and replies/mentions per account, and the streams of the engine
+SCENARIOS = collections.OrderedDict([
+	('small_accounts', {'accounts': 50, 'tweets': 20, 'replies': 5, 'streams': [TIMELINE, REPLIES]}),
+	('backfill_3200', {'accounts': 1, 'tweets': 3200, 'replies': 0, 'streams': [TIMELINE]}),
+	('many_accounts', {'accounts': 500, 'tweets': 40, 'replies': 10, 'streams': [TIMELINE, REPLIES]})
+])
+
+
+def load_config(stub_url, args):
+	"""
+	Load config reads the engine config.py and points it at the stub servers and at the benchmark redis keys
+	"""
+	config = {}
+	config_path = os.path.join(HANDLER_DIR, 'engine', 'config.py')
+	exec(compile(open(config_path, "rb").read(), config_path, 'exec'), config)
+	for key, value in list(config.items()):
+		if key.startswith('redis_') and key not in ('redis_host', 'redis_port', 'redis_password'):
+			config[key] = BENCH_PREFIX + value.replace('sct:', '')
+	config.update({
+		'redis_host': args.redis_host,
+		'redis_port': args.redis_port,
+		'redis_password': args.redis_password,
+		'elastic_endpoint': stub_url,
+		'path': stub_url + 'resources/executions',
+		'to_semantic_redivert': True,
+		'scheduler_enabled': False,
+		'daemon_mode': False,
+		'watermark_rebuild': False,
+		'metrics_port': 0,
+		'metrics_textfile': ''
+	})
+	if args.worker_count:
+		config['worker_count'] = args.worker_count
+	for setting in args.set:
+		key, value = setting.split('=', 1)
+		try:
+			config[key] = ast.literal_eval(value)
+		except (ValueError, SyntaxError):
+			# plain strings do not need to be quoted
+			config[key] = value
+	return config
+
+
+def clear_keys(redis_client):
+	keys = list(redis_client.scan_iter(BENCH_PREFIX + '*'))
+	if keys:
+		redis_client.delete(*keys)
+
+
+def peak_rss_mib():
+	# ru_maxrss is reported in KiB on linux
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_scenario(name, args):
+	"""
+	Run scenario runs the engine once over the accounts of the scenario and returns its measurements. It runs in a
+	process of its own so that the peak RSS is that of the scenario alone
+	"""
+	if args.recorded:
+		corpus = Corpus.recorded(args.recorded)
+		streams = [TIMELINE, REPLIES]
+	else:
+		scenario = SCENARIOS[name]
+		corpus = Corpus.synthetic(max(1, int(scenario['accounts'] * args.scale)), scenario['tweets'], scenario['replies'])
+		streams = scenario['streams']
+	corpus_rss = peak_rss_mib()
+
+	state = StubBackendState(args.elastic_latency / 1000.0, args.linkedpipes_latency / 1000.0)
+	server = start_stub_backend(state)
+	backend = FakeTwitterBackend(corpus, args.rate_window, args.twitter_latency / 1000.0)
+	tweepy.API = backend.api_class()
+	if args.fake_redis:
+		import fakeredis
+		fake_server = fakeredis.FakeServer()
+		redis.Redis = lambda *a, **kw: fakeredis.FakeRedis(server=fake_server)
+
+	config = load_config('http://127.0.0.1:' + str(server.server_address[1]) + '/', args)
+	if args.fake_redis:
+		# fakeredis copies the whole bitmap on every SETBIT, which would make the bloom filter the bottleneck
+		config['dedup_backend'] = SET
+	redis_client = redis.Redis(host=args.redis_host, port=args.redis_port, password=args.redis_password)
+	clear_keys(redis_client)
+	for screen_name in corpus.accounts():
+		redis_client.rpush(config['redis_twitter_services_list'], json.dumps({'_source': {
+			'twitter_screen_name': screen_name, 'organisation_name': screen_name,
+			'twitter_oauth_token': None, 'twitter_oauth_secret': None
+		}}))
+
+	expected = sum(len(statuses) for statuses in corpus.timelines.values()) if TIMELINE in streams else 0
+	if REPLIES in streams:
+		expected += sum(len(statuses) for statuses in corpus.replies.values())
+
+	started = time.time()
+	engine = TwitterEngine(config, streams)
+	engine.run()
+	elapsed = time.time() - started
+
+	indexed = len(state.index(config['elastic_timeline_index']))
+	clear_keys(redis_client)
+	server.shutdown()
+	server.server_close()
+	return {
+		'accounts': len(corpus.accounts()),
+		'streams': streams,
+		'expected_tweets': expected,
+		'indexed_tweets': indexed,
+		'indexed_users': len(state.index(config.get('elastic_user_index', ''))) if config.get('projection_enabled') else 0,
+		'semantic_tweets': state.semantic_tweets,
+		'seconds': round(elapsed, 3),
+		'tweets_per_sec': round(indexed / elapsed, 1) if elapsed else None,
+		'peak_rss_mib': round(peak_rss_mib(), 1),
+		'corpus_rss_mib': round(corpus_rss, 1),
+		'twitter_requests': dict(backend.requests),
+		'twitter_rate_limited': dict(backend.rate_limited),
+		'backend_requests': dict(state.requests),
+		'backend_request_bytes': dict(state.request_bytes)
+	}
+
+
+def git_revision():
+	"""
+	Git revision returns the short hash of the checked out commit, suffixed with -dirty for uncommitted changes
+	"""
+	try:
+		revision = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR)
+		status = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCHMARKS_DIR)
+	except (OSError, subprocess.CalledProcessError):
+		return 'unknown'
+	return revision.decode('utf-8').strip() + ('-dirty' if status.strip() else '')
+
+
+def compare(results, previous):
+	"""
+	Compare prints the change of tweets/sec and peak RSS of every scenario against previously saved results
+	"""
+	print('\ncompared with ' + previous['revision'] + ' (' + previous['created'] + ')')
+	print('{:>16} {:>14} {:>10} {:>14} {:>10}'.format('scenario', 'tweets/sec', 'change', 'peak MiB', 'change'))
+	for name, result in results['scenarios'].items():
+		before = previous['scenarios'].get(name)
+		if before is None or not before.get('tweets_per_sec'):
+			continue
+		print('{:>16} {:>14.1f} {:>+9.1f}% {:>14.1f} {:>+9.1f}%'.format(
+			name, result['tweets_per_sec'], 100.0 * (result['tweets_per_sec'] / before['tweets_per_sec'] - 1),
+			result['peak_rss_mib'], 100.0 * (result['peak_rss_mib'] / before['peak_rss_mib'] - 1)))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Twitter engine end-to-end throughput benchmark')
+	parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated scenarios to run')
+	parser.add_argument('--scale', type=float, default=1.0, help='multiplies the number of accounts of every scenario')
+	parser.add_argument('--recorded', help='replay the statuses of a file with one tweet json per line instead')
+	parser.add_argument('--redis-host', default='localhost')
+	parser.add_argument('--redis-port', type=int, default=6379)
+	parser.add_argument('--redis-password', default=None)
+	parser.add_argument(
+		'--fake-redis', action='store_true', help='use an in-process fakeredis (with the set dedup backend) instead of a server'
+	)
+	parser.add_argument('--worker-count', type=int, default=0, help='override the worker_count of config.py')
+	parser.add_argument(
+		'--set', action='append', default=[], metavar='KEY=VALUE', help='override a config.py setting, e.g. dedup_enabled=True'
+	)
+	parser.add_argument('--twitter-latency', type=float, default=0, help='milliseconds per twitter request')
+	parser.add_argument('--elastic-latency', type=float, default=0, help='milliseconds per elastic request')
+	parser.add_argument('--linkedpipes-latency', type=float, default=0, help='milliseconds per linkedpipes request')
+	parser.add_argument('--rate-window', type=float, default=5, help='seconds per (scaled down) rate limit window')
+	parser.add_argument('--output', default=os.path.join(BENCHMARKS_DIR, 'results'), help='results directory')
+	parser.add_argument('--compare', help='a previously saved results file to compare with')
+	parser.add_argument('--verbose', action='store_true', help='keep the handler logs')
+	parser.add_argument('--child', help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child:
+		if not args.verbose:
+			logging.getLogger('TWITTER_HANDLER').setLevel(logging.WARNING)
+		print(json.dumps(run_scenario(args.child, args)))
+		sys.exit(0)
+
+	previous = None
+	if args.compare:
+		# read before the results of this run are saved, they may replace the file of the same revision
+		with open(args.compare) as previous_file:
+			previous = json.load(previous_file)
+	names = ['recorded'] if args.recorded else [name for name in args.scenarios.split(',') if name]
+	results = {
+		'revision': git_revision(),
+		'created': datetime.datetime.now().isoformat(),
+		'python': sys.version.split()[0],
+		'options': dict((key, value) for key, value in vars(args).items() if key not in ('child', 'output', 'compare')),
+		'scenarios': collections.OrderedDict()
+	}
+	print('{:>16} {:>9} {:>9} {:>10} {:>12} {:>10} {:>9} {:>9}'.format(
+		'scenario', 'accounts', 'tweets', 'seconds', 'tweets/sec', 'peak MiB', 'twitter', 'backend'))
+	for name in names:
+		output = subprocess.check_output([sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ['--child', name])
+		result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+		results['scenarios'][name] = result
+		print('{:>16} {:>9} {:>9} {:>10.2f} {:>12.1f} {:>10.1f} {:>9} {:>9}'.format(
+			name, result['accounts'], result['indexed_tweets'], result['seconds'], result['tweets_per_sec'],
+			result['peak_rss_mib'], sum(result['twitter_requests'].values()), sum(result['backend_requests'].values())))
+		if result['indexed_tweets'] != result['expected_tweets']:
+			print('{:>16} indexed {} of {} tweets'.format('', result['indexed_tweets'], result['expected_tweets']))
+
+	if not os.path.isdir(args.output):
+		os.makedirs(args.output)
+	result_path = os.path.join(args.output, results['revision'] + '.json')
+	with open(result_path, 'w') as result_file:
+		json.dump(results, result_file, indent=2)
+	print('\nresults saved to ' + result_path)
+	if previous is not None:
+		compare(results, previous)
@@ -0,0 +1,518 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# fakes
+#  - offline twitter api and elasticsearch/linkedpipes stand-ins for the
+#    throughput benchmarks.
+# -----------------------------------------------------------------------
+
+import json
+import time
+import threading
+import collections
+import tweepy
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# Requests per rate limit window of the twitter endpoints, as documented for user auth
+RATE_LIMITS = {
+	'/statuses/user_timeline': 900,
+	'/search/tweets': 180,
+	'/users/lookup': 900,
+	'/statuses/lookup': 900
+}
+
+# and for app-only auth
+APP_RATE_LIMITS = {
+	'/statuses/user_timeline': 1500,
+	'/search/tweets': 450,
+	'/users/lookup': 300,
+	'/statuses/lookup': 300
+}
+
+# Replies and mentions of an account come from accounts with ids above this offset
+REPLIER_ID_OFFSET = 100000000
+
+
+def synthetic_status(tweet_id, screen_name, user_id, in_reply_to_user_id=None):
+	"""
+	Synthetic status returns the json of a tweet the size of a typical user_timeline status
+	"""
+	return {
+		"id": tweet_id,
+		"id_str": str(tweet_id),
+		"created_at": "Wed Oct 10 20:19:24 +0000 2018",
+		"text": "Synthetic tweet " + str(tweet_id) + " " + "lorem ipsum " * 12,
+		"truncated": False,
+		"source": "<a href=\"https://socatel.eu\" rel=\"nofollow\">SoCaTel</a>",
+		"in_reply_to_status_id": tweet_id - 1 if in_reply_to_user_id else None,
+		"in_reply_to_status_id_str": str(tweet_id - 1) if in_reply_to_user_id else None,
+		"in_reply_to_user_id": in_reply_to_user_id,
+		"in_reply_to_user_id_str": str(in_reply_to_user_id) if in_reply_to_user_id else None,
+		"retweet_count": tweet_id % 17,
+		"favorite_count": tweet_id % 31,
+		"lang": "en",
+		"entities": {"hashtags": [{"text": "socatel", "indices": [0, 8]}], "user_mentions": [], "urls": []},
+		"user": {
+			"id": user_id,
+			"id_str": str(user_id),
+			"screen_name": screen_name,
+			"name": screen_name.upper(),
+			"description": "A multi-stakeholder co-creation platform for better access to Long-Term Care services",
+			"followers_count": 1000,
+			"friends_count": 100,
+			"statuses_count": 5000,
+			"created_at": "Mon Jan 01 00:00:00 +0000 2018",
+			"profile_image_url_https": "https://pbs.twimg.com/profile_images/0/socatel_normal.png"
+		}
+	}
+
+
+class Corpus(object):
+	"""
+	Corpus holds the timeline and the replies/mentions of every account, newest first, the way twitter pages them
+	"""
+
+	def __init__(self):
+		self.timelines = {}
+		self.replies = {}
+		self.user_ids = {}
+		self.statuses = {}
+
+	def add(self, status, reply_to=None):
+		if reply_to is None:
+			screen_name = status['user']['screen_name'].lower()
+			self.user_ids.setdefault(screen_name, status['user']['id'])
+			self.timelines.setdefault(screen_name, []).append(status)
+		else:
+			self.replies.setdefault(reply_to.lower(), []).append(status)
+		self.statuses[status['id']] = status
+
+	def sort(self):
+		for pages in (self.timelines, self.replies):
+			for statuses in pages.values():
+				statuses.sort(key=lambda status: -status['id'])
+
+	def accounts(self):
+		return sorted(self.timelines)
+
+	def size(self):
+		return len(self.statuses)
+
+	@classmethod
+	def synthetic(cls, accounts, tweets, replies, prefix='account'):
+		"""
+		Returns accounts with the given number of tweets and of replies/mentions each
+		"""
+		corpus = cls()
+		for number in range(accounts):
+			screen_name = prefix + str(number)
+			user_id = number + 1
+			base = (number + 1) * 10 ** 12
+			for offset in range(tweets):
+				corpus.add(synthetic_status(base + offset, screen_name, user_id))
+			for offset in range(replies):
+				replier = REPLIER_ID_OFFSET + offset
+				status = synthetic_status(base + tweets + offset, 'replier' + str(offset), replier, user_id)
+				corpus.add(status, reply_to=screen_name)
+		corpus.sort()
+		return corpus
+
+	@classmethod
+	def recorded(cls, path):
+		"""
+		Returns the tweets of a recorded file with one status json per line (e.g. the _source of an elastic scroll).
+		Replies go to the account they reply to when it is part of the recording, to the timeline of their author
+		otherwise
+		"""
+		corpus = cls()
+		statuses = []
+		with open(path) as recording:
+			for line in recording:
+				if line.strip():
+					statuses.append(json.loads(line))
+		for status in statuses:
+			if status.get('in_reply_to_user_id') is None:
+				corpus.user_ids.setdefault(status['user']['screen_name'].lower(), status['user']['id'])
+		screen_names = dict((user_id, screen_name) for screen_name, user_id in corpus.user_ids.items())
+		for status in statuses:
+			reply_to = screen_names.get(status.get('in_reply_to_user_id'))
+			corpus.add(status, reply_to=reply_to)
+		corpus.sort()
+		return corpus
+
+
+class RateLimitWindows(object):
+	"""
+	Rate limit windows counts the requests of every credential and endpoint in fixed windows of window seconds
+	(a scaled down 15 minute window) and answers with the x-rate-limit headers twitter sends
+	"""
+
+	def __init__(self, window=900, limits=None, app_limits=None):
+		self.window = window
+		self.limits = limits or RATE_LIMITS
+		self.app_limits = app_limits or APP_RATE_LIMITS
+		self.used = collections.defaultdict(int)
+		self.lock = threading.Lock()
+
+	def request(self, credential, endpoint, app_only=False):
+		"""
+		Counts a request and returns its (allowed, headers)
+		"""
+		now = time.time()
+		start = now - now % self.window
+		limit = (self.app_limits if app_only else self.limits)[endpoint]
+		with self.lock:
+			key = (credential, endpoint, start)
+			allowed = self.used[key] < limit
+			if allowed:
+				self.used[key] += 1
+			remaining = limit - self.used[key]
+		return allowed, {
+			'x-rate-limit-limit': str(limit),
+			'x-rate-limit-remaining': str(remaining),
+			'x-rate-limit-reset': str(int(start + self.window) + 1)
+		}
+
+
+class FakeResponse(object):
+
+	def __init__(self, headers, status_code=200):
+		self.headers = headers
+		self.status_code = status_code
+		self.status = status_code
+		self.text = ''
+
+
+class FakeTwitterBackend(object):
+	"""
+	Fake twitter backend serves the corpus to every FakeTwitterApi, applies the rate limit windows and the latency
+	of every request and counts the requests per endpoint
+	"""
+
+	def __init__(self, corpus, window=900, latency=0.0):
+		self.corpus = corpus
+		self.windows = RateLimitWindows(window)
+		self.latency = latency
+		self.requests = collections.Counter()
+		self.rate_limited = collections.Counter()
+		self.lock = threading.Lock()
+
+	def api_class(self):
+		"""
+		Returns a tweepy.API replacement bound to this backend
+		"""
+		return type('BoundFakeTwitterApi', (FakeTwitterApi,), {'backend': self})
+
+	def request(self, api, endpoint):
+		if self.latency:
+			time.sleep(self.latency)
+		allowed, headers = self.windows.request(api.credential, endpoint, api.app_only)
+		api.last_response = FakeResponse(headers, 200 if allowed else 429)
+		with self.lock:
+			self.requests[endpoint] += 1
+			if not allowed:
+				self.rate_limited[endpoint] += 1
+		if not allowed:
+			raise tweepy.RateLimitError('Rate limit exceeded', api.last_response)
+
+
+class FakeTwitterApi(tweepy.API):
+	"""
+	Fake twitter api answers the tweepy calls of the handlers from the corpus of its backend, paging with since_id
+	and max_id the way the twitter endpoints do
+	"""
+
+	backend = None
+
+	def __init__(self, auth_handler=None, **kwargs):
+		super(FakeTwitterApi, self).__init__(auth_handler, **kwargs)
+		self.app_only = isinstance(auth_handler, tweepy.AppAuthHandler)
+		self.credential = (
+			getattr(auth_handler, 'access_token', None) or getattr(auth_handler, '_bearer_token', None) or 'app'
+		)
+		self.last_response = None
+
+	def _page(self, statuses, since_id, max_id, count):
+		page = []
+		for status in statuses:
+			if max_id is not None and status['id'] > int(max_id):
+				continue
+			if since_id is not None and status['id'] <= int(since_id):
+				break
+			page.append(tweepy.models.Status.parse(self, status))
+			if len(page) == count:
+				break
+		return page
+
+	def user_timeline(self, screen_name=None, since_id=None, max_id=None, count=20, **kwargs):
+		self.backend.request(self, '/statuses/user_timeline')
+		statuses = self.backend.corpus.timelines.get(screen_name.lower(), [])
+		# user_timeline only reaches back 3,200 tweets
+		return self._page(statuses[:3200], since_id, max_id, min(count, 200))
+
+	def search(self, q=None, count=15, max_id=None, since_id=None, **kwargs):
+		self.backend.request(self, '/search/tweets')
+		statuses = self.backend.corpus.replies.get(q.split(':', 1)[-1].lower(), [])
+		return self._page(statuses, since_id, max_id, min(count, 100))
+
+	def lookup_users(self, user_ids=None, screen_names=None, **kwargs):
+		self.backend.request(self, '/users/lookup')
+		users = []
+		for screen_name in screen_names or []:
+			user_id = self.backend.corpus.user_ids.get(screen_name.lower())
+			if user_id is not None:
+				users.append(tweepy.models.User.parse(self, {
+					'id': user_id, 'id_str': str(user_id), 'screen_name': screen_name
+				}))
+		return users
+
+	def statuses_lookup(self, id_=None, **kwargs):
+		self.backend.request(self, '/statuses/lookup')
+		statuses = self.backend.corpus.statuses
+		return [tweepy.models.Status.parse(self, statuses[int(i)]) for i in id_ or [] if int(i) in statuses]
+
+	def rate_limit_status(self, **kwargs):
+		reset = int(time.time() + self.backend.windows.window)
+		resources = {}
+		for endpoint in self.backend.windows.limits:
+			resources.setdefault(endpoint.split('/')[1], {})[endpoint] = {'reset': reset}
+		return {'resources': resources}
+
+
+def _term_filters(query):
+	"""
+	Returns the (field, value) pairs of every term filter of a query
+	"""
+	filters = []
+	if isinstance(query, dict):
+		for key, value in query.items():
+			if key == 'term':
+				filters.extend(value.items())
+			else:
+				filters.extend(_term_filters(value))
+	elif isinstance(query, list):
+		for value in query:
+			filters.extend(_term_filters(value))
+	return filters
+
+
+def _range_filters(query):
+	"""
+	Returns the (field, bounds) pairs of every range filter of a query
+	"""
+	filters = []
+	if isinstance(query, dict):
+		for key, value in query.items():
+			if key == 'range':
+				filters.extend(value.items())
+			else:
+				filters.extend(_range_filters(value))
+	elif isinstance(query, list):
+		for value in query:
+			filters.extend(_range_filters(value))
+	return filters
+
+
+def _in_range(value, bounds):
+	if value is None:
+		return False
+	return (
+		('gte' not in bounds or value >= bounds['gte']) and ('gt' not in bounds or value > bounds['gt']) and
+		('lte' not in bounds or value <= bounds['lte']) and ('lt' not in bounds or value < bounds['lt'])
+	)
+
+
+def _field(document, path):
+	for name in path.split('.'):
+		if not isinstance(document, dict):
+			return None
+		document = document.get(name)
+	return document
+
+
+class StubBackendState(object):
+	"""
+	Stub backend state keeps the stored tweets and the request counts of the stub servers
+	"""
+
+	def __init__(self, elastic_latency=0.0, linkedpipes_latency=0.0):
+		self.elastic_latency = elastic_latency
+		self.linkedpipes_latency = linkedpipes_latency
+		self.indices = collections.defaultdict(dict)
+		self.requests = collections.Counter()
+		self.request_bytes = collections.Counter()
+		self.semantic_tweets = 0
+		self.lock = threading.Lock()
+
+	def index(self, path):
+		"""
+		Returns the stored documents of the index of a request path by id
+		"""
+		return self.indices[path.strip('/').split('/')[0]]
+
+	def matching(self, path, query):
+		filters = _term_filters(query.get('query', {}))
+		ranges = _range_filters(query.get('query', {}))
+		with self.lock:
+			documents = list(self.index(path).values())
+		matched = []
+		for document in documents:
+			if not all(_in_range(_field(document, field), bounds) for field, bounds in ranges):
+				continue
+			for field, value in filters:
+				stored = _field(document, field)
+				if isinstance(stored, str) and isinstance(value, str):
+					stored, value = stored.lower(), value.lower()
+				if stored != value:
+					break
+			else:
+				matched.append(document)
+		return matched
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+
+	protocol_version = 'HTTP/1.1'
+	state = None
+
+	def log_message(self, format, *args):
+		pass
+
+	def _read_body(self):
+		length = int(self.headers.get('Content-Length') or 0)
+		return self.rfile.read(length) if length else b''
+
+	def _respond(self, payload, status=200):
+		body = json.dumps(payload).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		self._dispatch()
+
+	def do_POST(self):
+		self._dispatch()
+
+	def do_PUT(self):
+		self._dispatch()
+
+	def _dispatch(self):
+		body = self._read_body()
+		path = self.path.split('?', 1)[0]
+		if path.startswith('/resources/executions'):
+			endpoint = 'linkedpipes_executions'
+		else:
+			endpoint = 'elastic' + next(
+				(name for name in ('_bulk', '_search', '_count', '_doc', '_update', '_mget') if '/' + name in path), '_other'
+			)
+		state = self.state
+		with state.lock:
+			state.requests[endpoint] += 1
+			state.request_bytes[endpoint] += len(body)
+		if endpoint == 'linkedpipes_executions':
+			if state.linkedpipes_latency:
+				time.sleep(state.linkedpipes_latency)
+			return self._linkedpipes(body)
+		if state.elastic_latency:
+			time.sleep(state.elastic_latency)
+		getattr(self, '_' + endpoint)(path, body)
+
+	def _linkedpipes(self, body):
+		# the input.json part of the multipart form is the json array of the tweets
+		state = self.state
+		boundary = self.headers.get('Content-Type', '').split('boundary=')[-1].encode('utf-8')
+		tweets = 0
+		for part in body.split(b'--' + boundary):
+			if b'name="input"' in part:
+				tweets += len(json.loads(part.split(b'\r\n\r\n', 1)[1][:-2].decode('utf-8')))
+		with state.lock:
+			state.semantic_tweets += tweets
+			number = state.requests['linkedpipes_executions']
+		self._respond({'iri': 'http://linkedpipes/resources/executions/' + str(number)})
+
+	def _elastic_bulk(self, path, body):
+		state = self.state
+		documents = state.index(path)
+		lines = body.split(b'\n')
+		items = []
+		index = 0
+		while index < len(lines) - 1:
+			action = json.loads(lines[index].decode('utf-8'))
+			operation = list(action)[0]
+			document_id = action[operation].get('_id')
+			source = json.loads(lines[index + 1].decode('utf-8'))
+			index += 2
+			with state.lock:
+				if operation == 'update':
+					documents.setdefault(document_id, {}).update(source.get('doc', {}))
+					created = False
+				else:
+					created = document_id not in documents
+					documents[document_id] = source
+			items.append({operation: {
+				'_id': document_id, 'status': 201 if created else 200, 'result': 'created' if created else 'updated'
+			}})
+		self._respond({'took': 1, 'errors': False, 'items': items})
+
+	def _elastic_search(self, path, body):
+		query = json.loads(body.decode('utf-8')) if body else {}
+		documents = self.state.matching(path, query)
+		for sort in query.get('sort', []):
+			for field, order in sort.items():
+				documents.sort(key=lambda document: _field(document, field), reverse=order.get('order') == 'desc')
+		if 'search_after' in query:
+			documents = [document for document in documents if document['id'] > query['search_after'][0]]
+		size = query.get('size', 10)
+		source = query.get('_source')
+		hits = [{
+			'_id': document['id_str'], 'sort': [document['id']],
+			'_source': dict((field, document[field]) for field in source if field in document) if source else document
+		} for document in documents[:size]]
+		self._respond({'hits': {'total': {'value': len(documents), 'relation': 'eq'}, 'hits': hits}})
+
+	def _elastic_count(self, path, body):
+		query = json.loads(body.decode('utf-8')) if body else {}
+		self._respond({'count': len(self.state.matching(path, query))})
+
+	def _elastic_doc(self, path, body):
+		document_id = path.rstrip('/').split('/')[-1]
+		with self.state.lock:
+			documents = self.state.index(path)
+			created = document_id not in documents
+			documents[document_id] = json.loads(body.decode('utf-8'))
+		self._respond({'_id': document_id, 'result': 'created' if created else 'updated'}, 201 if created else 200)
+
+	def _elastic_mget(self, path, body):
+		ids = json.loads(body.decode('utf-8')).get('ids', [])
+		with self.state.lock:
+			stored = self.state.index(path)
+			documents = [{'_id': i, 'found': i in stored} for i in ids]
+		self._respond({'docs': documents})
+
+	def _elastic_update(self, path, body):
+		self._elastic_doc(path, body)
+
+	def _elastic_other(self, path, body):
+		self._respond({'acknowledged': True})
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+def start_stub_backend(state, host='127.0.0.1', port=0):
+	"""
+	Start stub backend serves the elastic _doc, _bulk, _search, _count (and _mget) endpoints and the linkedpipes
+	executions endpoint from a daemon thread and returns the server. Its base url is http://host:server_port/
+	"""
+	handler = type('StubHandler', (_StubHandler,), {'state': state})
+	server = _StubServer((host, port), handler)
+	thread = threading.Thread(target=server.serve_forever, name='stub-backend')
+	thread.daemon = True
+	thread.start()
+	return server
@@ -0,0 +1,25 @@
+#!/bin/bash
+PROJECT_NAME=socatel
+CONTAINER_NAME=sct-twitter-engine
+IMAGE_NAME="$PROJECT_NAME/$CONTAINER_NAME"
+
+# Initial Threadpool size
+THREADPOOL_SIZE=2
+
+# Remove previous socatel-twitter-feed container (if any)
+for thread_item in `seq 1 $THREADPOOL_SIZE`
+do
+  echo "Removing $CONTAINER_NAME-TH-$thread_item"
+  docker container rm $CONTAINER_NAME-TH-$thread_item
+done
+
+# Build docker image (the build context is the parent folder so that the shared sct_twitter package is included)
+docker build -f Dockerfile -t $IMAGE_NAME:latest ..
+
+# Create docker container but do not run it
+for thread_item in `seq 1 $THREADPOOL_SIZE`
+do
+  echo "Creating $CONTAINER_NAME-TH-$thread_item"
+  docker create -ti --network=socatel-network -v $CONTAINER_NAME-TH-$thread_item-spool:/usr/src/app/spool \
+    --name $CONTAINER_NAME-TH-$thread_item $IMAGE_NAME:latest
+done
\ No newline at end of file
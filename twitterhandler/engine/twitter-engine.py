@@ -0,0 +1,57 @@
+#/usr/bin/python
+# encoding: utf-8
+
+#-----------------------------------------------------------------------
+# SoCaTel Twitter Engine
+# twitter-engine
+#  - fetches the tweets and the replies/mentions of every queued account in a single pass.
+#-----------------------------------------------------------------------
+
+import os
+import sys
+import datetime
+import coloredlogs, logging
+
+# The shared sct_twitter package lives next to the handler directories
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sct_twitter.engine import TwitterEngine
+from sct_twitter.watermarks import REPLIES, TIMELINE
+
+logger = logging.getLogger('TWITTER_HANDLER')
+coloredlogs.install(level='DEBUG', logger=logger)
+
+
+if __name__ == '__main__':
+	logger.info("==================================================================================================")
+	logger.info("TWITTER ENGINE STARTED ON " + str(datetime.datetime.now()))
+	logger.info("==================================================================================================")
+	try:
+		# -----------------------------------------------------------------------
+		# Load Config
+		# -----------------------------------------------------------------------
+		config = {}
+		logger.info('Reading Config File')
+		logger.info(os.getcwd())
+		config_path = os.path.join(os.path.dirname(__file__), 'config.py')
+		exec(compile(open(config_path, "rb").read(), config_path, 'exec'), config)
+		logger.info('Config File was read successfully')
+
+		# -----------------------------------------------------------------------
+		# every queued service is fetched for its own tweets and for the replies/mentions addressed to it with
+		# the same api object and bulk sink, see sct_twitter.engine
+		# -----------------------------------------------------------------------
+		engine = TwitterEngine(config, config.get("engine_streams", [TIMELINE, REPLIES]))
+		if config.get("daemon_mode"):
+			# stay resident and poll again every daemon_poll_interval seconds until SIGTERM
+			engine.serve()
+		else:
+			engine.run()
+
+		logger.info("Twitter Engine completed successfully. Exiting....")
+	except KeyError as ex:
+		logger.error('Key' + str(ex.args) + 'does not exists')
+		raise ex
+	except Exception as ex:
+		logger.error('Exception :' + str(ex))
+		logger.error("Twitter Engine is now exiting")
+		exit()
@@ -106,6 +106,10 @@ const _elasticSearchObtainedData = function(obtained_data) {
      return Promise.all([_rpushFeed, _rpushReplies]);      
     });    
   });
+  // wake up the handlers that run in daemon mode
+  if (_Config.redis_twitter_services_channel) {
+    _RedisClient.publish(_Config.redis_twitter_services_channel, "loaded");
+  }
 }
 
 /**
@@ -13,6 +13,13 @@ consumer_key = "<insert_a_twitter_consumer_key_here>"
 consumer_secret = "<insert_a_twitter_consumer_secret_here>"
 access_key = "<insert_a_twitter_access_key_here>"
 access_secret = "<insert_a_twitter_access_secret_here>"
+# more credentials the accounts without an oauth token of their own share with the access key pair above, every
+# request goes to the least loaded one that serves its endpoint and a credential that fails to authenticate is
+# evicted. User context entries have a consumer_key, consumer_secret, access_key and access_secret. App-only entries
+# have a bearer_token, or a consumer_key and consumer_secret only, and a higher search/tweets limit (450 requests
+# per window instead of 180). An optional "endpoints" list, e.g. ["/search/tweets"], restricts an entry to those
+# endpoints
+twitter_credentials = []
 # ===============================================================================
 
 
@@ -35,6 +42,37 @@ redis_host = "socatel-redis"
 redis_port = 6379
 redis_password = "default_soca_redis"
 redis_twitter_services_list = "twitter_feed_services"
+# services are claimed queue_claim_batch at a time into an in-flight list of the container and dropped from it
+# once they are written. The services of a container that stops renewing its lease for queue_lease seconds are
+# put back on the list
+queue_claim_batch = 4
+queue_lease = 900
+# seconds an idle container waits for new services before it exits, 0 exits as soon as the list is drained
+queue_wait = 0
+# set to True to poll every account as often as it tweets instead of on every run. Queued services are moved into
+# a redis sorted set of next poll times and only the due accounts are fetched, the most overdue and active first
+scheduler_enabled = False
+redis_schedule_prefix = "sct:schedule"
+# bounds of the seconds between two polls of an account
+schedule_min_interval = 900
+schedule_max_interval = 86400
+# an account is polled again once about these many new tweets are expected
+schedule_target_tweets = 20
+# seconds after which an account whose poll never completed becomes due again
+schedule_lease = 3600
+# hashes holding the highest indexed tweet id per screen name, one per stream (timeline/replies)
+redis_watermark_prefix = "sct:watermark"
+# set to True to ignore the redis watermarks and rebuild them from elasticsearch
+watermark_rebuild = False
+# keys holding how far the pagination of an account got, an interrupted backfill resumes there instead of starting
+# over. They expire after cursor_ttl seconds
+redis_cursor_prefix = "sct:cursor"
+cursor_ttl = 604800
+# hashes holding the twitter rate limit budget of every credential and endpoint, shared by all workers
+redis_ratelimit_prefix = "sct:ratelimit"
+# screen_name to twitter user id cache used by the replies handler, entries expire after the ttl (seconds)
+redis_user_id_prefix = "sct:user_id"
+user_id_cache_ttl = 604800
 
 
 # ===============================================================================
@@ -49,4 +87,182 @@ tweet_count = 200
 to_semantic_redivert = True
 path = "http://<insert_graphql_host>:32800/resources/executions"
 pipeline = "http://<insert_graphql_host>:32800/resources/pipelines/1552388831995"
+# tweets of all accounts are grouped into executions of at most these many tweets/bytes of input.json
+semantic_batch_max_items = 1000
+semantic_batch_max_bytes = 8388608
+# a batch that is not full is submitted this many seconds after its first tweet
+semantic_flush_interval = 30
+# executions submitted concurrently, the account workers wait while all of them are busy
+semantic_max_in_flight = 2
+# ===============================================================================
+
+# ===============================================================================
+# Elastic Search Bulk Write Configuration
+# ===============================================================================
+elastic_bulk_max_docs = 500
+elastic_bulk_max_bytes = 5242880
+elastic_bulk_max_retries = 3
+# ===============================================================================
+
+# ===============================================================================
+# HTTP Client Configuration
+# ===============================================================================
+# keep-alive connections kept per endpoint (elastic, linked pipes), at least twice the worker_count
+http_pool_size = 10
+# (connect, read) timeouts in seconds
+elastic_timeout = (10, 60)
+linkedpipes_timeout = (10, 300)
+# tweepy API objects kept for the accounts that have their own oauth token
+twitter_api_cache_size = 128
+# ===============================================================================
+
+# ===============================================================================
+# Account Worker Pool Configuration
+# ===============================================================================
+# number of accounts handled concurrently by a single container. Accounts sharing an oauth credential
+# are never handled at the same time so that they do not compete for the same rate limit budget
+worker_count = 4
+# ===============================================================================
+
+# ===============================================================================
+# Twitter Rate Limit Budget Configuration
+# ===============================================================================
+# requests kept in reserve of every rate limit window
+rate_limit_reserve = 1
+# once less than this fraction of a window is left the remaining requests are spread over the window
+rate_limit_pace_below = 0.2
+# ===============================================================================
+
+# ===============================================================================
+# Page Pipeline Configuration
+# ===============================================================================
+# number of fetched pages that may wait for the elastic/semantic writes of an account
+pipeline_max_pending_pages = 2
+# ===============================================================================
+
+# ===============================================================================
+# Tweet Encoding Configuration
+# ===============================================================================
+# auto uses orjson when it is installed (python 3.6+) and the standard json module otherwise
+json_backend = "auto"
+# ===============================================================================
+
+# ===============================================================================
+# Daemon Mode Configuration
+# ===============================================================================
+# set to True to keep the container running and drain the services list again every daemon_poll_interval
+# seconds, or as soon as a message is published on daemon_notify_channel. SIGTERM stops it gracefully
+daemon_mode = False
+daemon_poll_interval = 300
+daemon_notify_channel = "sct:services:notify"
+# seconds before the next cycle after a failed one (e.g. a redis or elastic outage), doubled up to
+# daemon_max_backoff while cycles keep failing
+daemon_error_backoff = 5
+daemon_max_backoff = 300
+# ===============================================================================
+
+# ===============================================================================
+# Seen Tweet Ids Configuration
+# ===============================================================================
+# set to True to drop the tweets that were already written before the elastic write and the semantic annotation
+dedup_enabled = False
+redis_dedup_prefix = "sct:seen"
+# "bloom" keeps compact bitmaps (a false positive drops a new tweet), "set" keeps the exact ids
+dedup_backend = "bloom"
+# ids are kept for one to two rotations (seconds), a bloom generation holds dedup_capacity ids at dedup_error_rate
+dedup_rotation = 604800
+dedup_capacity = 1000000
+dedup_error_rate = 0.0001
+# ===============================================================================
+
+# ===============================================================================
+# Tweet Projection Configuration
+# ===============================================================================
+# store and annotate only the projected fields of every tweet, the profile of its author is upserted into
+# elastic_user_index instead, and only when it changed since it was last stored
+projection_enabled = False
+# dotted field paths, e.g. "entities.hashtags.text", empty lists keep the defaults of sct_twitter/projection.py
+projection_tweet_fields = []
+projection_user_fields = []
+elastic_user_index = "kb_twitter_users"
+redis_user_profile_key = "sct:user_profile"
+# the saved bytes are measured on every n-th tweet and extrapolated to the others
+projection_sample_every = 10
+# ===============================================================================
+
+# ===============================================================================
+# Spool Configuration
+# ===============================================================================
+# write fetched pages to an append-only local spool first, elastic and linked pipes are fed from it by drainers
+# that retry until the sinks accept them, so that slow or unavailable sinks neither stall fetching nor lose tweets
+spool_enabled = False
+# relative to the working directory, docker_build.sh mounts a volume there
+spool_directory = "spool"
+spool_segment_bytes = 67108864
+# flush every append and commit to the disk
+spool_fsync = False
+# tweets per elastic delivery, linked pipes deliveries use the semantic batch limits
+spool_drain_max_docs = 1000
+spool_drain_max_bytes = 8388608
+# seconds between attempts, doubled up to spool_max_backoff while a sink keeps failing
+spool_retry_backoff = 5
+spool_max_backoff = 300
+# seconds a run waits for the spool to be drained before exiting, the rest is delivered by the next run
+spool_drain_timeout = 600
+# ===============================================================================
+
+# ===============================================================================
+# Parent Tweets Configuration
+# ===============================================================================
+# once the accounts of a run are handled, look up the parents of the saved replies that are missing from elastic,
+# 100 per statuses/lookup call, so that conversation threads are complete (parents of parents up to
+# parents_max_depth levels)
+parents_enabled = False
+parents_max_depth = 3
+# ids checked against elastic per _mget request
+parents_mget_batch = 1000
+# tweets twitter no longer returns (deleted or protected) are not looked up again for parents_missing_ttl seconds
+redis_missing_parents_key = "sct:missing_parents"
+parents_missing_ttl = 2592000
+# ===============================================================================
+
+# ===============================================================================
+# Engagement Refresh Configuration
+# ===============================================================================
+# once the accounts of a run are handled, look the stored tweets of the age windows that are due up again, 100 per
+# statuses/lookup call, and send the retweet/favorite/quote/reply counters that changed to elastic as partial updates
+engagement_refresh_enabled = False
+# [age, interval] seconds of every window: tweets up to a day old are refreshed every hour, up to a week old every 6
+# hours and up to a month old once a day. The age of a tweet is read from its id
+engagement_refresh_tiers = [[86400, 3600], [604800, 21600], [2592000, 86400]]
+# keys that expire once a window is due again, a single process refreshes a window per interval
+redis_engagement_prefix = "sct:engagement"
+# stored tweets read per elastic search_after request
+engagement_page_size = 1000
+# ===============================================================================
+
+# ===============================================================================
+# Profiling Configuration
+# ===============================================================================
+# run the fetch and save cycle of the profile_accounts screen names (every account when empty) under cProfile and
+# tracemalloc, and write a .prof file and a .txt summary of the top functions and allocation sites per account to
+# profile_directory. The SCT_PROFILE environment variable overrides these settings: 1 profiles every account, a comma
+# separated list of screen names profiles those only and 0 turns profiling off
+profile_enabled = False
+profile_accounts = []
+profile_directory = "profiles"
+# functions and allocation sites listed in the summary
+profile_top = 25
+profile_allocations = True
+profile_allocation_frames = 10
+# ===============================================================================
+
+# ===============================================================================
+# Metrics Configuration
+# ===============================================================================
+# stage latencies, tweet and error counters in the prometheus text format, served on metrics_port (e.g. 9108,
+# 0 disables it) and/or written every metrics_textfile_interval seconds to metrics_textfile for the node exporter
+metrics_port = 0
+metrics_textfile = ""
+metrics_textfile_interval = 15
 # ===============================================================================
@@ -13,12 +13,13 @@ do
   docker container rm $CONTAINER_NAME-TH-$thread_item
 done
 
-# Build docker image
-docker build -t $IMAGE_NAME:latest .
+# Build docker image (the build context is the parent folder so that the shared sct_twitter package is included)
+docker build -f Dockerfile -t $IMAGE_NAME:latest ..
 
 # Create docker container but do not run it
 for thread_item in `seq 1 $THREADPOOL_SIZE`
 do
   echo "Creating $CONTAINER_NAME-TH-$thread_item"
-  docker create -ti --network=socatel-network --name $CONTAINER_NAME-TH-$thread_item $IMAGE_NAME:latest
+  docker create -ti --network=socatel-network -v $CONTAINER_NAME-TH-$thread_item-spool:/usr/src/app/spool \
+    --name $CONTAINER_NAME-TH-$thread_item $IMAGE_NAME:latest
 done
\ No newline at end of file
@@ -0,0 +1,7 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# sct_twitter
+#  - helpers shared by the twitter feed and replies handlers.
+# -----------------------------------------------------------------------
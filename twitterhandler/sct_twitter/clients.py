@@ -0,0 +1,103 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# clients
+#  - pooled keep-alive http sessions and cached tweepy api objects.
+# -----------------------------------------------------------------------
+
+import threading
+import collections
+import tweepy
+import requests
+from requests.adapters import HTTPAdapter
+
+ELASTIC = 'elastic'
+LINKED_PIPES = 'linkedpipes'
+
+
+class TimeoutSession(requests.Session):
+	"""
+	Timeout session is a requests session that applies a default (connect, read) timeout to every request
+	"""
+
+	def __init__(self, timeout):
+		super(TimeoutSession, self).__init__()
+		self.timeout = timeout
+
+	def request(self, method, url, **kwargs):
+		kwargs.setdefault('timeout', self.timeout)
+		return super(TimeoutSession, self).request(method, url, **kwargs)
+
+
+class HttpClients(object):
+	"""
+	Http clients hands out one keep-alive session per endpoint (elastic, linkedpipes). Every session keeps a pool
+	of up to pool_size connections, so the workers of a process reuse their connections instead of opening a new
+	one per request. Sessions are created on first use and are safe to share between the worker threads
+	"""
+
+	def __init__(self, pool_size=10, timeouts=None):
+		self.pool_size = pool_size
+		self.timeouts = timeouts or {}
+		self.sessions = {}
+		self.lock = threading.Lock()
+
+	def session(self, name):
+		with self.lock:
+			if name not in self.sessions:
+				session = TimeoutSession(self.timeouts.get(name, (10, 60)))
+				adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+				session.mount('http://', adapter)
+				session.mount('https://', adapter)
+				self.sessions[name] = session
+			return self.sessions[name]
+
+	def close(self):
+		with self.lock:
+			for session in self.sessions.values():
+				session.close()
+			self.sessions = {}
+
+
+class BearerTokenHandler(tweepy.AppAuthHandler):
+	"""
+	Bearer token handler authenticates app-only with an existing bearer token, tweepy's AppAuthHandler asks twitter
+	for a new one with the consumer key pair instead
+	"""
+
+	def __init__(self, bearer_token):
+		self.consumer_key = None
+		self.consumer_secret = None
+		self._bearer_token = bearer_token
+
+
+class TwitterApiCache(object):
+	"""
+	Twitter api cache keeps the tweepy API objects of the most recently used credential pairs, so that the
+	OAuthHandler and API of an account's own oauth token are only built once per process
+	"""
+
+	def __init__(self, consumer_key, consumer_secret, max_size=128):
+		self.consumer_key = consumer_key
+		self.consumer_secret = consumer_secret
+		self.max_size = max_size
+		self.apis = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, access_key, access_secret):
+		"""
+		Returns the tweepy API of the access token pair, building it on a cache miss
+		"""
+		key = (self.consumer_key, access_key, access_secret)
+		with self.lock:
+			if key in self.apis:
+				self.apis.move_to_end(key)
+				return self.apis[key]
+			auth = tweepy.OAuthHandler(self.consumer_key, self.consumer_secret)
+			auth.set_access_token(access_key, access_secret)
+			api = tweepy.API(auth)
+			self.apis[key] = api
+			if len(self.apis) > self.max_size:
+				self.apis.popitem(last=False)
+			return api
@@ -0,0 +1,158 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# credentials
+#  - pool of the shared twitter credentials of the accounts without an
+#    oauth token of their own.
+# -----------------------------------------------------------------------
+
+import hashlib
+import logging
+import threading
+import collections
+import tweepy
+
+from sct_twitter.clients import BearerTokenHandler
+from sct_twitter.metrics import CREDENTIALS_EVICTED
+from sct_twitter.workers import DEFAULT_CREDENTIAL
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Twitter error codes of a credential that can no longer authenticate: could not authenticate you, invalid or
+# expired token, unable to verify your credentials and bad authentication data
+AUTH_ERROR_CODES = (32, 89, 99, 215)
+
+
+def is_auth_error(ex):
+	"""
+	Is auth error tells a rejected credential apart from other 401 errors, e.g. the timeline of a protected account
+	"""
+	return isinstance(ex, tweepy.TweepError) and getattr(ex, 'api_code', None) in AUTH_ERROR_CODES
+
+
+def credential_key(credential):
+	"""
+	Credential key returns the rate budget key of a twitter_credentials entry. A user context entry shares the key
+	of the accounts whose own oauth token it is (see sct_twitter.workers.service_credential), since they share the
+	same budget. The tokens themselves are never used as a key, only a short digest of them
+	"""
+	if credential.get('access_key'):
+		return hashlib.sha1(credential['access_key'].encode('utf-8')).hexdigest()[:16]
+	token = credential.get('bearer_token') or credential['consumer_key']
+	return 'app-' + hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+
+
+def credential_auth(credential):
+	"""
+	Credential auth builds the tweepy auth handler of a twitter_credentials entry: user context with an access token
+	pair, app-only with a bearer token or with a consumer key pair only
+	"""
+	if credential.get('access_key'):
+		auth = tweepy.OAuthHandler(credential['consumer_key'], credential['consumer_secret'])
+		auth.set_access_token(credential['access_key'], credential['access_secret'])
+	elif credential.get('bearer_token'):
+		auth = BearerTokenHandler(credential['bearer_token'])
+	else:
+		# asks twitter for a bearer token of the consumer key pair
+		auth = tweepy.AppAuthHandler(credential['consumer_key'], credential['consumer_secret'])
+	return auth
+
+
+class CredentialPool(object):
+	"""
+	Credential pool holds the credentials the accounts without an oauth token of their own are fetched with: the
+	config.py access token pair and the twitter_credentials entries. Every request goes to the least loaded
+	credential that serves its endpoint, the one with the shortest rate budget wait and then the most remaining
+	requests. Credentials without a known budget yet are handed out in turn. A credential twitter no longer
+	authenticates is evicted for the rest of the process. The auth handlers are shared, but every thread is given
+	a tweepy API of its own per credential, so that the last_response of an API the rate budget is recorded from
+	is always the one of the thread's own request
+	"""
+
+	def __init__(self, rate_budget, default_auth, credentials=()):
+		self.rate_budget = rate_budget
+		self.lock = threading.Lock()
+		self.local = threading.local()
+		self.turn = 0
+		# key -> (auth handler, endpoints it serves, None for every endpoint)
+		self.members = collections.OrderedDict()
+		self.members[DEFAULT_CREDENTIAL] = (default_auth, None)
+		for credential in credentials:
+			key = credential_key(credential)
+			if key in self.members:
+				continue
+			try:
+				auth = credential_auth(credential)
+			except tweepy.TweepError as ex:
+				logger.error('Twitter credential [' + key + '] is left out of the pool: ' + str(ex))
+				CREDENTIALS_EVICTED.labels().inc()
+				continue
+			endpoints = credential.get('endpoints')
+			self.members[key] = (auth, frozenset(endpoints) if endpoints else None)
+		logger.info('Twitter credential pool of ' + str(len(self.members)) + ' credential(s)')
+
+	def size(self):
+		with self.lock:
+			return len(self.members)
+
+	def _candidates(self, endpoint):
+		with self.lock:
+			members = [
+				(key, auth) for key, (auth, endpoints) in self.members.items() if endpoints is None or endpoint in endpoints
+			]
+			# ties are broken in turn so that concurrent workers start on different credentials
+			self.turn += 1
+		if not members:
+			raise tweepy.TweepError('No twitter credential of the pool serves ' + endpoint)
+		offset = self.turn % len(members)
+		return members[offset:] + members[:offset]
+
+	def _load(self, key, endpoint):
+		remaining = self.rate_budget.remaining(key, endpoint)
+		return self.rate_budget.wait_time(key, endpoint), remaining is not None, -(remaining or 0)
+
+	def api(self, key, auth):
+		"""
+		Returns the tweepy API of the calling thread for the credential, building it on first use
+		"""
+		apis = getattr(self.local, 'apis', None)
+		if apis is None:
+			apis = self.local.apis = {}
+		api = apis.get(key)
+		if api is None or api.auth is not auth:
+			api = apis[key] = tweepy.API(auth)
+		return api
+
+	def choose(self, endpoint):
+		"""
+		Returns the (credential key, api of the calling thread) a request to the endpoint is sent with
+		"""
+		candidates = self._candidates(endpoint)
+		if len(candidates) == 1:
+			key, auth = candidates[0]
+		else:
+			key, auth = min(candidates, key=lambda candidate: self._load(candidate[0], endpoint))
+		return key, self.api(key, auth)
+
+	def wait_time(self, endpoint):
+		"""
+		Returns how many seconds a request to the endpoint waits for the least loaded credential
+		"""
+		return min(self.rate_budget.wait_time(key, endpoint) for key, auth in self._candidates(endpoint))
+
+	def evict(self, key, ex):
+		"""
+		Evicts the credential of a request that failed with an authentication error. Returns whether the request can
+		be sent again with another credential of the pool
+		"""
+		if not is_auth_error(ex):
+			return False
+		with self.lock:
+			evicted = self.members.pop(key, None) is not None
+			left = len(self.members)
+		if evicted:
+			logger.error('Twitter credential [' + key + '] was evicted, ' + str(left) + ' left in the pool: ' + str(ex))
+			CREDENTIALS_EVICTED.labels().inc()
+		# a credential another worker evicted meanwhile is replaced as well
+		return left > 0
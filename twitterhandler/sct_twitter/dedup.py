@@ -0,0 +1,151 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# dedup
+#  - seen tweet ids kept in redis, as bloom filter bitmaps or as sets.
+# -----------------------------------------------------------------------
+
+import math
+import time
+import struct
+import hashlib
+import logging
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+BLOOM = 'bloom'
+SET = 'set'
+
+# Returns a flag per id (ARGV[1] bit positions each) that is 1 when all the bits of the id are set in either key
+_BLOOM_SEEN_SCRIPT = """
+local hashes = tonumber(ARGV[1])
+local flags = {}
+for first = 2, #ARGV, hashes do
+	local seen = 0
+	for _, key in ipairs(KEYS) do
+		local all = 1
+		for position = first, first + hashes - 1 do
+			if redis.call('GETBIT', key, ARGV[position]) == 0 then
+				all = 0
+				break
+			end
+		end
+		if all == 1 then
+			seen = 1
+			break
+		end
+	end
+	table.insert(flags, seen)
+end
+return flags
+"""
+
+_SET_SEEN_SCRIPT = """
+local flags = {}
+for _, id in ipairs(ARGV) do
+	local seen = 0
+	for _, key in ipairs(KEYS) do
+		if redis.call('SISMEMBER', key, id) == 1 then
+			seen = 1
+			break
+		end
+	end
+	table.insert(flags, seen)
+end
+return flags
+"""
+
+
+def bloom_size(capacity, error_rate):
+	"""
+	Bloom size returns the (bits, hashes) of a bloom filter that holds capacity ids at the given false positive rate
+	"""
+	bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+	hashes = max(1, int(round(bits / float(capacity) * math.log(2))))
+	return bits, hashes
+
+
+class SeenIds(object):
+	"""
+	Seen ids remembers the ids of the tweets that were written to elastic, so that a tweet that is fetched again
+	(overlapping searches, mentions of several accounts) is neither written nor annotated twice. Ids are kept in
+	generations of rotation seconds that expire on their own: an id counts as seen while it is in the current or
+	the previous generation. The bloom backend keeps a generation in a redis bitmap sized for capacity ids at the
+	given false positive rate (a false positive drops a new tweet), the set backend keeps the exact ids at a much
+	larger memory cost. Hits and misses are counted in a redis hash shared by all the workers
+	"""
+
+	def __init__(
+			self, redis_client, prefix='sct:seen', rotation=604800, backend=BLOOM, capacity=1000000, error_rate=0.0001):
+		self.redis_client = redis_client
+		self.prefix = prefix
+		self.rotation = rotation
+		self.backend = backend
+		self.bits, self.hashes = bloom_size(capacity, error_rate)
+		if backend == BLOOM:
+			self._seen = redis_client.register_script(_BLOOM_SEEN_SCRIPT)
+		else:
+			self._seen = redis_client.register_script(_SET_SEEN_SCRIPT)
+
+	def _generations(self):
+		generation = int(time.time() // self.rotation)
+		return [self.prefix + ':' + self.backend + ':' + str(number) for number in (generation, generation - 1)]
+
+	def _positions(self, id_str):
+		# double hashing of a single md5 digest gives the bit positions of the id
+		first, second = struct.unpack('<QQ', hashlib.md5(id_str.encode('utf-8')).digest())
+		return [(first + number * second) % self.bits for number in range(self.hashes)]
+
+	def seen(self, ids, record=True):
+		"""
+		Returns the set of the given tweet ids (id_str) that were already written. The hits and misses are only
+		counted with record, a lookup that does not drop fetched tweets leaves them out
+		"""
+		ids = list(ids)
+		if not ids:
+			return set()
+		if self.backend == BLOOM:
+			args = [self.hashes]
+			for id_str in ids:
+				args.extend(self._positions(id_str))
+		else:
+			args = ids
+		flags = self._seen(keys=self._generations(), args=args)
+		seen = set(id_str for id_str, flag in zip(ids, flags) if flag)
+		if not record:
+			return seen
+		pipeline = self.redis_client.pipeline(transaction=False)
+		pipeline.hincrby(self.prefix + ':stats', 'hits', len(seen))
+		pipeline.hincrby(self.prefix + ':stats', 'misses', len(ids) - len(seen))
+		pipeline.execute()
+		return seen
+
+	def add(self, ids):
+		"""
+		Remembers the given tweet ids (id_str) as written
+		"""
+		ids = list(ids)
+		if not ids:
+			return
+		current = self._generations()[0]
+		pipeline = self.redis_client.pipeline(transaction=False)
+		if self.backend == BLOOM:
+			for id_str in ids:
+				for position in self._positions(id_str):
+					pipeline.setbit(current, position, 1)
+		else:
+			pipeline.sadd(current, *ids)
+		# a generation is read for two rotations, as the current and then as the previous one
+		pipeline.expire(current, self.rotation * 2)
+		pipeline.execute()
+
+	def stats(self):
+		"""
+		Returns the hit and miss counters
+		"""
+		counters = self.redis_client.hgetall(self.prefix + ':stats')
+		return {
+			'hits': int(counters.get(b'hits', 0)),
+			'misses': int(counters.get(b'misses', 0))
+		}
@@ -0,0 +1,192 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# elastic
+#  - bulk writes of tweets to elasticsearch.
+# -----------------------------------------------------------------------
+
+import json
+import time
+import logging
+import requests
+
+from sct_twitter.metrics import ELASTIC_ERRORS, STAGE_SECONDS
+from sct_twitter.ndjson import iter_bulk_chunks
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Item statuses elastic may succeed on if the same item is sent again
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ElasticBulkSink(object):
+	"""
+	Elastic bulk sink sends fetched statuses to the elastic _bulk REST API. Every request is capped by the number
+	of documents and by the size of its body. Only the items that elastic reports as failed are retried. Requests
+	go through the given http session (see sct_twitter.clients) or the requests module. With the update action the
+	documents are partial {"doc": ...} updates of stored tweets, counted as indexed once they are applied
+	"""
+
+	def __init__(
+			self, elastic_endpoint, index_name, max_docs=500, max_bytes=5242880, max_retries=3, backoff=1.0,
+			http=requests, action='index'):
+		self.http = http
+		self.action = action
+		self.bulk_path = elastic_endpoint + index_name + '/_bulk'
+		self.max_docs = max_docs
+		self.max_bytes = max_bytes
+		self.max_retries = max_retries
+		self.backoff = backoff
+
+	def save_documents(self, documents):
+		"""
+		Save documents method writes already encoded (id_str, json bytes) documents and returns a summary of
+		indexed, created and failed counts
+		"""
+		summary, pending = self.save_pending(documents)
+		summary['failed'] += len(pending)
+		return summary
+
+	def save_pending(self, documents):
+		"""
+		Save pending method writes already encoded documents and returns the summary and the documents that could
+		not be written for a transient reason (elastic unreachable or still rejecting them after every retry), so
+		that they can be written again later. Documents elastic refused for good are counted as failed only
+		"""
+		summary = {'indexed': 0, 'created': 0, 'failed': 0}
+		pending = []
+		for body, chunk in iter_bulk_chunks(documents, self.max_docs, self.max_bytes, self.action):
+			pending.extend(self._save_chunk(body, chunk, summary))
+		summary['failed'] -= len(pending)
+		return summary, pending
+
+	def _save_chunk(self, body, chunk, summary):
+		"""
+		Sends a single chunk and keeps re-sending the retryable failures with an exponential backoff. Returns the
+		documents it gave up on, which are also counted as failed
+		"""
+		attempt = 0
+		while chunk:
+			if body is None:
+				# a retry only carries the failed subset of the chunk which always fits in a single body
+				body, chunk = next(iter_bulk_chunks(chunk, self.max_docs, self.max_bytes, self.action))
+			if attempt:
+				sleep_interval = self.backoff * (2 ** (attempt - 1))
+				logger.info('Retrying ' + str(len(chunk)) + ' bulk items in ' + str(sleep_interval) + 'sec')
+				time.sleep(sleep_interval)
+			chunk = self._post(body, chunk, summary)
+			body = None
+			attempt += 1
+			if chunk and attempt > self.max_retries:
+				logger.error('Giving up on ' + str(len(chunk)) + ' bulk items after ' + str(attempt) + ' attempts')
+				summary['failed'] += len(chunk)
+				return chunk
+		return []
+
+	def _post(self, body, chunk, summary):
+		"""
+		Posts a chunk to elastic, updates the summary and returns the documents that should be sent again
+		"""
+		try:
+			with STAGE_SECONDS.labels('elastic_bulk').time():
+				response = self.http.post(
+					self.bulk_path, data=body, headers={'Content-Type': 'application/x-ndjson'}
+				)
+		except requests.RequestException as ex:
+			logger.error('Bulk request failed: ' + str(ex))
+			ELASTIC_ERRORS.labels('request').inc()
+			return chunk
+		if response.status_code in RETRYABLE_STATUSES:
+			logger.error('Bulk request was rejected with status ' + str(response.status_code))
+			ELASTIC_ERRORS.labels('rejected').inc()
+			return chunk
+		if response.status_code != 200:
+			logger.error('Bulk request failed with status ' + str(response.status_code) + ': ' + response.text)
+			ELASTIC_ERRORS.labels('status').inc()
+			summary['failed'] += len(chunk)
+			return []
+
+		retry = []
+		for document, item in zip(chunk, response.json()['items']):
+			result = item[self.action]
+			if 'error' not in result:
+				summary['indexed'] += 1
+				if result.get('result') == 'created':
+					summary['created'] += 1
+			elif result['status'] in RETRYABLE_STATUSES:
+				ELASTIC_ERRORS.labels('rejected_item').inc()
+				retry.append(document)
+			else:
+				logger.error('Tweet [' + document[0] + '] was not indexed: ' + json.dumps(result['error']))
+				ELASTIC_ERRORS.labels('item').inc()
+				summary['failed'] += 1
+		return retry
+
+
+def qr_id_range(lower, upper):
+	"""
+	Query returns the tweets whose id is within [lower, upper)
+	"""
+	query = {
+		"query": {
+			"range": {
+				"id": {
+					"gte": lower,
+					"lt": upper
+				}
+			}
+		}
+	}
+	return query
+
+
+def id_bounds(elastic_endpoint, index_name, http=requests):
+	"""
+	Id bounds returns the (lowest, highest) tweet id of the index or None when it is empty. The ids are read from
+	the sort values of two single hit searches since min/max aggregations return doubles that cannot hold a tweet id
+	"""
+	bounds = []
+	for order in ('asc', 'desc'):
+		query = {"sort": [{"id": {"order": order}}], "size": 1, "_source": False}
+		hits = http.post(elastic_endpoint + index_name + '/_search', json=query).json()['hits']['hits']
+		if not hits:
+			return None
+		bounds.append(int(hits[0]['sort'][0]))
+	return bounds[0], bounds[1]
+
+
+def count_id_range(elastic_endpoint, index_name, lower, upper, http=requests):
+	"""
+	Count id range returns the number of tweets whose id is within [lower, upper)
+	"""
+	return http.post(elastic_endpoint + index_name + '/_count', json=qr_id_range(lower, upper)).json()['count']
+
+
+def iter_id_range(elastic_endpoint, index_name, lower, upper, page_size=1000, http=requests, source=None):
+	"""
+	Iter id range yields the _source of the tweets whose id is within [lower, upper) in ascending id order, one page
+	at a time, with only the source fields when they are given. Pages are read with search_after on the id so that,
+	unlike a scroll, no search context is kept open and a reader can start again right after the last id it handled
+	"""
+	search_path = elastic_endpoint + index_name + '/_search'
+	params = {'filter_path': 'hits.hits._source,hits.hits.sort'}
+	query = qr_id_range(lower, upper)
+	query.update({"sort": [{"id": {"order": "asc"}}], "size": page_size, "track_total_hits": False})
+	if source is not None:
+		query["_source"] = list(source)
+	while True:
+		response = http.post(search_path, params=params, json=query)
+		if response.status_code != 200:
+			# an empty page would end the range, the ids after the last one read were never seen
+			raise IOError(
+				'Search of the ids [' + str(lower) + ', ' + str(upper) + ') responded ' + str(response.status_code) + ': ' +
+				response.text[:500]
+			)
+		hits = response.json().get('hits', {}).get('hits', [])
+		if not hits:
+			return
+		yield [hit['_source'] for hit in hits]
+		if len(hits) < page_size:
+			return
+		query['search_after'] = hits[-1]['sort']
@@ -0,0 +1,150 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# engagement
+#  - refresh of the engagement counters of recently indexed tweets.
+# -----------------------------------------------------------------------
+
+import time
+import logging
+import tweepy
+
+from sct_twitter.elastic import iter_id_range
+from sct_twitter.metrics import ENGAGEMENT_TWEETS
+from sct_twitter.ndjson import json_encoder
+from sct_twitter.threads import STATUSES_LOOKUP_BATCH_SIZE
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Stream name of the refreshed tweets in the metrics
+ENGAGEMENT = 'engagement'
+
+# Milliseconds of the twitter epoch, a tweet id holds its creation time in milliseconds since then above bit 22
+TWITTER_EPOCH_MS = 1288834974657
+
+# Counters of a stored tweet that keep changing after it was indexed
+ENGAGEMENT_FIELDS = ('retweet_count', 'favorite_count', 'quote_count', 'reply_count')
+
+# (age in seconds, refresh interval in seconds) of every window: the tweets of the last day are refreshed every hour,
+# those of the rest of the week every 6 hours and those of the rest of the month once a day
+DEFAULT_TIERS = ((86400, 3600), (604800, 21600), (2592000, 86400))
+
+
+def snowflake_id(timestamp):
+	"""
+	Snowflake id returns the lowest tweet id created at the timestamp (seconds since the unix epoch)
+	"""
+	return max(0, int(timestamp * 1000) - TWITTER_EPOCH_MS) << 22
+
+
+class EngagementRefresher(object):
+	"""
+	Engagement refresher keeps the engagement counters of the stored tweets current. The tweets are split in age
+	windows by their id, which holds their creation time, and every window is refreshed at its own interval, e.g.
+	the tweets of the last day every hour and older ones less and less often. A window is claimed with a redis key
+	that expires after its interval, so that a single process refreshes it per interval. The claim is released when
+	elastic fails, so that the window is tried again on the next cycle. The tweets of a window are read from elastic
+	with their counters only, looked up again 100 ids per twitter call, and only the counters that changed are sent
+	to elastic as partial updates
+	"""
+
+	def __init__(
+		self, redis_client, elastic_endpoint, index_name, http, sink, tiers=DEFAULT_TIERS, prefix='sct:engagement',
+		page_size=1000, fields=ENGAGEMENT_FIELDS, dumps=None
+	):
+		self.redis_client = redis_client
+		self.elastic_endpoint = elastic_endpoint
+		self.index_name = index_name
+		self.http = http
+		self.sink = sink
+		self.tiers = sorted((int(age), int(interval)) for age, interval in tiers)
+		self.prefix = prefix
+		self.page_size = page_size
+		self.fields = tuple(fields)
+		self.dumps = dumps or json_encoder('json')
+
+	def _claim_key(self, age):
+		return self.prefix + ':' + str(age)
+
+	def due_windows(self, now=None):
+		"""
+		Claims the windows whose interval is over and returns their (newer age, age, lower id, upper id) ranges
+		"""
+		now = time.time() if now is None else now
+		windows = []
+		newer_age = 0
+		for age, interval in self.tiers:
+			if self.redis_client.set(self._claim_key(age), str(now), nx=True, ex=interval):
+				windows.append((newer_age, age, snowflake_id(now - age), snowflake_id(now - newer_age)))
+			newer_age = age
+		return windows
+
+	def changes(self, stored, statuses):
+		"""
+		Returns the (id_str, json bytes) partial updates of the counters of the statuses that differ from the stored
+		ones
+		"""
+		updates = []
+		for status in statuses:
+			current = stored.get(status.id_str, {})
+			changed = dict(
+				(field, status._json[field]) for field in self.fields
+				if field in status._json and status._json[field] != current.get(field)
+			)
+			if changed:
+				updates.append((status.id_str, self.dumps({'doc': changed})))
+		return updates
+
+	def refresh(self, lookup):
+		"""
+		Refresh method refreshes the windows that are due with lookup, a function that returns the statuses of up to
+		100 ids, and returns the number of checked, changed, unchanged and missing (deleted or protected) tweets
+		"""
+		counts = {'checked': 0, 'changed': 0, 'unchanged': 0, 'missing': 0}
+		for newer_age, age, lower, upper in self.due_windows():
+			started = time.time()
+			window = {'checked': 0, 'changed': 0, 'unchanged': 0, 'missing': 0}
+			try:
+				self.refresh_window(lower, upper, lookup, window)
+				logger.info(
+					'Engagement of the tweets aged ' + str(newer_age) + ' to ' + str(age) + 'sec refreshed in ' +
+					str(round(time.time() - started, 2)) + 'sec: ' + str(window)
+				)
+			except (IOError, ValueError) as ex:
+				logger.error(
+					'Refreshing the engagement of the tweets aged ' + str(newer_age) + ' to ' + str(age) + 'sec failed, ' +
+					'it is tried again on the next cycle: ' + str(ex)
+				)
+				self.redis_client.delete(self._claim_key(age))
+			for name, count in window.items():
+				counts[name] += count
+				ENGAGEMENT_TWEETS.labels(name).inc(count)
+		return counts
+
+	def refresh_window(self, lower, upper, lookup, window):
+		"""
+		Refresh window method refreshes the tweets whose id is within [lower, upper) and adds them to the window
+		counts
+		"""
+		for hits in iter_id_range(
+			self.elastic_endpoint, self.index_name, lower, upper, self.page_size, self.http, ('id_str',) + self.fields
+		):
+			stored = dict((hit['id_str'], hit) for hit in hits if hit.get('id_str'))
+			ids = sorted(stored)
+			for start in range(0, len(ids), STATUSES_LOOKUP_BATCH_SIZE):
+				batch = ids[start:start + STATUSES_LOOKUP_BATCH_SIZE]
+				try:
+					statuses = lookup(batch)
+				except tweepy.TweepError as ex:
+					logger.warning('Twitter statuses lookup failed for ' + str(len(batch)) + ' tweets: ' + str(ex))
+					continue
+				updates = self.changes(stored, statuses)
+				if updates:
+					summary = self.sink.save_documents(updates)
+					if summary['failed']:
+						logger.warning('Engagement update summary: ' + str(summary))
+				window['checked'] += len(batch)
+				window['changed'] += len(updates)
+				window['unchanged'] += len(statuses) - len(updates)
+				window['missing'] += len(batch) - len(statuses)
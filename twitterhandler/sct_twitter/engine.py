@@ -0,0 +1,1106 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# engine
+#  - fetches and saves the timeline and/or the replies of the queued accounts.
+# -----------------------------------------------------------------------
+
+import os
+import json
+import time
+import redis
+import signal
+import threading
+import collections
+import tweepy
+import logging
+
+from sct_twitter.clients import ELASTIC, LINKED_PIPES, HttpClients, TwitterApiCache
+from sct_twitter.credentials import CredentialPool
+from sct_twitter.dedup import SeenIds
+from sct_twitter.elastic import RETRYABLE_STATUSES, ElasticBulkSink
+from sct_twitter.engagement import DEFAULT_TIERS, ENGAGEMENT, EngagementRefresher
+from sct_twitter.identity import UserIdCache
+from sct_twitter.metrics import (
+	ACCOUNTS_HANDLED, LINKED_PIPES_ERRORS, RATE_LIMIT_SLEEP_SECONDS, SEMANTIC_TWEETS, STAGE_SECONDS, TWEETS_DUPLICATE,
+	TWEETS_FETCHED, TWEETS_INDEXED, TextfileExporter, start_http_exporter
+)
+from sct_twitter.ndjson import encode_statuses, json_array, json_encoder
+from sct_twitter.pipeline import run_pipeline
+from sct_twitter.profiling import AccountProfiler, profiled_accounts
+from sct_twitter.projection import TweetProjector, UserProfileStore
+from sct_twitter.ratelimit import (
+	LOOKUP_STATUSES_ENDPOINT, LOOKUP_USERS_ENDPOINT, SEARCH_ENDPOINT, TIMELINE_ENDPOINT, RateBudget
+)
+from sct_twitter.scheduler import ActivityScheduler
+from sct_twitter.semantic import SemanticBatcher, submit_semantic
+from sct_twitter.spool import Spool, SpoolDrainer
+from sct_twitter.threads import PARENTS, ParentResolver
+from sct_twitter.watermarks import REPLIES, TIMELINE, PaginationCursors, WatermarkStore
+from sct_twitter.workers import DEFAULT_CREDENTIAL, AccountWorkerPool, service_credential
+from sct_twitter.workqueue import LeasedWorkQueue
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Twitter endpoint every stream is fetched from
+STREAM_ENDPOINTS = {
+	TIMELINE: TIMELINE_ENDPOINT,
+	REPLIES: SEARCH_ENDPOINT
+}
+
+
+# -----------------------------------------------------------------------
+# ELASTICSEARCH QUERY/UTILS METHOD LIST
+# -----------------------------------------------------------------------
+
+def qr_latest_tweet(screen_name):
+	"""
+	Query returns the latest tweet on a descending order based on the id field
+	"""
+	query = {
+		"query": {
+			"constant_score": {
+				"filter": {
+					"term": {
+						"user.screen_name": screen_name,
+						"in_reply_to_user_id": None
+					}
+				}
+			}
+		},
+		"sort": [
+			{
+				"id":
+					{
+						"order": "desc"
+					}
+			}
+		],
+		"size": 1
+	}
+	return query
+
+
+def qr_number_of_tweets(screen_name):
+	"""
+	Query returns the number of tweets for a specific screen name
+	"""
+	query = {
+		"query": {
+			"constant_score": {
+				"filter": {
+					"term": {
+						"user.screen_name": screen_name,
+						"in_reply_to_user_id": None
+					}
+				}
+			}
+		}
+	}
+	return query
+
+
+def qr_random_tweet(screen_name):
+	"""
+	Query returns a random tweet based on the screen_name parameter
+	"""
+	query = {
+		"query": {
+			"constant_score": {
+				"filter": {
+					"term": {
+						"user.screen_name": screen_name
+					}
+				}
+			}
+		},
+		"size": 1
+	}
+	return query
+
+
+def qr_latest_reply_tweet(user_id):
+	"""
+	Query returns the latest reply on a descending order based on the id field
+	"""
+	query = {
+		"query": {
+			"constant_score": {
+				"filter": {
+					"term": {
+						"in_reply_to_user_id": user_id
+					}
+				}
+			}
+		},
+		"sort": [{
+			"id": {
+				"order": "desc"
+			}
+		}],
+		"size": 1
+	}
+	return query
+
+
+class TwitterEngine(object):
+	"""
+	Twitter engine handles the queued accounts of a redis list on the account worker pool. Every account is fetched
+	for each of the given streams: TIMELINE (the account's own tweets) and/or REPLIES (the replies and mentions
+	addressed to it). The feed and replies handlers run a single stream each, the combined engine runs both in a
+	single pass that shares the api object, the watermark and user id lookups, the page pipeline and the bulk sink
+	"""
+
+	def __init__(self, config, streams):
+		self.config = config
+		self.streams = list(streams)
+
+		logger.info('Creating Redis Connection Client')
+		self.redis_client = redis.Redis(
+			host=config["redis_host"], port=config["redis_port"], password=config["redis_password"]
+		)
+
+		# -----------------------------------------------------------------------
+		# Load initial tweet_count constant if not available in config.py
+		# -----------------------------------------------------------------------
+		self.tweet_count = config.get("tweet_count", 200)
+		self.rate_budget = RateBudget(
+			self.redis_client, config.get("redis_ratelimit_prefix", "sct:ratelimit"), config.get("rate_limit_reserve", 1),
+			config.get("rate_limit_pace_below", 0.2)
+		)
+		self.watermarks = WatermarkStore(self.redis_client, config.get("redis_watermark_prefix", "sct:watermark"))
+		self.cursors = PaginationCursors(
+			self.redis_client, config.get("redis_cursor_prefix", "sct:cursor"), config.get("cursor_ttl", 604800)
+		)
+		self.identities = UserIdCache(
+			self.redis_client, config.get("user_id_cache_ttl", 604800), config.get("redis_user_id_prefix", "sct:user_id")
+		)
+		self.json_dumps = json_encoder(config.get("json_backend", "auto"))
+		self.seen_ids = None
+		if config.get("dedup_enabled"):
+			self.seen_ids = SeenIds(
+				self.redis_client, config.get("redis_dedup_prefix", "sct:seen"), config.get("dedup_rotation", 604800),
+				config.get("dedup_backend", "bloom"), config.get("dedup_capacity", 1000000),
+				config.get("dedup_error_rate", 0.0001)
+			)
+		self.queue = None
+		self.scheduler = None
+		if config.get("scheduler_enabled"):
+			# every mode keeps a schedule of its own since accounts tweet and get replies at different rates
+			self.scheduler = ActivityScheduler(
+				self.redis_client, config.get("redis_schedule_prefix", "sct:schedule") + ':' + '+'.join(self.streams),
+				min_interval=config.get("schedule_min_interval", 900),
+				max_interval=config.get("schedule_max_interval", 86400),
+				target_tweets=config.get("schedule_target_tweets", 20), lease=config.get("schedule_lease", 3600)
+			)
+		self.claimed = collections.deque()
+		self.leased = {}
+		self.lock = threading.Lock()
+		self.pool = None
+		self.metrics_server = None
+		self.metrics_textfile = None
+		self.queue_wait = 0
+		self.stopping = threading.Event()
+		self.profiler = None
+		accounts = profiled_accounts(config)
+		if accounts is not None:
+			# the config.py settings can be overridden with the SCT_PROFILE environment variable
+			self.profiler = AccountProfiler(
+				config.get("profile_directory", "profiles"), accounts, config.get("profile_top", 25),
+				config.get("profile_allocations", True), config.get("profile_allocation_frames", 10)
+			)
+			logger.info('Profiling ' + (', '.join(accounts) if accounts else 'every account'))
+
+		# -----------------------------------------------------------------------
+		# create twitter API object, the API objects of the accounts' own tokens are cached next to it
+		# -----------------------------------------------------------------------
+		self.twitter_apis = TwitterApiCache(
+			config["consumer_key"], config["consumer_secret"], config.get("twitter_api_cache_size", 128)
+		)
+		self.default_api = self.twitter_apis.get(config["access_key"], config["access_secret"])
+		# the accounts without an oauth token of their own share the default credential and the twitter_credentials
+		self.credentials = CredentialPool(
+			self.rate_budget, self.default_api.auth, config.get("twitter_credentials", [])
+		)
+
+		# -----------------------------------------------------------------------
+		# pooled keep-alive http sessions for elastic and linked pipes
+		# -----------------------------------------------------------------------
+		self.http_clients = HttpClients(config.get("http_pool_size", 10), {
+			ELASTIC: config.get("elastic_timeout", (10, 60)), LINKED_PIPES: config.get("linkedpipes_timeout", (10, 300))
+		})
+		self.elastic_http = self.http_clients.session(ELASTIC)
+		self.elastic_endpoint = config["elastic_endpoint"]
+		self.index_name = config["elastic_timeline_index"]
+		self.bulk_sink = ElasticBulkSink(
+			self.elastic_endpoint, self.index_name, max_docs=config.get("elastic_bulk_max_docs", 500),
+			max_bytes=config.get("elastic_bulk_max_bytes", 5242880),
+			max_retries=config.get("elastic_bulk_max_retries", 3), http=self.elastic_http
+		)
+		self.projector = None
+		self.user_profiles = None
+		self.user_sink = None
+		if config.get("projection_enabled"):
+			# tweets keep only the projected fields, the profiles of their authors go to a user index of their own
+			self.projector = TweetProjector(
+				config.get("projection_tweet_fields"), config.get("projection_user_fields"), self.json_dumps,
+				config.get("projection_sample_every", 10)
+			)
+			self.user_profiles = UserProfileStore(
+				self.redis_client, config.get("redis_user_profile_key", "sct:user_profile"), self.json_dumps
+			)
+			self.user_sink = ElasticBulkSink(
+				self.elastic_endpoint, config.get("elastic_user_index", "kb_twitter_users"),
+				max_docs=config.get("elastic_bulk_max_docs", 500), max_bytes=config.get("elastic_bulk_max_bytes", 5242880),
+				max_retries=config.get("elastic_bulk_max_retries", 3), http=self.elastic_http
+			)
+		self.spool = None
+		self.spool_drainers = []
+		if config.get("spool_enabled"):
+			# fetched pages are written to the local spool first and drained to the sinks by threads of their own
+			consumers = [ELASTIC] + ([LINKED_PIPES] if config["to_semantic_redivert"] is True else [])
+			self.spool = Spool(
+				config.get("spool_directory", "spool"), consumers, config.get("spool_segment_bytes", 67108864),
+				config.get("spool_fsync", False)
+			)
+		self.user_spool = None
+		if self.spool is not None and self.user_sink is not None:
+			# the changed user profiles are spooled next to the tweets and drained to the user index
+			self.user_spool = Spool(
+				os.path.join(config.get("spool_directory", "spool"), "users"), [ELASTIC],
+				config.get("spool_segment_bytes", 67108864), config.get("spool_fsync", False)
+			)
+		self.parents = None
+		if config.get("parents_enabled"):
+			self.parents = ParentResolver(
+				self.redis_client, self.elastic_endpoint, self.index_name, self.elastic_http,
+				config.get("redis_missing_parents_key", "sct:missing_parents"), config.get("parents_missing_ttl", 2592000),
+				config.get("parents_mget_batch", 1000), self.seen_ids
+			)
+		self.engagement = None
+		if config.get("engagement_refresh_enabled"):
+			# counters are sent to the tweets index directly as partial updates, they are not spooled
+			self.engagement = EngagementRefresher(
+				self.redis_client, self.elastic_endpoint, self.index_name, self.elastic_http,
+				ElasticBulkSink(
+					self.elastic_endpoint, self.index_name, max_docs=config.get("elastic_bulk_max_docs", 500),
+					max_bytes=config.get("elastic_bulk_max_bytes", 5242880),
+					max_retries=config.get("elastic_bulk_max_retries", 3), http=self.elastic_http, action='update'
+				),
+				config.get("engagement_refresh_tiers", DEFAULT_TIERS),
+				config.get("redis_engagement_prefix", "sct:engagement"), config.get("engagement_page_size", 1000),
+				dumps=self.json_dumps
+			)
+		self.semantic_batcher = None
+		if config["to_semantic_redivert"] is True and self.spool is None:
+			self.semantic_batcher = SemanticBatcher(
+				config["path"], config["pipeline"], self.http_clients.session(LINKED_PIPES),
+				max_items=config.get("semantic_batch_max_items", 1000),
+				max_bytes=config.get("semantic_batch_max_bytes", 8388608),
+				flush_interval=config.get("semantic_flush_interval", 30),
+				max_in_flight=config.get("semantic_max_in_flight", 2)
+			)
+
+	# ---------------------------------------------------------------------
+	# TWITTER HELPER METHOD LIST
+	# ---------------------------------------------------------------------
+
+	def limit_exception_handling(self, api, credential=DEFAULT_CREDENTIAL, endpoint=TIMELINE_ENDPOINT):
+		"""
+		Limit exception handling method is able to read the limit constraint from the headers of the rejected
+		response, which are also recorded in the shared rate budget. This results to how many msec the API should
+		not be used. A timer is then being used as a stalling mechanism to stall the API from requesting data.
+		The rate limited api.rate_limit_status() is only asked when the headers are missing
+		"""
+		self.rate_budget.record(credential, endpoint, api.last_response)
+		sleep_interval = self.rate_budget.wait_time(credential, endpoint)
+		if sleep_interval <= 0:
+			limit = api.rate_limit_status()
+			logger.info('Error Twitter Limit Exception: ' + json.dumps(limit, indent=4, sort_keys=True))
+			sleep_interval = limit['resources'][endpoint.split('/')[1]][endpoint]["reset"] - time.time()
+		if sleep_interval > 0:
+			logger.info('Sleeping for ' + str(sleep_interval) + 'msec')
+			RATE_LIMIT_SLEEP_SECONDS.labels(endpoint).inc(sleep_interval)
+			time.sleep(sleep_interval)
+
+	def rate_limited(self, api, credential, endpoint, account_credential=DEFAULT_CREDENTIAL):
+		"""
+		Rate limited method handles the RateLimitError of a request. A request of an account that shares the credential
+		pool is sent again right away when another credential of the pool has budget left, otherwise it waits in
+		limit_exception_handling
+		"""
+		if account_credential == DEFAULT_CREDENTIAL:
+			self.rate_budget.record(credential, endpoint, api.last_response)
+			if self.rate_budget.wait_time(credential, endpoint) > 0 and self.credentials.wait_time(endpoint) <= 0:
+				logger.info('Credential [' + credential + '] is rate limited on ' + endpoint + ', switching credentials')
+				return
+		self.limit_exception_handling(api, credential, endpoint)
+
+	def auth_failed(self, credential, ex, account_credential=DEFAULT_CREDENTIAL):
+		"""
+		Auth failed method evicts a pooled credential twitter no longer authenticates and returns whether the request
+		can be sent again with another one
+		"""
+		return account_credential == DEFAULT_CREDENTIAL and self.credentials.evict(credential, ex)
+
+	def pick_api(self, api, credential, endpoint):
+		"""
+		Pick api returns the (api, credential) a request to the endpoint is sent with. The accounts without an oauth
+		token of their own are served by the least loaded credential of the pool that serves the endpoint
+		"""
+		if credential != DEFAULT_CREDENTIAL:
+			return api, credential
+		key, pooled_api = self.credentials.choose(endpoint)
+		return pooled_api, key
+
+	def service_api(self, service):
+		"""
+		Service api returns the tweepy API of the account's own oauth token or the default one of config.py
+		"""
+		# if there is a new pair of oath_token/secret obtained from the organisation let us use that as well
+		if service['_source']['twitter_oauth_token'] and service['_source']['twitter_oauth_secret']:
+			logger.info(
+				'Twitter Account has its own oauth_key and oauth_secret... switching to those credentials to'
+				' perform the requests'
+			)
+			return self.twitter_apis.get(
+				service['_source']['twitter_oauth_token'], service['_source']['twitter_oauth_secret']
+			)
+		# otherwise restore the original twitter api object
+		logger.info('Twitter Account hasn\'t provided any oauth_key and oauth_secret...')
+		return self.default_api
+
+	def since_ids(self, screen_name):
+		"""
+		Since ids returns the redis watermark of every stream of the engine, read in a single round trip. Every
+		stream is rebuilt from elasticsearch when watermark_rebuild is set, the stored watermarks are dropped first
+		since a watermark only ever moves forward
+		"""
+		if self.config.get("watermark_rebuild"):
+			self.watermarks.reset(screen_name, self.streams)
+			return {}
+		return self.watermarks.get_many(screen_name, self.streams)
+
+	def resumed_cursors(self, screen_name):
+		"""
+		Resumed cursors returns the cursor of every stream of the engine whose pagination was interrupted, none when
+		watermark_rebuild is set
+		"""
+		if self.config.get("watermark_rebuild"):
+			return {}
+		return self.cursors.get_many(screen_name, self.streams)
+
+	def iter_tweet_pages(self, twitter_api, screen_name, since_id, credential=DEFAULT_CREDENTIAL, cursor=None):
+		"""
+		Iter tweet pages uses twitter api to retrieve newer tweets from known services via screen_name and yields
+		them one page (up to 200 tweets) at a time as soon as every page is received, with the (since_id, max_id)
+		position of the pagination after the page. An interrupted pagination resumes at its cursor. Every request is
+		paced by the rate budget of the credential
+		"""
+		try:
+			logger.info('Fetching tweets for ' + screen_name)
+			total = 0
+			max_id = None
+			if cursor is not None:
+				since_id, max_id = cursor['since_id'], cursor['max_id']
+				logger.info(
+					'Resuming the interrupted pagination of [' + screen_name + '] below ' + str(max_id + 1) + ' after ' +
+					str(cursor['pages']) + ' pages'
+				)
+			elif since_id is not None:
+				logger.info('Latest tweet from the redis watermark is ' + str(since_id))
+			else:
+				# cold miss or forced rebuild, elasticsearch is the source of truth
+				logger.info(
+					"Performing a search request on elasticsearch to bring the total amount of tweets we have so far for " +
+					screen_name)
+				search_path = self.elastic_endpoint + self.index_name + '/_count'
+				query = qr_number_of_tweets(screen_name.lower())
+				resp = self.elastic_http.get(search_path, json=query).json()
+				if resp['count'] != 0:
+					logger.info('Existing tweets found within elasticsearch [' + str(resp['count']) + ']')
+					search_path = self.elastic_endpoint + self.index_name + '/_search'
+					query = qr_latest_tweet(screen_name.lower())
+					get_latest_tweets = self.elastic_http.get(search_path, json=query).json()
+					since_id = get_latest_tweets['hits']['hits'][0]['_source']['id']
+					logger.info('Latest tweet is ' + str(since_id))
+					self.watermarks.advance(screen_name, TIMELINE, since_id)
+				else:
+					logger.info('No tweets found within elasticsearch')
+			while True:
+				request_api, request_credential = self.pick_api(twitter_api, credential, TIMELINE_ENDPOINT)
+				try:
+					# -----------------------------------------------------------------------
+					# query the user timeline.
+					# twitter API docs:
+					# https://dev.twitter.com/rest/reference/get/statuses/user_timeline
+					# -----------------------------------------------------------------------
+					self.rate_budget.pace(request_credential, TIMELINE_ENDPOINT)
+					with STAGE_SECONDS.labels('twitter_timeline').time():
+						new_tweets = request_api.user_timeline(
+							screen_name=screen_name, since_id=since_id, max_id=max_id, count=200
+						)
+					self.rate_budget.record(request_credential, TIMELINE_ENDPOINT, request_api.last_response)
+					TWEETS_FETCHED.labels(TIMELINE, screen_name.lower()).inc(len(new_tweets))
+					if len(new_tweets) != 0:
+						max_id = new_tweets[-1].id - 1
+						total += len(new_tweets)
+						logger.info("Total obtained tweets for [" + screen_name + "]:" + str(total))
+						yield new_tweets, (since_id, max_id)
+
+					if len(new_tweets) == 0 or len(new_tweets) < self.tweet_count:
+						logger.info("No new tweets for [" + screen_name + "]. Exiting while loop")
+						break
+
+				except tweepy.RateLimitError:
+					self.rate_limited(request_api, request_credential, TIMELINE_ENDPOINT, credential)
+				except tweepy.TweepError as ex:
+					if not self.auth_failed(request_credential, ex, credential):
+						raise
+			logger.info("Data acquisition is now completed for [" + screen_name + "]. Exiting fetch tweets method")
+		except Exception as ex:
+			logger.error('Exception:' + str(ex))
+			raise ex
+
+	def lookup_users(self, screen_names, api=None, credential=DEFAULT_CREDENTIAL):
+		"""
+		Lookup users returns the users of up to 100 screen names, sent with the account's own credential or the least
+		loaded credential of the pool and paced by its rate budget
+		"""
+		while True:
+			request_api, request_credential = self.pick_api(api or self.default_api, credential, LOOKUP_USERS_ENDPOINT)
+			try:
+				self.rate_budget.pace(request_credential, LOOKUP_USERS_ENDPOINT)
+				with STAGE_SECONDS.labels('twitter_lookup_users').time():
+					users = request_api.lookup_users(screen_names=screen_names)
+				self.rate_budget.record(request_credential, LOOKUP_USERS_ENDPOINT, request_api.last_response)
+				return users
+			except tweepy.RateLimitError:
+				self.rate_limited(request_api, request_credential, LOOKUP_USERS_ENDPOINT, credential)
+			except tweepy.TweepError as ex:
+				if not self.auth_failed(request_credential, ex, credential):
+					raise
+
+	def user_id(self, api, screen_name, credential=DEFAULT_CREDENTIAL):
+		"""
+		User id method returns the twitter user id of the screen name from the user id cache, from twitter or, when
+		neither resolves it, from a stored tweet of the account. None when the account has no stored tweets
+		"""
+		user_id = self.identities.resolve(
+			lambda screen_names: self.lookup_users(screen_names, api, credential), [screen_name]
+		).get(screen_name.lower())
+		if user_id is None:
+			# neither the redis cache nor twitter resolved the screen name, fall back to the stored tweets
+			logger.info("Performing a search request on elasticsearch to bring a random tweet for [" + screen_name + "]")
+			search_path = self.elastic_endpoint + self.index_name + '/_search'
+			query = qr_random_tweet(screen_name.lower())
+			get_random_tweet = self.elastic_http.get(search_path, json=query).json()
+			if get_random_tweet['hits']['total']['value'] != 0:
+				# Obtain user if from this random tweet
+				user_id = get_random_tweet['hits']['hits'][0]['_source']['user']['id']
+				self.identities.set_many({screen_name: user_id})
+		return user_id
+
+	def iter_reply_pages(self, api, screen_name, since_id, credential=DEFAULT_CREDENTIAL, user_id=None, cursor=None):
+		"""
+		Iter reply pages fetches Replies from Twitter per tweet and yields them one search page at a time as soon as
+		every page is received, with the (since_id, max_id) position of the pagination after the page. An interrupted
+		pagination resumes at its cursor. Every request is paced by the rate budget of the credential
+		"""
+		logger.info("Fetching Replies initialization")
+		if user_id is None:
+			user_id = self.user_id(api, screen_name, credential)
+
+		if user_id is None:
+			logger.warn("There are no existing tweets for [" + screen_name + ". Aborting operation for this account")
+			return
+
+		logger.info("Twitter user id for [" + screen_name + "] is --> " + str(user_id))
+		logger.info("Fetching tweet replies")
+
+		# Initialisation of variables
+		total = 0
+		max_id = None
+
+		if cursor is not None:
+			since_id, max_id = cursor['since_id'], cursor['max_id']
+			logger.info(
+				'Resuming the interrupted reply/mention pagination of [' + screen_name + '] below ' + str(max_id + 1) +
+				' after ' + str(cursor['pages']) + ' pages'
+			)
+		elif since_id is not None:
+			logger.info('Latest reply/mention tweet from the redis watermark is ' + str(since_id))
+		else:
+			# cold miss or forced rebuild, elasticsearch is the source of truth
+			# Performing a search request on elasticsearch to bring the total amount of replies/mentions we have so far
+			logger.info(
+				"Performing a search request on elasticsearch to bring the total amount of replies/mentions we have so far for " +
+				screen_name)
+			search_path = self.elastic_endpoint + self.index_name + '/_search'
+			query = qr_latest_reply_tweet(user_id)
+			resp = self.elastic_http.get(search_path, json=query).json()
+
+			if resp['hits']['total']['value'] != 0:
+				logger.info('Existing replies/mentions found within elasticsearch [' + str(resp['hits']['total']['value']) +']')
+				since_id = resp['hits']['hits'][0]['_id']
+				logger.info('Latest reply/mention tweet is ' + str(since_id))
+				self.watermarks.advance(screen_name, REPLIES, since_id)
+			else:
+				logger.info('No reply/mention tweets found within elasticsearch')
+
+		logger.info("Initializing procedure of fetching latest tweet replies/mentions of user [" + screen_name +"]")
+
+		q = "to:%s" % screen_name
+
+		while True:
+			request_api, request_credential = self.pick_api(api, credential, SEARCH_ENDPOINT)
+			try:
+				# -----------------------------------------------------------------------
+				# Using the Twitter Search API we will search for all replies addressed to a twitter user account.
+				# This search will result to 1. Replies of a user's tweets and 2. Any other tweets in which this
+				# user was mentioned(!)
+				# 1. We will use this to track all replies to a tweet
+				# 2. Analyze any mentions of a twitter user
+				# Twitter API docs:
+				# https://developer.twitter.com/en/docs/tweets/search/api-reference/get-search-tweets
+				# -----------------------------------------------------------------------
+				self.rate_budget.pace(request_credential, SEARCH_ENDPOINT)
+				with STAGE_SECONDS.labels('twitter_search').time():
+					new_replies = request_api.search(q=q, count=self.tweet_count, max_id=max_id, since_id=since_id)
+				self.rate_budget.record(request_credential, SEARCH_ENDPOINT, request_api.last_response)
+				TWEETS_FETCHED.labels(REPLIES, screen_name.lower()).inc(len(new_replies))
+				if len(new_replies) == 0:
+					logger.info(
+						"No new reply/mention tweets for [" + screen_name +
+						"]. Exiting while loop")
+					break
+				max_id = new_replies[-1].id - 1
+				total += len(new_replies)
+				logger.info("Total obtained replies/mentions for [" + screen_name + "]:" + str(total))
+				yield new_replies, (since_id, max_id)
+			except tweepy.RateLimitError:
+				self.rate_limited(request_api, request_credential, SEARCH_ENDPOINT, credential)
+			except tweepy.TweepError as ex:
+				if not self.auth_failed(request_credential, ex, credential):
+					raise
+		logger.info("Data acquisition is now completed for [" + screen_name + "]. Exiting fetch tweets method")
+
+	def iter_pages(self, api, screen_name, credential=DEFAULT_CREDENTIAL, cursors=None):
+		"""
+		Iter pages yields the (stream, page, position) of every stream of the engine, one stream after the other.
+		The user id of the replies search is taken from the account's own tweets when the timeline returned any
+		"""
+		since_ids = self.since_ids(screen_name)
+		cursors = cursors or {}
+		user_id = None
+		for stream in self.streams:
+			if stream == TIMELINE:
+				for tweets, position in self.iter_tweet_pages(
+					api, screen_name, since_ids.get(TIMELINE), credential, cursors.get(TIMELINE)
+				):
+					if user_id is None:
+						user_id = tweets[0].user.id
+					yield stream, tweets, position
+			elif stream == REPLIES:
+				for replies, position in self.iter_reply_pages(
+					api, screen_name, since_ids.get(REPLIES), credential, user_id, cursors.get(REPLIES)
+				):
+					yield stream, replies, position
+
+	def save_page(self, screen_name, stream, tweets, totals):
+		"""
+		Save page method writes a page of tweets to elastic and forwards it to the semantic pre-processing. Every
+		tweet is encoded once and the same bytes feed both requests. Tweets that were already written are dropped
+		first when dedup is enabled. The bulk summary and the newest fetched tweet id are added to the totals of the
+		stream. An IOError is raised when elastic did not take every tweet of the page, so that the watermark of the
+		stream stays where it was and the page is fetched again
+		"""
+		logger.info("Tweets of the " + stream + " of [" + screen_name + "] to be saved [" + str(len(tweets)) + "]")
+		stream_totals = totals[stream]
+		stream_totals['newest_id'] = max([stream_totals['newest_id'] or 0] + [tw.id for tw in tweets])
+		if self.seen_ids is not None:
+			seen = self.seen_ids.seen(tw.id_str for tw in tweets)
+			if seen:
+				logger.info("Dropping [" + str(len(seen)) + "] tweets that were already saved")
+				tweets = [tw for tw in tweets if tw.id_str not in seen]
+				stream_totals['duplicates'] = stream_totals.get('duplicates', 0) + len(seen)
+				TWEETS_DUPLICATE.labels(stream).inc(len(seen))
+			if not tweets:
+				return
+		if self.parents is not None and stream in (REPLIES, PARENTS):
+			# parents that are replies themselves are resolved on the next round of resolve_parents
+			self.parents.collect(tweets)
+		if self.projector is not None:
+			documents = self.projector.encode(tweets)
+			self.save_profiles(tweets)
+		else:
+			documents = list(encode_statuses(tweets, self.json_dumps))
+		if self.spool is not None:
+			# once spooled the tweets are as good as written, the spool drainers deliver them to the sinks
+			summary = {'indexed': self.spool.append(documents), 'created': 0, 'failed': 0}
+			logger.info("Spooled [" + str(summary['indexed']) + "] tweets of [" + screen_name + "]")
+		else:
+			summary = self.bulk_sink.save_documents(documents)
+			TWEETS_INDEXED.labels(stream, screen_name.lower()).inc(summary['indexed'])
+			logger.info("Bulk save summary for [" + screen_name + "]: " + json.dumps(summary))
+		for key in summary:
+			stream_totals[key] += summary[key]
+		if summary['failed']:
+			raise IOError(
+				str(summary['failed']) + ' tweets of the ' + stream + ' of [' + screen_name + '] were not written to ' +
+				'elastic'
+			)
+		if self.seen_ids is not None:
+			self.seen_ids.add(document[0] for document in documents)
+
+		if self.spool is not None:
+			return
+		if self.semantic_batcher is not None:
+			# tweets of every account are grouped into bounded LinkedPipes executions, see sct_twitter.semantic
+			self.semantic_batcher.add(documents)
+		else:
+			logger.info("Semantic Transformation is disabled")
+
+	def save_cursor_page(self, screen_name, page, totals):
+		"""
+		Save cursor page method saves a (stream, page, position) page and then the cursor of its stream, so that an
+		interrupted pagination resumes after the last written page. The cursor is only saved while every page of the
+		stream was written, a resumed pagination would otherwise skip the pages that were not
+		"""
+		stream, tweets, position = page
+		self.save_page(screen_name, stream, tweets, totals)
+		totals[stream]['pages'] += 1
+		if totals[stream]['failed']:
+			return
+		self.cursors.save(screen_name, stream, {
+			'since_id': position[0], 'max_id': position[1], 'newest_id': totals[stream]['newest_id'],
+			'pages': totals[stream]['pages']
+		})
+
+	def save_profiles(self, tweets):
+		"""
+		Save profiles method upserts the projected profiles of the authors of a page into the user index, or into the
+		user spool when the spool is enabled. Only the profiles that changed since they were last stored are written
+		"""
+		changed = self.user_profiles.changed(self.projector.profiles(tweets))
+		if not changed:
+			return
+		if self.user_spool is not None:
+			self.user_spool.append((user_id, document) for user_id, document, digest in changed)
+			self.user_profiles.remember(changed)
+			return
+		summary = self.user_sink.save_documents((user_id, document) for user_id, document, digest in changed)
+		logger.info("User profile save summary: " + json.dumps(summary))
+		if summary['failed'] == 0:
+			self.user_profiles.remember(changed)
+
+	def lookup_statuses(self, ids, stream=PARENTS, account='reply parents'):
+		"""
+		Lookup statuses returns the statuses of up to 100 tweet ids that twitter still serves, sent with the least
+		loaded credential of the pool and paced by its rate budget
+		"""
+		while True:
+			api, credential = self.pick_api(self.default_api, DEFAULT_CREDENTIAL, LOOKUP_STATUSES_ENDPOINT)
+			try:
+				self.rate_budget.pace(credential, LOOKUP_STATUSES_ENDPOINT)
+				with STAGE_SECONDS.labels('twitter_statuses_lookup').time():
+					statuses = api.statuses_lookup(id_=ids)
+				self.rate_budget.record(credential, LOOKUP_STATUSES_ENDPOINT, api.last_response)
+				TWEETS_FETCHED.labels(stream, account).inc(len(statuses))
+				return statuses
+			except tweepy.RateLimitError:
+				self.rate_limited(api, credential, LOOKUP_STATUSES_ENDPOINT)
+			except tweepy.TweepError as ex:
+				if not self.auth_failed(credential, ex):
+					raise
+
+	def resolve_parents(self):
+		"""
+		Resolve parents method fetches and saves the parents of the replies saved in the cycle that are missing from
+		elastic, 100 per statuses/lookup call, so that the conversation threads are complete. Parents that are replies
+		themselves are resolved up to parents_max_depth levels up the thread
+		"""
+		totals = {PARENTS: {'indexed': 0, 'created': 0, 'failed': 0, 'newest_id': None}}
+		for depth in range(self.config.get("parents_max_depth", 3)):
+			statuses = self.parents.resolve(self.lookup_statuses)
+			if not statuses:
+				break
+			try:
+				self.save_page('reply parents', PARENTS, statuses, totals)
+			except IOError as ex:
+				logger.error('Saving the parent tweets failed: ' + str(ex))
+				break
+		if totals[PARENTS]['newest_id'] is not None:
+			logger.info("Parent tweet insertion is now completed: " + json.dumps(totals))
+
+	def refresh_engagement(self):
+		"""
+		Refresh engagement method updates the engagement counters of the stored tweets of the age windows that are
+		due, see sct_twitter.engagement
+		"""
+		counts = self.engagement.refresh(lambda ids: self.lookup_statuses(ids, ENGAGEMENT, 'engagement refresh'))
+		if counts['checked']:
+			logger.info("Engagement refresh is now completed: " + json.dumps(counts))
+
+	def deliver_elastic(self, documents):
+		"""
+		Deliver elastic method writes spooled tweets to elastic and returns whether none is left to be written again
+		"""
+		summary, pending = self.bulk_sink.save_pending(documents)
+		logger.info("Bulk save summary of spooled tweets: " + json.dumps(summary))
+		return not pending
+
+	def deliver_profiles(self, documents):
+		"""
+		Deliver profiles method writes spooled user profiles to the user index and returns whether none is left to be
+		written again
+		"""
+		summary, pending = self.user_sink.save_pending(documents)
+		logger.info("User profile save summary of spooled profiles: " + json.dumps(summary))
+		return not pending
+
+	def deliver_semantic(self, documents):
+		"""
+		Deliver semantic method submits spooled tweets as a single LinkedPipes execution and returns whether the spool
+		can move past them. A batch that Linked Pipes rejects as a client error is dropped, sending it again would
+		only be rejected again, while server and connection errors leave it in the spool to be retried
+		"""
+		with STAGE_SECONDS.labels('linkedpipes_submit').time():
+			response = submit_semantic(
+				self.config["path"], self.config["pipeline"], json_array(documents),
+				self.http_clients.session(LINKED_PIPES)
+			)
+		if response.status_code >= 300:
+			logger.error('Linked Pipes responded ' + str(response.status_code) + ': ' + response.text)
+			LINKED_PIPES_ERRORS.labels('status').inc()
+			if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUSES:
+				logger.error('Dropping ' + str(len(documents)) + ' spooled tweets that Linked Pipes rejected')
+				LINKED_PIPES_ERRORS.labels('dropped').inc()
+				return True
+			return False
+		logger.info('Linked Pipes execution submitted for ' + str(len(documents)) + ' spooled tweets')
+		SEMANTIC_TWEETS.labels().inc(len(documents))
+		return True
+
+	def next_service(self):
+		"""
+		Next service returns the next queued service, claiming a new batch from the leased work queue when the
+		claimed ones are used up, or returns None once the list is drained. With the scheduler enabled the due
+		accounts of the schedule are claimed instead
+		"""
+		if self.stopping.is_set():
+			return None
+		if self.scheduler is not None:
+			if not self.claimed:
+				self.claimed.extend(self.scheduler.claim(self.queue.batch_size))
+			return self.claimed.popleft() if self.claimed else None
+		if not self.claimed:
+			self.claimed.extend(self.queue.claim(wait=self.queue_wait))
+			if not self.claimed:
+				return None
+		item = self.claimed.popleft()
+		service = json.loads(item.decode('utf-8'))
+		with self.lock:
+			self.leased[id(service)] = item
+		return service
+
+	def handle_queued_service(self, service):
+		"""
+		Handle queued service method handles a claimed service and acknowledges it once every page is written. A
+		service that fails, or whose tweets the sinks did not all take, is left in flight and goes back to the list
+		when the lease of this process expires. Scheduled accounts are given their next poll time from the number of
+		new tweets instead, an account that fails becomes due again once the claim of the scheduler expires
+		"""
+		result = 'failed'
+		try:
+			if self.scheduler is not None:
+				totals = self.handle_service(service)
+				self.check_written(service, totals)
+				if totals is not None:
+					new_tweets = sum(totals[stream]['indexed'] for stream in self.streams)
+					interval = self.scheduler.record(service['_source']['twitter_screen_name'], new_tweets)
+					logger.info('Next poll in ' + str(int(interval)) + 'sec')
+			else:
+				with self.lock:
+					item = self.leased.pop(id(service))
+				# an item that is not acknowledged stays in flight and is reclaimed once its lease expires
+				self.check_written(service, self.handle_service(service))
+				self.queue.ack(item)
+			result = 'ok'
+		finally:
+			ACCOUNTS_HANDLED.labels(result).inc()
+
+	def check_written(self, service, totals):
+		"""
+		Check written method raises an IOError when the sinks left failed or pending tweets in the totals of a service
+		"""
+		if totals is None:
+			return
+		failed = sum(totals[stream]['failed'] for stream in self.streams)
+		if failed:
+			raise IOError(
+				str(failed) + ' tweets of [' + service['_source']['twitter_screen_name'] + '] were not written'
+			)
+
+	def schedule_queued_services(self):
+		"""
+		Schedule queued services method moves every service of the redis list into the schedule, acknowledging
+		them once they are registered
+		"""
+		registered = 0
+		while True:
+			items = self.queue.claim(count=500)
+			if not items:
+				break
+			registered += self.scheduler.register([json.loads(item.decode('utf-8')) for item in items])
+			for item in items:
+				self.queue.ack(item)
+		logger.info('Scheduled ' + str(registered) + ' queued service(s)')
+
+	def handle_service(self, service):
+		"""
+		Handle service method fetches and saves the new tweets of every stream of a single queued service and
+		returns the totals of every stream, None without a screen name. It runs on the worker threads of the
+		account worker pool, under the profiler when the account is profiled
+		"""
+		screen_name = service['_source']['twitter_screen_name']
+		if self.profiler is not None and screen_name is not None and self.profiler.wants(screen_name):
+			return self.profiler.run(screen_name, self.fetch_service, service)
+		return self.fetch_service(service)
+
+	def fetch_service(self, service):
+		"""
+		Fetch service method is the fetch and save cycle of handle_service
+		"""
+		logger.info("==================================================================================================")
+		logger.info(service)
+		api = self.service_api(service)
+
+		# -----------------------------------------------------------------------
+		# from this point and on we need to scan and retrieve all tweets from twitter API
+		# -----------------------------------------------------------------------
+		screen_name = service['_source']['twitter_screen_name']
+		logger.info('Organisation Name: ' + str(service['_source'].get('organisation_name')))
+
+		if screen_name is not None:
+			logger.info('Twitter User Id : ' + screen_name)
+			# pages are written while the next ones are fetched, see sct_twitter.pipeline
+			cursors = self.resumed_cursors(screen_name)
+			totals = {}
+			for stream in self.streams:
+				totals[stream] = {'indexed': 0, 'created': 0, 'failed': 0, 'newest_id': None, 'pages': 0}
+				if stream in cursors:
+					# the newest tweet of the interrupted pagination is where its watermark moves once it is over
+					totals[stream]['newest_id'] = cursors[stream]['newest_id']
+					totals[stream]['pages'] = cursors[stream]['pages']
+			run_pipeline(
+				self.iter_pages(api, screen_name, service_credential(service), cursors),
+				lambda page: self.save_cursor_page(screen_name, page, totals),
+				self.config.get("pipeline_max_pending_pages", 2), self.profiler.follow if self.profiler is not None else None
+			)
+			# pages arrive newest first, a watermark only moves once every page down to since_id is written
+			for stream in self.streams:
+				if totals[stream]['newest_id'] is not None and totals[stream]['failed'] == 0:
+					self.watermarks.advance(screen_name, stream, totals[stream]['newest_id'])
+			self.cursors.clear(screen_name, self.streams)
+			logger.info("Data insertion is now completed for [" + screen_name + "]: " + json.dumps(totals))
+		else:
+			totals = None
+			logger.warn('There is no screen_name available')
+		logger.info("==================================================================================================")
+		return totals
+
+	def delay(self, service):
+		"""
+		Delay returns how many seconds the account has to wait for the budget of every endpoint it is fetched from
+		"""
+		credential = service_credential(service)
+		if credential == DEFAULT_CREDENTIAL:
+			return max(self.credentials.wait_time(STREAM_ENDPOINTS[stream]) for stream in self.streams)
+		return max(self.rate_budget.wait_time(credential, STREAM_ENDPOINTS[stream]) for stream in self.streams)
+
+	def capacity(self, credential):
+		"""
+		Capacity returns how many accounts of the credential may be in flight at once, one per pooled credential for
+		the accounts without an oauth token of their own
+		"""
+		return self.credentials.size() if credential == DEFAULT_CREDENTIAL else 1
+
+	def open(self):
+		"""
+		Opens the leased work queue of the services list and starts the spool drainers and the configured metrics
+		exporters
+		"""
+		self.queue = LeasedWorkQueue(
+			self.redis_client, self.config["redis_twitter_services_list"], lease=self.config.get("queue_lease", 900),
+			batch_size=self.config.get("queue_claim_batch", self.config.get("worker_count", 1))
+		)
+		if self.spool is not None:
+			backoff = self.config.get("spool_retry_backoff", 5)
+			max_backoff = self.config.get("spool_max_backoff", 300)
+			self.spool_drainers.append(SpoolDrainer(
+				self.spool, ELASTIC, self.deliver_elastic, self.config.get("spool_drain_max_docs", 1000),
+				self.config.get("spool_drain_max_bytes", 8388608), backoff, max_backoff
+			))
+			if LINKED_PIPES in self.spool.offsets:
+				self.spool_drainers.append(SpoolDrainer(
+					self.spool, LINKED_PIPES, self.deliver_semantic, self.config.get("semantic_batch_max_items", 1000),
+					self.config.get("semantic_batch_max_bytes", 8388608), backoff, max_backoff
+				))
+			if self.user_spool is not None:
+				self.spool_drainers.append(SpoolDrainer(
+					self.user_spool, ELASTIC, self.deliver_profiles, self.config.get("spool_drain_max_docs", 1000),
+					self.config.get("spool_drain_max_bytes", 8388608), backoff, max_backoff
+				))
+		if self.config.get("metrics_port"):
+			self.metrics_server = start_http_exporter(self.config["metrics_port"])
+		if self.config.get("metrics_textfile"):
+			self.metrics_textfile = TextfileExporter(
+				self.config["metrics_textfile"], self.config.get("metrics_textfile_interval", 15)
+			)
+
+	def close(self):
+		"""
+		Closes the work queue and waits for every semantic batch to be submitted and, for up to spool_drain_timeout
+		seconds, for the spool to be drained
+		"""
+		self.queue.close()
+		if self.semantic_batcher is not None:
+			self.semantic_batcher.close()
+		for drainer in self.spool_drainers:
+			drainer.close(self.config.get("spool_drain_timeout", 600))
+		if self.spool is not None:
+			self.spool.close()
+		if self.user_spool is not None:
+			self.user_spool.close()
+		if self.seen_ids is not None:
+			logger.info('Seen tweet ids: ' + json.dumps(self.seen_ids.stats()))
+		if self.projector is not None:
+			logger.info('Tweet projection: ' + json.dumps(self.projector.summary()))
+		if self.parents is not None:
+			logger.info('Parent tweets: ' + json.dumps(self.parents.summary()))
+		self.http_clients.close()
+		if self.metrics_textfile is not None:
+			self.metrics_textfile.close()
+		if self.metrics_server is not None:
+			self.metrics_server.shutdown()
+			self.metrics_server.server_close()
+
+	def run_cycle(self, wait=0):
+		"""
+		Run cycle handles every queued (or, with the scheduler, every due) service on the account worker pool and
+		returns once the queue is drained. When the list is empty an idle worker waits up to wait seconds for new
+		services
+		"""
+		if self.scheduler is not None:
+			self.schedule_queued_services()
+		if REPLIES in self.streams:
+			# resolve the user ids of every queued account at once, up to 100 screen names per twitter call
+			if self.scheduler is not None:
+				queued_services = self.scheduler.accounts()
+			else:
+				queued_services = [
+					json.loads(item.decode('utf-8'))
+					for item in self.redis_client.lrange(self.config["redis_twitter_services_list"], 0, -1)
+				]
+			self.identities.resolve(
+				self.lookup_users, [queued['_source']['twitter_screen_name'] for queued in queued_services]
+			)
+
+		# -----------------------------------------------------------------------
+		# every queued service is handled by the account worker pool, see sct_twitter.workers
+		# -----------------------------------------------------------------------
+		worker_count = self.config.get("worker_count", 1)
+		logger.info('Starting ' + str(worker_count) + ' account worker(s) for the ' + ', '.join(self.streams))
+		self.queue_wait = wait
+		# accounts whose credential has no budget left are passed over for those that have some
+		self.pool = AccountWorkerPool(
+			worker_count, self.handle_queued_service, delay=self.delay, capacity=self.capacity
+		)
+		self.pool.run(self.next_service)
+		if self.parents is not None and not self.stopping.is_set():
+			# the missing parents of every account are looked up together once the accounts are handled
+			self.resolve_parents()
+		if self.engagement is not None and not self.stopping.is_set():
+			self.refresh_engagement()
+
+	def run(self):
+		"""
+		Run drains the services list once and returns when every semantic batch has been submitted
+		"""
+		self.open()
+		self.run_cycle(self.config.get("queue_wait", 0))
+		self.close()
+
+	def serve(self):
+		"""
+		Serve keeps the engine resident: the services list is drained, then the engine sleeps for
+		daemon_poll_interval seconds, or until a message is published on daemon_notify_channel or the next scheduled
+		account is due, and drains it again. The redis, twitter and http clients and their caches stay warm between
+		cycles. A cycle that fails is logged and the next one starts after a backoff that doubles up to
+		daemon_max_backoff seconds. On SIGTERM or SIGINT no new account is started, the accounts in flight are completed
+		and every account that was claimed but not handled goes back on the list
+		"""
+		signal.signal(signal.SIGTERM, self.stop)
+		signal.signal(signal.SIGINT, self.stop)
+		self.open()
+		pubsub = None
+		channel = self.config.get("daemon_notify_channel")
+		if channel:
+			pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+			pubsub.subscribe(channel)
+		interval = self.config.get("daemon_poll_interval", 300)
+		backoff = self.config.get("daemon_error_backoff", 5)
+		max_backoff = self.config.get("daemon_max_backoff", 300)
+		delay = 0
+		while not self.stopping.is_set():
+			try:
+				self.run_cycle()
+				# failed accounts and the ones claimed before a stop are handled on the next cycle or by another container
+				self.claimed.clear()
+				with self.lock:
+					self.leased.clear()
+				self.queue.release(self.queue.in_flight_items())
+				if self.stopping.is_set():
+					break
+				delay = 0
+				sleep_interval = interval
+				if self.scheduler is not None and self.scheduler.next_due() is not None:
+					sleep_interval = min(sleep_interval, self.scheduler.next_due())
+				logger.info('Cycle completed, next cycle in up to ' + str(int(sleep_interval)) + 'sec')
+				self.wait_for_services(pubsub, sleep_interval)
+			except Exception:
+				# a redis, elastic or twitter outage fails the cycle, not the daemon: the accounts it claimed go back
+				# on the list once the lease of this process expires
+				self.claimed.clear()
+				with self.lock:
+					self.leased.clear()
+				delay = min(max(backoff, delay * 2), max_backoff)
+				logger.exception('Cycle failed, next cycle in ' + str(delay) + 'sec')
+				self.stopping.wait(delay)
+		if pubsub is not None:
+			pubsub.close()
+		self.close()
+		logger.info('Twitter engine stopped')
+
+	def wait_for_services(self, pubsub, timeout):
+		"""
+		Waits up to timeout seconds, returning early on a notification of new services or a stop
+		"""
+		deadline = time.time() + timeout
+		while not self.stopping.is_set() and time.time() < deadline:
+			if pubsub is None:
+				self.stopping.wait(min(1.0, deadline - time.time()))
+			elif pubsub.get_message(timeout=min(1.0, max(0, deadline - time.time()))):
+				logger.info('New services were announced')
+				return
+
+	def stop(self, signum=None, frame=None):
+		"""
+		Stop method asks a serving engine to shut down gracefully. It is the SIGTERM/SIGINT handler of serve
+		"""
+		logger.info('Stopping the twitter engine, waiting for the accounts in flight')
+		self.stopping.set()
+		if self.pool is not None:
+			self.pool.stop()
@@ -0,0 +1,73 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# identity
+#  - screen_name to twitter user id cache kept in redis.
+# -----------------------------------------------------------------------
+
+import logging
+import tweepy
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# users/lookup accepts up to 100 screen names per call
+LOOKUP_BATCH_SIZE = 100
+
+
+class UserIdCache(object):
+	"""
+	User id cache maps lower cased screen names to twitter user ids with a redis key per screen name that expires
+	after ttl seconds. Misses are resolved in batches through the twitter users/lookup endpoint
+	"""
+
+	def __init__(self, redis_client, ttl=604800, prefix='sct:user_id'):
+		self.redis_client = redis_client
+		self.ttl = ttl
+		self.prefix = prefix
+
+	def _key(self, screen_name):
+		return self.prefix + ':' + screen_name.lower()
+
+	def set_many(self, user_ids):
+		"""
+		Caches a dict of screen name to user id
+		"""
+		pipeline = self.redis_client.pipeline(transaction=False)
+		for screen_name, user_id in user_ids.items():
+			pipeline.setex(self._key(screen_name), self.ttl, str(user_id))
+		pipeline.execute()
+
+	def resolve(self, lookup, screen_names):
+		"""
+		Resolve returns a dict of lower cased screen name to user id for all the given screen names that could be
+		resolved. Cached ids are read with a single MGET and the rest are looked up with lookup, a function that
+		returns the users of up to 100 screen names. Names twitter fails to resolve are left out so that the caller
+		can fall back to elasticsearch
+		"""
+		names = sorted(set(screen_name.lower() for screen_name in screen_names if screen_name))
+		if not names:
+			return {}
+		resolved = {}
+		missing = []
+		for screen_name, value in zip(names, self.redis_client.mget([self._key(name) for name in names])):
+			if value is not None:
+				resolved[screen_name] = int(value)
+			else:
+				missing.append(screen_name)
+
+		looked_up = {}
+		for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+			batch = missing[start:start + LOOKUP_BATCH_SIZE]
+			try:
+				users = lookup(batch)
+			except tweepy.TweepError as ex:
+				logger.warning('Twitter user lookup failed for ' + str(len(batch)) + ' screen names: ' + str(ex))
+				continue
+			for user in users:
+				looked_up[user.screen_name.lower()] = user.id
+		if looked_up:
+			logger.info('Resolved ' + str(len(looked_up)) + ' twitter user ids through users/lookup')
+			self.set_many(looked_up)
+			resolved.update(looked_up)
+		return resolved
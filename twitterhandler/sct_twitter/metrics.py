@@ -0,0 +1,262 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# metrics
+#  - in-process counters and latency histograms exposed in the prometheus text format.
+# -----------------------------------------------------------------------
+
+import os
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Latency buckets in seconds, from a cached redis read to a long linked pipes execution upload
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape(value):
+	return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+	pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+	if extra:
+		pairs.append('%s="%s"' % extra)
+	return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+	if value == float('inf'):
+		return '+Inf'
+	return repr(float(value))
+
+
+class _Metric(object):
+
+	def __init__(self, name, documentation, label_names=()):
+		self.name = name
+		self.documentation = documentation
+		self.label_names = tuple(label_names)
+		self.children = {}
+		self.lock = threading.Lock()
+		REGISTRY.append(self)
+
+	def labels(self, *values):
+		"""
+		Returns the child of the given label values, created on first use
+		"""
+		values = tuple(str(value) for value in values)
+		child = self.children.get(values)
+		if child is None:
+			with self.lock:
+				child = self.children.setdefault(values, self._child())
+		return child
+
+
+class _CounterChild(object):
+
+	def __init__(self, lock):
+		self.lock = lock
+		self.value = 0.0
+
+	def inc(self, amount=1):
+		with self.lock:
+			self.value += amount
+
+
+class Counter(_Metric):
+	"""
+	Counter is a monotonically increasing total, e.g. counter.labels('timeline', 'alice').inc(200)
+	"""
+
+	def _child(self):
+		return _CounterChild(self.lock)
+
+	def collect(self):
+		lines = ['# HELP ' + self.name + ' ' + self.documentation, '# TYPE ' + self.name + ' counter']
+		with self.lock:
+			for values, child in sorted(self.children.items()):
+				lines.append(self.name + _format_labels(self.label_names, values) + ' ' + _format_value(child.value))
+		return lines
+
+
+class _HistogramChild(object):
+
+	def __init__(self, lock, buckets):
+		self.lock = lock
+		self.buckets = buckets
+		self.counts = [0] * len(buckets)
+		self.count = 0
+		self.sum = 0.0
+
+	def observe(self, value):
+		index = bisect.bisect_left(self.buckets, value)
+		with self.lock:
+			if index < len(self.counts):
+				self.counts[index] += 1
+			self.count += 1
+			self.sum += value
+
+	def time(self):
+		return _Timer(self)
+
+
+class _Timer(object):
+
+	def __init__(self, child):
+		self.child = child
+		self.started = None
+
+	def __enter__(self):
+		self.started = time.time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.child.observe(time.time() - self.started)
+
+
+class Histogram(_Metric):
+	"""
+	Histogram counts observations (latencies in seconds) in cumulative buckets, e.g.
+	with histogram.labels('elastic_bulk').time(): ...
+	"""
+
+	def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+		self.buckets = tuple(buckets)
+		super(Histogram, self).__init__(name, documentation, label_names)
+
+	def _child(self):
+		return _HistogramChild(self.lock, self.buckets)
+
+	def collect(self):
+		lines = ['# HELP ' + self.name + ' ' + self.documentation, '# TYPE ' + self.name + ' histogram']
+		with self.lock:
+			for values, child in sorted(self.children.items()):
+				cumulative = 0
+				for bound, count in zip(self.buckets + (float('inf'),), child.counts + [child.count - sum(child.counts)]):
+					cumulative += count
+					lines.append(
+						self.name + '_bucket' + _format_labels(self.label_names, values, ('le', _format_value(bound))) +
+						' ' + str(cumulative)
+					)
+				labels = _format_labels(self.label_names, values)
+				lines.append(self.name + '_sum' + labels + ' ' + _format_value(child.sum))
+				lines.append(self.name + '_count' + labels + ' ' + str(child.count))
+		return lines
+
+
+# Every metric of the process, in the order they are defined
+REGISTRY = []
+
+
+def exposition():
+	"""
+	Exposition returns every metric of the process in the prometheus text format
+	"""
+	lines = []
+	for metric in REGISTRY:
+		lines.extend(metric.collect())
+	return '\n'.join(lines) + '\n'
+
+
+# -----------------------------------------------------------------------
+# HANDLER METRICS
+# -----------------------------------------------------------------------
+
+STAGE_SECONDS = Histogram(
+	'sct_stage_seconds', 'Seconds spent per request of every stage (twitter endpoints, elastic, linked pipes)', ['stage']
+)
+RATE_LIMIT_SLEEP_SECONDS = Counter(
+	'sct_rate_limit_sleep_seconds_total', 'Seconds spent asleep waiting for a twitter rate limit budget', ['endpoint']
+)
+TWEETS_FETCHED = Counter('sct_tweets_fetched_total', 'Tweets fetched from twitter', ['stream', 'account'])
+TWEETS_INDEXED = Counter('sct_tweets_indexed_total', 'Tweets indexed in elastic', ['stream', 'account'])
+TWEETS_DUPLICATE = Counter('sct_tweets_duplicate_total', 'Fetched tweets dropped as already written', ['stream'])
+ELASTIC_ERRORS = Counter('sct_elastic_errors_total', 'Failed elastic bulk requests and items', ['kind'])
+LINKED_PIPES_ERRORS = Counter('sct_linkedpipes_errors_total', 'Failed linked pipes submissions', ['kind'])
+SEMANTIC_TWEETS = Counter('sct_semantic_tweets_total', 'Tweets submitted to linked pipes', [])
+PROJECTION_BYTES = Counter(
+	'sct_projection_bytes_total', 'Bytes of the projected tweets as stored, and estimated bytes saved', ['kind']
+)
+SPOOL_DOCUMENTS = Counter(
+	'sct_spool_documents_total', 'Tweets appended to the spool and delivered from it per sink', ['kind']
+)
+PARENT_TWEETS = Counter(
+	'sct_parent_tweets_total', 'Parent tweet ids of replies found stored, known missing, fetched or missing', ['result']
+)
+ENGAGEMENT_TWEETS = Counter(
+	'sct_engagement_tweets_total', 'Stored tweets whose engagement counters were checked, changed or missing', ['result']
+)
+CREDENTIALS_EVICTED = Counter(
+	'sct_credentials_evicted_total', 'Pooled twitter credentials evicted after an authentication error', []
+)
+ACCOUNTS_HANDLED = Counter('sct_accounts_handled_total', 'Accounts handled by the worker pool', ['result'])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+	def do_GET(self):
+		body = exposition().encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+class _MetricsServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+def start_http_exporter(port, host=''):
+	"""
+	Start http exporter serves the metrics on http://host:port/ from a daemon thread and returns the server
+	"""
+	server = _MetricsServer((host, port), _MetricsHandler)
+	thread = threading.Thread(target=server.serve_forever, name='metrics-exporter')
+	thread.daemon = True
+	thread.start()
+	logger.info('Serving metrics on port ' + str(port))
+	return server
+
+
+class TextfileExporter(object):
+	"""
+	Textfile exporter writes the metrics every interval seconds, and once more on close, to a file for the node
+	exporter textfile collector. The file is replaced atomically so that it is never read half written
+	"""
+
+	def __init__(self, path, interval=15):
+		self.path = path
+		self.interval = interval
+		self.closed = threading.Event()
+		self.thread = threading.Thread(target=self._write_periodically, name='metrics-textfile')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def write(self):
+		temporary = self.path + '.' + str(os.getpid()) + '.tmp'
+		with open(temporary, 'w') as textfile:
+			textfile.write(exposition())
+		os.rename(temporary, self.path)
+
+	def close(self):
+		self.closed.set()
+		self.thread.join()
+		self.write()
+
+	def _write_periodically(self):
+		while not self.closed.wait(self.interval):
+			try:
+				self.write()
+			except Exception as ex:
+				logger.error('Writing the metrics textfile failed: ' + str(ex))
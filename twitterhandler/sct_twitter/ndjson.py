@@ -0,0 +1,124 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# ndjson
+#  - streaming encoder of elastic _bulk request bodies.
+# -----------------------------------------------------------------------
+
+import json
+import logging
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+
+def _json_dumps(obj):
+	return json.dumps(obj).encode('utf-8')
+
+
+def json_encoder(backend='auto'):
+	"""
+	Json encoder returns the function that turns a python object into json bytes. The orjson backend is used
+	when it is requested (or when backend is auto) and installed, otherwise the standard json module is used
+	"""
+	if backend in ('auto', 'orjson') and orjson is not None:
+		return orjson.dumps
+	if backend == 'orjson':
+		logger.warning('orjson is not installed, falling back to the json module')
+	return _json_dumps
+
+
+def bulk_action_line(id_str, action='index'):
+	"""
+	Bulk action line returns the index (or update) action that precedes every document of a bulk body e.g.
+	{"index":{"_id":"1"}}
+	"""
+	return b'{"' + action.encode('utf-8') + b'":{"_id":"' + id_str.encode('utf-8') + b'"}}\n'
+
+
+def encode_statuses(statuses, dumps=_json_dumps):
+	"""
+	Encode statuses lazily turns tweepy statuses into (id_str, json bytes) document pairs. Every status is
+	encoded exactly once and the same bytes can then be shared by the elastic and the semantic requests
+	"""
+	for status in statuses:
+		yield status.id_str, dumps(status._json)
+
+
+def json_array(documents):
+	"""
+	Json array joins already encoded documents into the bytes of a json array without decoding them again
+	"""
+	return b'[' + b','.join(document for id_str, document in documents) + b']'
+
+
+def iter_bulk_lines(statuses):
+	"""
+	Iter bulk lines yields the action and document lines of every status as bytes, one status at a time, so
+	that the bulk body never has to be concatenated into a single string
+	"""
+	for id_str, document in encode_statuses(statuses):
+		yield bulk_action_line(id_str) + document + b'\n'
+
+
+class BulkChunkWriter(object):
+	"""
+	Bulk chunk writer appends documents to a reusable byte buffer and hands out bounded chunks that can be used
+	as an HTTP body as they are. A chunk is closed as soon as the next document would exceed either max_docs or
+	max_bytes. A single document that is larger than max_bytes is emitted in a chunk of its own. Documents are
+	preceded by an index action, or by an update action when their json bytes are partial {"doc": ...} updates
+	"""
+
+	def __init__(self, max_docs=500, max_bytes=5242880, action='index'):
+		self.max_docs = max_docs
+		self.max_bytes = max_bytes
+		self.action = action
+		self.buffer = bytearray()
+		self.documents = []
+
+	def __len__(self):
+		return len(self.documents)
+
+	def fits(self, id_str, document):
+		"""
+		Fits returns whether the document can be appended without exceeding the chunk limits
+		"""
+		if not self.documents:
+			return True
+		size = len(self.buffer) + len(id_str) + len(document) + len(self.action) + 17
+		return len(self.documents) < self.max_docs and size <= self.max_bytes
+
+	def append(self, id_str, document):
+		self.buffer += bulk_action_line(id_str, self.action)
+		self.buffer += document
+		self.buffer += b'\n'
+		self.documents.append((id_str, document))
+
+	def flush(self):
+		"""
+		Flush returns the pending chunk as (body, documents) and empties the buffer for the next chunk
+		"""
+		body = bytes(self.buffer)
+		documents = self.documents
+		del self.buffer[:]
+		self.documents = []
+		return body, documents
+
+
+def iter_bulk_chunks(documents, max_docs=500, max_bytes=5242880, action='index'):
+	"""
+	Iter bulk chunks yields (body, documents) pairs of bounded _bulk bodies for an iterable of
+	(id_str, json bytes) documents
+	"""
+	writer = BulkChunkWriter(max_docs, max_bytes, action)
+	for id_str, document in documents:
+		if not writer.fits(id_str, document):
+			yield writer.flush()
+		writer.append(id_str, document)
+	if len(writer):
+		yield writer.flush()
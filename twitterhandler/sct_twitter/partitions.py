@@ -0,0 +1,81 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# partitions
+#  - tweet id range partitions and their resumable checkpoints kept in redis.
+# -----------------------------------------------------------------------
+
+import json
+
+# Position of a partition that has been read to its upper bound
+DONE = 'done'
+
+
+def split_id_range(lower, upper, count):
+	"""
+	Split id range returns up to count contiguous [lower, upper) ranges that cover [lower, upper). Tweet ids grow
+	with their creation time, so ranges of equal width cover equally long periods of time
+	"""
+	count = max(1, min(count, upper - lower))
+	width = (upper - lower) // count
+	bounds = [lower + width * number for number in range(count)] + [upper]
+	return [(bounds[number], bounds[number + 1]) for number in range(count)]
+
+
+class RangeCheckpoint(object):
+	"""
+	Range checkpoint keeps the id range partitions of a long running job and the last id handled in each of them in
+	a single redis hash, so that a restarted job carries on with the same partitions from where it stopped
+	"""
+
+	def __init__(self, redis_client, key):
+		self.redis_client = redis_client
+		self.key = key
+
+	def partitions(self):
+		"""
+		Returns the stored list of (lower, upper) partitions or None when the job has not been started
+		"""
+		value = self.redis_client.hget(self.key, 'partitions')
+		if value is None:
+			return None
+		return [tuple(partition) for partition in json.loads(value.decode('utf-8'))]
+
+	def start(self, partitions):
+		"""
+		Drops any previous progress and stores the partitions of a new job
+		"""
+		pipeline = self.redis_client.pipeline()
+		pipeline.delete(self.key)
+		pipeline.hset(self.key, 'partitions', json.dumps(partitions))
+		pipeline.execute()
+
+	def positions(self):
+		"""
+		Returns a dict of partition number to the last id handled in it (an int) or DONE
+		"""
+		positions = {}
+		for field, value in self.redis_client.hgetall(self.key).items():
+			field = field.decode('utf-8')
+			if not field.startswith('p:'):
+				continue
+			value = value.decode('utf-8')
+			positions[int(field[2:])] = value if value == DONE else int(value)
+		return positions
+
+	def save(self, positions):
+		"""
+		Stores a dict of partition number to the last id handled in it or DONE
+		"""
+		if positions:
+			fields = {}
+			for number, position in positions.items():
+				fields['p:' + str(number)] = str(position)
+			self.redis_client.hmset(self.key, fields)
+
+	def reset(self):
+		"""
+		Drops the partitions and the progress of the job
+		"""
+		self.redis_client.delete(self.key)
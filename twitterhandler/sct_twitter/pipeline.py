@@ -0,0 +1,62 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# pipeline
+#  - bounded producer/consumer pipeline between twitter pages and sinks.
+# -----------------------------------------------------------------------
+
+import queue
+import threading
+
+# Marks the end of the produced pages
+_DONE = object()
+
+
+def run_pipeline(pages, consume, max_pending_pages=2, wrap_producer=None):
+	"""
+	Run pipeline iterates the pages generator on a producer thread and hands every page to consume on the calling
+	thread, so that page N is written while page N+1 is being fetched. At most max_pending_pages fetched pages wait
+	for the consumer, which keeps the memory of an account to a few pages whatever the size of its backlog.
+	An exception raised by either side stops the other one and is raised again to the caller. The optional
+	wrap_producer wraps the function of the producer thread, e.g. to profile it
+	"""
+	pending = queue.Queue(maxsize=max(1, max_pending_pages))
+	stop = threading.Event()
+	errors = []
+
+	def offer(item):
+		while not stop.is_set():
+			try:
+				pending.put(item, timeout=0.5)
+				return True
+			except queue.Full:
+				continue
+		return False
+
+	def produce():
+		try:
+			for page in pages:
+				if not offer(page):
+					return
+		except Exception as ex:
+			errors.append(ex)
+		finally:
+			offer(_DONE)
+
+	producer = threading.Thread(target=wrap_producer(produce) if wrap_producer else produce, name='page-producer')
+	producer.daemon = True
+	producer.start()
+	try:
+		while True:
+			page = pending.get()
+			if page is _DONE:
+				break
+			consume(page)
+	except Exception:
+		# the producer may be sleeping on a rate limit, it is a daemon thread so it is not waited for
+		stop.set()
+		raise
+	producer.join()
+	if errors:
+		raise errors[0]
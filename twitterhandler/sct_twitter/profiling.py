@@ -0,0 +1,156 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# profiling
+#  - opt-in cpu and allocation profiles of the accounts a handler runs.
+# -----------------------------------------------------------------------
+
+import io
+import os
+import time
+import pstats
+import cProfile
+import datetime
+import logging
+import threading
+import tracemalloc
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Environment variable that overrides the profile settings of config.py: 1 (or all) profiles every account, a comma
+# separated list of screen names profiles those only and 0 turns profiling off
+PROFILE_ENV = 'SCT_PROFILE'
+
+
+def profiled_accounts(config, environ=None):
+	"""
+	Profiled accounts returns the lower cased screen names to profile, an empty list for every account, or None
+	when profiling is off
+	"""
+	environ = os.environ if environ is None else environ
+	value = environ.get(PROFILE_ENV)
+	if value is None:
+		if not config.get("profile_enabled"):
+			return None
+		return [screen_name.lower() for screen_name in config.get("profile_accounts", [])]
+	value = value.strip().lower()
+	if value in ('', '0', 'false', 'off'):
+		return None
+	if value in ('1', 'true', 'on', 'all', '*'):
+		return []
+	return [screen_name.strip() for screen_name in value.split(',') if screen_name.strip()]
+
+
+class AccountProfiler(object):
+	"""
+	Account profiler runs the fetch and save cycle of an account under cProfile, together with the page producer
+	thread of its pipeline, and takes tracemalloc snapshots before and after it to find where the memory it still
+	holds was allocated. Every profiled account leaves a pstats file and a text summary of the top functions by
+	cumulative and own time and of the top allocation sites in directory. tracemalloc sees the allocations of every
+	thread, so the allocation sites of an account are its own only when no other account is in flight (e.g.
+	worker_count 1 or a single profiled account)
+	"""
+
+	def __init__(self, directory, accounts=None, top=25, trace_allocations=True, frames=10):
+		self.directory = directory
+		self.accounts = set(accounts or [])
+		self.top = top
+		self.trace_allocations = trace_allocations
+		self.frames = frames
+		self.local = threading.local()
+		self.lock = threading.Lock()
+		self.tracing = 0
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+	def wants(self, screen_name):
+		"""
+		Returns whether the account is profiled
+		"""
+		return not self.accounts or screen_name.lower() in self.accounts
+
+	def follow(self, target):
+		"""
+		Returns target wrapped to be profiled with the account the calling thread profiles, so that a thread the
+		account starts (the page producer) shows up in its profile. Returns target itself outside of a profiled
+		account
+		"""
+		profiles = getattr(self.local, 'profiles', None)
+		if profiles is None:
+			return target
+
+		def profiled(*args, **kwargs):
+			profile = cProfile.Profile()
+			profiles.append(profile)
+			profile.enable()
+			try:
+				return target(*args, **kwargs)
+			finally:
+				profile.disable()
+		return profiled
+
+	def run(self, screen_name, function, *args):
+		"""
+		Runs function(*args) for the account under the profiler, writes its reports and returns its result
+		"""
+		profile = cProfile.Profile()
+		self.local.profiles = [profile]
+		snapshot = self._start_tracing()
+		started = time.time()
+		profile.enable()
+		try:
+			return function(*args)
+		finally:
+			profile.disable()
+			elapsed = time.time() - started
+			allocations = self._stop_tracing(snapshot)
+			profiles = self.local.profiles
+			self.local.profiles = None
+			try:
+				self._report(screen_name, profiles, allocations, elapsed)
+			except (IOError, OSError) as ex:
+				logger.error('Writing the profile of [' + screen_name + '] failed: ' + str(ex))
+
+	def _start_tracing(self):
+		if not self.trace_allocations:
+			return None
+		with self.lock:
+			if self.tracing == 0 and not tracemalloc.is_tracing():
+				tracemalloc.start(self.frames)
+			self.tracing += 1
+		return tracemalloc.take_snapshot()
+
+	def _stop_tracing(self, snapshot):
+		if snapshot is None:
+			return None
+		allocations = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+		with self.lock:
+			self.tracing -= 1
+			if self.tracing == 0:
+				tracemalloc.stop()
+		return allocations
+
+	def _report(self, screen_name, profiles, allocations, elapsed):
+		name = screen_name.lower() + '-' + datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+		stats = pstats.Stats(profiles[0])
+		for profile in profiles[1:]:
+			stats.add(profile)
+		stats.dump_stats(os.path.join(self.directory, name + '.prof'))
+
+		summary = io.StringIO()
+		summary.write(
+			'Profile of [' + screen_name + '] on ' + str(len(profiles)) + ' thread(s), ' + str(round(elapsed, 3)) +
+			'sec wall time\n'
+		)
+		stats.stream = summary
+		for order, title in (('cumulative', 'cumulative time'), ('tottime', 'own time')):
+			summary.write('\n=== top ' + str(self.top) + ' functions by ' + title + ' ===\n')
+			stats.sort_stats(order).print_stats(self.top)
+		if allocations is not None:
+			summary.write('\n=== top ' + str(self.top) + ' allocation sites by memory still held, every thread ===\n')
+			for difference in allocations[:self.top]:
+				summary.write(str(difference) + '\n')
+		with open(os.path.join(self.directory, name + '.txt'), 'w') as summary_file:
+			summary_file.write(summary.getvalue())
+		logger.info('Profile of [' + screen_name + '] written to ' + os.path.join(self.directory, name) + '.prof/.txt')
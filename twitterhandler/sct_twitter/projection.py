@@ -0,0 +1,195 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# projection
+#  - compact tweet documents and user profiles stored once per user.
+# -----------------------------------------------------------------------
+
+import json
+import hashlib
+import logging
+import threading
+
+from sct_twitter.metrics import PROJECTION_BYTES
+from sct_twitter.ndjson import json_encoder
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Fields of a stored tweet. The user is reduced to the fields the elastic queries filter on, its profile is kept in
+# the user index instead. Retweeted and quoted statuses keep their text and author only
+DEFAULT_TWEET_FIELDS = (
+	'id', 'id_str', 'created_at', 'text', 'full_text', 'lang', 'truncated', 'source',
+	'in_reply_to_status_id', 'in_reply_to_status_id_str', 'in_reply_to_user_id', 'in_reply_to_user_id_str',
+	'in_reply_to_screen_name', 'retweet_count', 'favorite_count', 'quote_count', 'reply_count', 'is_quote_status',
+	'coordinates', 'place.full_name', 'place.country_code',
+	'entities.hashtags.text', 'entities.user_mentions.id', 'entities.user_mentions.screen_name',
+	'entities.urls.expanded_url',
+	'user.id', 'user.id_str', 'user.screen_name', 'user.name',
+	'retweeted_status.id', 'retweeted_status.id_str', 'retweeted_status.created_at', 'retweeted_status.text',
+	'retweeted_status.full_text', 'retweeted_status.user.id', 'retweeted_status.user.screen_name',
+	'quoted_status.id', 'quoted_status.id_str', 'quoted_status.created_at', 'quoted_status.text',
+	'quoted_status.full_text', 'quoted_status.user.id', 'quoted_status.user.screen_name'
+)
+
+# Fields of a stored user profile
+DEFAULT_USER_FIELDS = (
+	'id', 'id_str', 'screen_name', 'name', 'description', 'location', 'url', 'lang', 'verified', 'protected',
+	'created_at', 'followers_count', 'friends_count', 'listed_count', 'favourites_count', 'statuses_count',
+	'profile_image_url_https'
+)
+
+# Counters of a user profile that change with almost every page, they are stored but left out of its digest so
+# that a profile is only written again when one of its stable fields changes
+VOLATILE_USER_FIELDS = ('followers_count', 'friends_count', 'listed_count', 'favourites_count', 'statuses_count')
+
+
+def field_tree(fields):
+	"""
+	Field tree turns dotted field paths into nested dicts, e.g. ['user.id', 'text'] gives {'user': {'id': None},
+	'text': None}. None keeps the whole value
+	"""
+	tree = {}
+	for field in fields:
+		node = tree
+		names = field.split('.')
+		for name in names[:-1]:
+			if node.get(name, {}) is None:
+				break
+			node = node.setdefault(name, {})
+		else:
+			node[names[-1]] = None
+	return tree
+
+
+def project(document, tree):
+	"""
+	Project returns a copy of the document with only the fields of the tree. Lists of objects are projected item
+	by item, missing fields are left out
+	"""
+	projected = {}
+	for name, subtree in tree.items():
+		if name not in document:
+			continue
+		value = document[name]
+		if subtree is None or value is None:
+			projected[name] = value
+		elif isinstance(value, dict):
+			projected[name] = project(value, subtree)
+		elif isinstance(value, list):
+			projected[name] = [project(item, subtree) if isinstance(item, dict) else item for item in value]
+		else:
+			projected[name] = value
+	return projected
+
+
+class TweetProjector(object):
+	"""
+	Tweet projector encodes statuses with only the configured fields, as the (id_str, json bytes) documents of
+	sct_twitter.ndjson, and collects the profiles of their authors. The bytes it saves are measured on every
+	sample_every-th status, which is also encoded in full, and extrapolated to the others
+	"""
+
+	def __init__(self, tweet_fields=None, user_fields=None, dumps=None, sample_every=10):
+		self.tweet_tree = field_tree(tweet_fields or DEFAULT_TWEET_FIELDS)
+		self.user_tree = field_tree(user_fields or DEFAULT_USER_FIELDS)
+		self.dumps = dumps or json_encoder('json')
+		self.sample_every = max(1, sample_every)
+		self.lock = threading.Lock()
+		self.stats = {'documents': 0, 'bytes': 0, 'sampled_documents': 0, 'sampled_bytes': 0, 'sampled_full_bytes': 0}
+
+	def encode(self, statuses):
+		"""
+		Returns the projected (id_str, json bytes) documents of the statuses
+		"""
+		documents = []
+		stats = {'documents': 0, 'bytes': 0, 'sampled_documents': 0, 'sampled_bytes': 0, 'sampled_full_bytes': 0}
+		for status in statuses:
+			document = self.dumps(project(status._json, self.tweet_tree))
+			documents.append((status.id_str, document))
+			stats['documents'] += 1
+			stats['bytes'] += len(document)
+			if (stats['documents'] - 1) % self.sample_every == 0:
+				stats['sampled_documents'] += 1
+				stats['sampled_bytes'] += len(document)
+				stats['sampled_full_bytes'] += len(self.dumps(status._json))
+		with self.lock:
+			for key in stats:
+				self.stats[key] += stats[key]
+		PROJECTION_BYTES.labels('stored').inc(stats['bytes'])
+		PROJECTION_BYTES.labels('saved').inc(self._saved(stats['bytes']))
+		return documents
+
+	def profiles(self, statuses):
+		"""
+		Returns the projected profile of every author of the statuses by user id_str, the one of the newest status
+		"""
+		profiles = {}
+		newest = {}
+		for status in statuses:
+			user = status._json.get('user')
+			if not user or newest.get(user['id_str'], -1) > status.id:
+				continue
+			newest[user['id_str']] = status.id
+			profiles[user['id_str']] = project(user, self.user_tree)
+		return profiles
+
+	def _saved(self, projected_bytes):
+		# full size over projected size of the sampled statuses so far
+		with self.lock:
+			if not self.stats['sampled_bytes']:
+				return 0
+			ratio = self.stats['sampled_full_bytes'] / float(self.stats['sampled_bytes'])
+		return int(projected_bytes * ratio) - projected_bytes
+
+	def summary(self):
+		"""
+		Returns the projected documents and bytes so far and the bytes the projection saved, extrapolated from the
+		sampled statuses
+		"""
+		with self.lock:
+			summary = {'documents': self.stats['documents'], 'bytes': self.stats['bytes']}
+		summary['saved_bytes'] = self._saved(summary['bytes'])
+		return summary
+
+
+class UserProfileStore(object):
+	"""
+	User profile store remembers a digest of the last stored profile of every user in a redis hash, so that a
+	profile is only written to the user index when it changed since it was last stored. The volatile fields are
+	left out of the digest, their stored values are those of the last time a stable field changed
+	"""
+
+	def __init__(self, redis_client, key='sct:user_profile', dumps=None, volatile_fields=VOLATILE_USER_FIELDS):
+		self.redis_client = redis_client
+		self.key = key
+		self.dumps = dumps or json_encoder('json')
+		self.volatile_fields = frozenset(volatile_fields)
+
+	def changed(self, profiles):
+		"""
+		Returns the (id_str, json bytes, digest) documents of the profiles that differ from the stored ones
+		"""
+		if not profiles:
+			return []
+		user_ids = sorted(profiles)
+		documents = []
+		for user_id in user_ids:
+			# the digest is taken over sorted keys so that it does not depend on the field order of the response
+			stable = dict(
+				(field, value) for field, value in profiles[user_id].items() if field not in self.volatile_fields
+			)
+			digest = hashlib.md5(json.dumps(stable, sort_keys=True).encode('utf-8')).hexdigest()
+			documents.append((user_id, self.dumps(profiles[user_id]), digest))
+		stored = self.redis_client.hmget(self.key, user_ids)
+		return [
+			document for document, digest in zip(documents, stored)
+			if digest is None or digest.decode('utf-8') != document[2]
+		]
+
+	def remember(self, documents):
+		"""
+		Remembers the digests of profiles that were written
+		"""
+		if documents:
+			self.redis_client.hmset(self.key, dict((user_id, digest) for user_id, document, digest in documents))
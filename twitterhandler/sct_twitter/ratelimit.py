@@ -0,0 +1,116 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# ratelimit
+#  - shared twitter rate limit budgets kept in redis.
+# -----------------------------------------------------------------------
+
+import time
+import logging
+
+from sct_twitter.metrics import RATE_LIMIT_SLEEP_SECONDS
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+TIMELINE_ENDPOINT = '/statuses/user_timeline'
+SEARCH_ENDPOINT = '/search/tweets'
+LOOKUP_USERS_ENDPOINT = '/users/lookup'
+LOOKUP_STATUSES_ENDPOINT = '/statuses/lookup'
+
+# Takes one request off a budget that is known, a single script call so that a budget that expires in between is
+# not recreated as a hash without its reset and limit
+_SPEND_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], 'reset') == 1 then
+	return redis.call('HINCRBY', KEYS[1], 'remaining', -1)
+end
+return nil
+"""
+
+
+class RateBudget(object):
+	"""
+	Rate budget keeps the twitter rate limit budget of every credential and endpoint in a redis hash, so that all
+	the worker processes share it. Budgets are read from the x-rate-limit-* headers of every response, and requests
+	are paced ahead of time instead of waiting for a RateLimitError:
+	- once remaining drops to reserve the budget is exhausted until the window resets
+	- once remaining drops below pace_below (a fraction of the window limit) the remaining requests are spread
+	evenly over what is left of the window
+	"""
+
+	def __init__(self, redis_client, prefix='sct:ratelimit', reserve=1, pace_below=0.2):
+		self.redis_client = redis_client
+		self.prefix = prefix
+		self.reserve = reserve
+		self.pace_below = pace_below
+		self._spend = redis_client.register_script(_SPEND_SCRIPT)
+
+	def _key(self, credential, endpoint):
+		return self.prefix + ':' + credential + ':' + endpoint
+
+	def record(self, credential, endpoint, response):
+		"""
+		Records the budget reported by the headers of a twitter response (tweepy's api.last_response)
+		"""
+		headers = getattr(response, 'headers', None) or {}
+		remaining = headers.get('x-rate-limit-remaining')
+		reset = headers.get('x-rate-limit-reset')
+		if remaining is None or reset is None:
+			return
+		key = self._key(credential, endpoint)
+		pipeline = self.redis_client.pipeline(transaction=False)
+		pipeline.hmset(key, {
+			'remaining': remaining,
+			'reset': reset,
+			'limit': headers.get('x-rate-limit-limit', remaining),
+			'last': repr(time.time())
+		})
+		pipeline.expireat(key, int(reset) + 60)
+		pipeline.execute()
+
+	def spend(self, credential, endpoint):
+		"""
+		Takes one request off a known budget before the request is sent, so that concurrent processes see it
+		before the response headers are recorded
+		"""
+		self._spend(keys=[self._key(credential, endpoint)])
+
+	def remaining(self, credential, endpoint):
+		"""
+		Returns the requests left in the current window, None when the budget is unknown or the window is over
+		"""
+		budget = self.redis_client.hmget(self._key(credential, endpoint), 'remaining', 'reset')
+		if budget[0] is None or budget[1] is None or time.time() >= float(budget[1]):
+			return None
+		return int(budget[0])
+
+	def wait_time(self, credential, endpoint):
+		"""
+		Returns how many seconds a request to the endpoint should wait, 0 when it can be sent right away
+		"""
+		budget = self.redis_client.hgetall(self._key(credential, endpoint))
+		if any(field not in budget for field in (b'remaining', b'reset', b'limit', b'last')):
+			# an unknown budget, or one that was left incomplete
+			return 0
+		now = time.time()
+		reset = float(budget[b'reset'])
+		if now >= reset:
+			return 0
+		remaining = int(budget[b'remaining'])
+		if remaining <= self.reserve:
+			return reset - now
+		if remaining < int(budget[b'limit']) * self.pace_below:
+			interval = (reset - now) / (remaining - self.reserve)
+			return max(0, float(budget[b'last']) + interval - now)
+		return 0
+
+	def pace(self, credential, endpoint):
+		"""
+		Sleeps for as long as the budget requires and spends one request of it
+		"""
+		sleep_interval = self.wait_time(credential, endpoint)
+		if sleep_interval > 0:
+			logger.info('Pacing [' + credential + '] ' + endpoint + ' for ' + str(round(sleep_interval, 2)) + 'sec')
+			RATE_LIMIT_SLEEP_SECONDS.labels(endpoint).inc(sleep_interval)
+			time.sleep(sleep_interval)
+		self.spend(credential, endpoint)
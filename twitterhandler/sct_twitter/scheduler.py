@@ -0,0 +1,130 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# scheduler
+#  - activity aware poll schedule of the accounts kept in a redis sorted set.
+# -----------------------------------------------------------------------
+
+import json
+import time
+import logging
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Claims up to ARGV[2] accounts that are due at ARGV[1], the most overdue and most active first. A claimed account
+# is pushed ARGV[3] seconds ahead, so that it becomes due again if the worker that claimed it never reports back
+_CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'WITHSCORES', 'LIMIT', 0, tonumber(ARGV[2]) * 4)
+local candidates = {}
+for index = 1, #due, 2 do
+	local rate = tonumber(redis.call('HGET', KEYS[2], due[index]) or '0') or 0
+	local overdue = now - tonumber(due[index + 1]) + 1
+	table.insert(candidates, {due[index], overdue * (rate * 3600 + 1)})
+end
+table.sort(candidates, function(left, right) return left[2] > right[2] end)
+local claimed = {}
+for index = 1, math.min(#candidates, tonumber(ARGV[2])) do
+	local account = candidates[index][1]
+	redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), account)
+	local service = redis.call('HGET', KEYS[3], account)
+	if service then
+		table.insert(claimed, service)
+	end
+end
+return claimed
+"""
+
+
+class ActivityScheduler(object):
+	"""
+	Activity scheduler keeps the next poll time of every account in a redis sorted set. After every poll the rate
+	of new tweets of the account (an exponentially weighted average of tweets per second) sets the next poll time,
+	so that about target_tweets new tweets are expected per poll, within [min_interval, max_interval]. Claims hand
+	out the due accounts ordered by how overdue they are times how active they are, so the rate limit budget goes to
+	the accounts that are most likely to have new tweets
+	"""
+
+	def __init__(
+			self, redis_client, prefix='sct:schedule', min_interval=900, max_interval=86400, target_tweets=20,
+			lease=3600, smoothing=0.5):
+		self.redis_client = redis_client
+		self.due = prefix + ':due'
+		self.rates = prefix + ':rate'
+		self.polled = prefix + ':polled'
+		self.services = prefix + ':services'
+		self.min_interval = min_interval
+		self.max_interval = max_interval
+		self.target_tweets = target_tweets
+		self.lease = lease
+		self.smoothing = smoothing
+		self._claim = redis_client.register_script(_CLAIM_SCRIPT)
+
+	def register(self, services):
+		"""
+		Registers queued services by their lower cased screen name. New accounts are due right away, the next poll
+		time of known accounts is kept and only their service document is refreshed
+		"""
+		pipeline = self.redis_client.pipeline(transaction=False)
+		registered = 0
+		for service in services:
+			screen_name = service['_source'].get('twitter_screen_name')
+			if not screen_name:
+				continue
+			pipeline.hset(self.services, screen_name.lower(), json.dumps(service))
+			pipeline.zadd(self.due, {screen_name.lower(): time.time()}, nx=True)
+			registered += 1
+		pipeline.execute()
+		return registered
+
+	def claim(self, count):
+		"""
+		Claims up to count due accounts and returns their service documents
+		"""
+		items = self._claim(keys=[self.due, self.rates, self.services], args=[repr(time.time()), count, self.lease])
+		return [json.loads(item.decode('utf-8')) for item in items]
+
+	def record(self, screen_name, new_tweets):
+		"""
+		Records the number of new tweets a poll of the account returned and schedules its next poll. Returns the
+		seconds until the next poll
+		"""
+		account = screen_name.lower()
+		now = time.time()
+		pipeline = self.redis_client.pipeline(transaction=False)
+		pipeline.hget(self.polled, account)
+		pipeline.hget(self.rates, account)
+		last_polled, last_rate = pipeline.execute()
+		if last_polled is None:
+			# the first poll only tells that the account exists, its rate is known from the next poll on
+			rate = None
+			interval = self.min_interval
+		else:
+			observed = new_tweets / max(now - float(last_polled), 1.0)
+			rate = observed if last_rate is None else self.smoothing * observed + (1 - self.smoothing) * float(last_rate)
+			interval = self.target_tweets / rate if rate > 0 else self.max_interval
+		interval = min(max(interval, self.min_interval), self.max_interval)
+
+		pipeline = self.redis_client.pipeline(transaction=False)
+		pipeline.hset(self.polled, account, repr(now))
+		if rate is not None:
+			pipeline.hset(self.rates, account, repr(rate))
+		pipeline.zadd(self.due, {account: now + interval})
+		pipeline.execute()
+		return interval
+
+	def next_due(self):
+		"""
+		Returns the seconds until the next account is due, 0 when one is already due and None without accounts
+		"""
+		first = self.redis_client.zrange(self.due, 0, 0, withscores=True)
+		if not first:
+			return None
+		return max(0, first[0][1] - time.time())
+
+	def accounts(self):
+		"""
+		Returns the service documents of every scheduled account
+		"""
+		return [json.loads(item.decode('utf-8')) for item in self.redis_client.hvals(self.services)]
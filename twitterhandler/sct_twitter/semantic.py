@@ -0,0 +1,194 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# semantic
+#  - submission of tweets to the LinkedPipes semantic pipeline.
+# -----------------------------------------------------------------------
+
+import time
+import logging
+import threading
+import collections
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from sct_twitter.metrics import LINKED_PIPES_ERRORS, SEMANTIC_TWEETS, STAGE_SECONDS
+from sct_twitter.ndjson import json_array
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+
+def submit_semantic(path, pipeline, body, http=requests):
+	"""
+	Submit semantic posts an already encoded json array of tweets as the input.json of a new LinkedPipes
+	pipeline execution, through the given http session (see sct_twitter.clients) or the requests module
+	"""
+	multipart_form_data = {
+		"input": ('input.json', body)
+	}
+	querystring = {"pipeline": pipeline}
+	return http.request("POST", path, files=multipart_form_data, params=querystring)
+
+
+class SemanticBatcher(object):
+	"""
+	Semantic batcher groups the encoded tweets of every account into LinkedPipes executions of at most max_items
+	tweets and max_bytes of input.json. A batch is submitted as soon as it is full or flush_interval seconds after
+	its first tweet, whichever comes first. At most max_in_flight executions are submitted concurrently and add
+	blocks while they are all busy, which pushes back on the account workers instead of piling up executions.
+	The iris of the created executions are kept in executions and the numbers of the batches that were given up
+	on after max_retries in failed
+	"""
+
+	def __init__(
+			self, path, pipeline, http=requests, max_items=1000, max_bytes=8388608, flush_interval=30,
+			max_in_flight=2, max_retries=2, backoff=2.0):
+		self.path = path
+		self.pipeline = pipeline
+		self.http = http
+		self.max_items = max_items
+		self.max_bytes = max_bytes
+		self.flush_interval = flush_interval
+		self.max_retries = max_retries
+		self.backoff = backoff
+		self.lock = threading.Lock()
+		self.sent = threading.Condition(self.lock)
+		self.taken = 0
+		self.unsent = set()
+		self.failed = set()
+		self.batch = []
+		self.batch_bytes = 0
+		self.batch_started = None
+		self.slots = threading.BoundedSemaphore(max_in_flight)
+		self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+		self.executions = collections.deque(maxlen=1000)
+		self.stats = {'executions': 0, 'tweets': 0, 'failed_executions': 0, 'failed_tweets': 0}
+		self.closed = threading.Event()
+		self.timer = threading.Thread(target=self._flush_on_timer, name='semantic-flush')
+		self.timer.daemon = True
+		self.timer.start()
+
+	def add(self, documents):
+		"""
+		Adds (id_str, json bytes) documents to the pending batch, submitting every batch that fills up
+		"""
+		for document in documents:
+			full = None
+			with self.lock:
+				size = len(document[1]) + 1
+				if self.batch and (len(self.batch) >= self.max_items or self.batch_bytes + size > self.max_bytes):
+					full = self._take()
+				if not self.batch:
+					self.batch_started = time.time()
+				self.batch.append(document)
+				self.batch_bytes += size
+			if full:
+				self._submit(full)
+
+	def flush(self):
+		"""
+		Submits the pending batch, if any
+		"""
+		with self.lock:
+			batch = self._take()
+		if batch:
+			self._submit(batch)
+
+	def sync(self):
+		"""
+		Submits the pending batch and blocks until every batch taken so far has either been sent or been given up
+		on. Returns the number of batches given up on so far, a caller can only checkpoint everything it added before
+		the call when it is 0
+		"""
+		self.flush()
+		with self.lock:
+			target = self.taken
+			while any(seq <= target for seq in self.unsent):
+				self.sent.wait()
+			return len(self.failed)
+
+	def close(self):
+		"""
+		Submits the pending batch and waits for every execution in flight
+		"""
+		self.closed.set()
+		self.timer.join()
+		self.flush()
+		self.executor.shutdown(wait=True)
+		logger.info('Semantic batcher closed: ' + str(self.stats))
+
+	def _take(self):
+		# batches are numbered in the order they are taken so that sync can wait for the ones taken before it
+		if not self.batch:
+			return None
+		self.taken += 1
+		self.unsent.add(self.taken)
+		batch = (self.taken, self.batch)
+		self.batch = []
+		self.batch_bytes = 0
+		self.batch_started = None
+		return batch
+
+	def _flush_on_timer(self):
+		while not self.closed.wait(min(1.0, self.flush_interval)):
+			with self.lock:
+				expired = self.batch_started is not None and time.time() - self.batch_started >= self.flush_interval
+				batch = self._take() if expired else None
+			if batch:
+				self._submit(batch)
+
+	def _submit(self, batch):
+		# blocks while max_in_flight executions are being submitted
+		self.slots.acquire()
+		try:
+			self.executor.submit(self._send, batch)
+		except RuntimeError:
+			with self.lock:
+				self.unsent.discard(batch[0])
+				self.sent.notify_all()
+			self.slots.release()
+			raise
+
+	def _send(self, taken):
+		seq, batch = taken
+		try:
+			body = json_array(batch)
+			for attempt in range(self.max_retries + 1):
+				if attempt:
+					time.sleep(self.backoff * (2 ** (attempt - 1)))
+				try:
+					with STAGE_SECONDS.labels('linkedpipes_submit').time():
+						response = submit_semantic(self.path, self.pipeline, body, self.http)
+				except requests.RequestException as ex:
+					logger.error('Linked Pipes submission failed: ' + str(ex))
+					LINKED_PIPES_ERRORS.labels('request').inc()
+					continue
+				if response.status_code < 300:
+					execution = self._execution_iri(response)
+					logger.info('Linked Pipes execution [' + str(execution) + '] for ' + str(len(batch)) + ' tweets')
+					with self.lock:
+						self.executions.append(execution)
+						self.stats['executions'] += 1
+						self.stats['tweets'] += len(batch)
+					SEMANTIC_TWEETS.labels().inc(len(batch))
+					return
+				logger.error('Linked Pipes responded ' + str(response.status_code) + ': ' + response.text)
+				LINKED_PIPES_ERRORS.labels('status').inc()
+			LINKED_PIPES_ERRORS.labels('dropped').inc()
+			with self.lock:
+				self.failed.add(seq)
+				self.stats['failed_executions'] += 1
+				self.stats['failed_tweets'] += len(batch)
+		finally:
+			with self.lock:
+				self.unsent.discard(seq)
+				self.sent.notify_all()
+			self.slots.release()
+
+	@staticmethod
+	def _execution_iri(response):
+		try:
+			return response.json().get('iri')
+		except ValueError:
+			return response.text
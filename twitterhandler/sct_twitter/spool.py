@@ -0,0 +1,289 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# spool
+#  - durable on-disk spool of fetched tweets drained to the sinks at
+#    their own pace.
+# -----------------------------------------------------------------------
+
+import os
+import json
+import logging
+import threading
+
+from sct_twitter.metrics import SPOOL_DOCUMENTS
+from sct_twitter.ndjson import bulk_action_line
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.ndjson'
+OFFSETS_FILE = 'offsets.json'
+
+
+def parse_action(line):
+	"""
+	Parse action returns the _id of a spooled bulk action line, None when the line is not one
+	"""
+	try:
+		action = json.loads(line.decode('utf-8'))
+		return action['index']['_id']
+	except (ValueError, KeyError, TypeError):
+		return None
+
+
+class Spool(object):
+	"""
+	Spool appends encoded tweets to segment files of a local directory, in the NDJSON layout of an elastic _bulk
+	body (an index action line, then the document line). A new segment is started once the current one reaches
+	segment_bytes. Every consumer (the elastic and the linkedpipes drainers) reads the segments in order from its
+	own committed (segment, offset) position, kept in an offsets file that is replaced atomically on every commit.
+	Segments are deleted once every consumer has committed past them. With fsync every append and commit is
+	flushed to the disk before it returns. A record torn by a crash is cut off the last segment when it is reopened
+	"""
+
+	def __init__(self, directory, consumers, segment_bytes=67108864, fsync=False):
+		self.directory = directory
+		self.segment_bytes = segment_bytes
+		self.fsync = fsync
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.lock = threading.Lock()
+		self.appended = threading.Condition(self.lock)
+		segments = self._segments()
+		self.segment = segments[-1] if segments else 1
+		if segments:
+			self._repair_tail(self._path(self.segment))
+		self.writer = open(self._path(self.segment), 'ab')
+		self.size = self.writer.tell()
+		offsets = {}
+		offsets_path = os.path.join(directory, OFFSETS_FILE)
+		if os.path.exists(offsets_path):
+			with open(offsets_path) as offsets_file:
+				offsets = json.load(offsets_file)
+		# a new consumer starts at the end of the spool, the ones that are no longer configured are forgotten so
+		# that they do not keep their segments around
+		self.offsets = dict(
+			(consumer, tuple(offsets.get(consumer, (self.segment, self.size)))) for consumer in consumers
+		)
+		self._write_offsets()
+		self._delete_drained_segments()
+
+	def _repair_tail(self, path):
+		"""
+		Truncates the segment after its last complete action and document line pair, so that a record torn by a crash
+		during an append is not glued to the next one
+		"""
+		end = 0
+		with open(path, 'rb') as segment_file:
+			while True:
+				action = segment_file.readline()
+				document = segment_file.readline()
+				if not action.endswith(b'\n') or not document.endswith(b'\n'):
+					break
+				end = segment_file.tell()
+			size = segment_file.seek(0, os.SEEK_END)
+		if size > end:
+			logger.warning('Truncating the ' + str(size - end) + ' bytes of an incomplete spooled record of ' + path)
+			with open(path, 'r+b') as segment_file:
+				segment_file.truncate(end)
+
+	def _path(self, segment):
+		return os.path.join(self.directory, SEGMENT_PREFIX + '%020d' % segment + SEGMENT_SUFFIX)
+
+	def _segments(self):
+		return sorted(
+			int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+			if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+		)
+
+	def append(self, documents):
+		"""
+		Appends (id_str, json bytes) documents and returns how many were appended
+		"""
+		data = b''.join(bulk_action_line(id_str) + document + b'\n' for id_str, document in documents)
+		if not data:
+			return 0
+		with self.lock:
+			if self.size and self.size + len(data) > self.segment_bytes:
+				self.writer.close()
+				self.segment += 1
+				self.writer = open(self._path(self.segment), 'ab')
+				self.size = 0
+			# a single write of whole records, readers stop at an incomplete trailing line
+			self.writer.write(data)
+			self.writer.flush()
+			if self.fsync:
+				os.fsync(self.writer.fileno())
+			self.size += len(data)
+			self.appended.notify_all()
+		appended = data.count(b'\n') // 2
+		SPOOL_DOCUMENTS.labels('appended').inc(appended)
+		return appended
+
+	def read(self, consumer, max_docs=1000, max_bytes=8388608):
+		"""
+		Reads up to max_docs documents (and about max_bytes) after the committed position of the consumer. Returns
+		the (id_str, json bytes) documents and the position to commit once they are delivered
+		"""
+		with self.lock:
+			segment, offset = self.offsets[consumer]
+		documents = []
+		size = 0
+		while len(documents) < max_docs and size < max_bytes:
+			with self.lock:
+				# the writer never goes back to an older segment, so an older one is complete
+				complete = segment < self.segment
+			try:
+				segment_file = open(self._path(segment), 'rb')
+			except IOError:
+				segment_file = None
+			if segment_file is not None:
+				with segment_file:
+					segment_file.seek(offset)
+					while len(documents) < max_docs and size < max_bytes:
+						action = segment_file.readline()
+						document = segment_file.readline()
+						if not action.endswith(b'\n') or not document.endswith(b'\n'):
+							break
+						offset = segment_file.tell()
+						id_str = parse_action(action)
+						if id_str is None:
+							logger.error(
+								'Skipping a malformed spooled record of segment ' + str(segment) + ': ' + repr(action[:200])
+							)
+							SPOOL_DOCUMENTS.labels('malformed').inc()
+							continue
+						documents.append((id_str, document[:-1]))
+						size += len(action) + len(document)
+			if not complete or len(documents) >= max_docs or size >= max_bytes:
+				break
+			segment += 1
+			offset = 0
+		return documents, (segment, offset)
+
+	def commit(self, consumer, position):
+		"""
+		Commits the position of the consumer after its documents were delivered
+		"""
+		with self.lock:
+			if self.offsets[consumer] == tuple(position):
+				return
+			self.offsets[consumer] = tuple(position)
+			self._write_offsets()
+			self._delete_drained_segments()
+
+	def _write_offsets(self):
+		path = os.path.join(self.directory, OFFSETS_FILE)
+		temporary = path + '.tmp'
+		with open(temporary, 'w') as offsets_file:
+			json.dump(self.offsets, offsets_file)
+			offsets_file.flush()
+			if self.fsync:
+				os.fsync(offsets_file.fileno())
+		os.rename(temporary, path)
+
+	def _delete_drained_segments(self):
+		oldest = min([segment for segment, offset in self.offsets.values()] + [self.segment])
+		for segment in self._segments():
+			if segment >= oldest:
+				break
+			os.remove(self._path(segment))
+
+	def backlog(self, consumer):
+		"""
+		Returns the bytes the consumer has not committed yet
+		"""
+		with self.lock:
+			segment, offset = self.offsets[consumer]
+			if segment == self.segment:
+				return self.size - offset
+			backlog = self.size - offset
+			for older in range(segment, self.segment):
+				try:
+					backlog += os.path.getsize(self._path(older))
+				except OSError:
+					continue
+			return backlog
+
+	def wait(self, timeout):
+		"""
+		Waits up to timeout seconds for the next append
+		"""
+		with self.appended:
+			self.appended.wait(timeout)
+
+	def close(self):
+		with self.lock:
+			self.writer.close()
+
+
+class SpoolDrainer(object):
+	"""
+	Spool drainer delivers the documents of a spool consumer on a thread of its own with send, a function that
+	returns True once a batch was delivered. A batch is only committed once it was delivered, a failed batch is
+	sent again after a backoff that doubles up to max_backoff seconds, so documents are never dropped while a sink
+	is slow or unavailable. The fetch loop only waits for the disk
+	"""
+
+	def __init__(self, spool, consumer, send, max_docs=1000, max_bytes=8388608, backoff=5, max_backoff=300):
+		self.spool = spool
+		self.consumer = consumer
+		self.send = send
+		self.max_docs = max_docs
+		self.max_bytes = max_bytes
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.closing = threading.Event()
+		self.stopped = threading.Event()
+		self.delivered = 0
+		self.thread = threading.Thread(target=self._drain, name='spool-' + consumer)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def _drain(self):
+		delay = 0
+		while not self.stopped.is_set():
+			documents = []
+			try:
+				documents, position = self.spool.read(self.consumer, self.max_docs, self.max_bytes)
+				if not documents:
+					# an exhausted segment is still committed so that it can be deleted
+					self.spool.commit(self.consumer, position)
+					if self.closing.is_set():
+						return
+					self.spool.wait(1.0)
+					continue
+				delivered = self.send(documents)
+			except Exception as ex:
+				logger.error(
+					'Delivering ' + str(len(documents)) + ' spooled tweets to ' + self.consumer + ' failed: ' + str(ex)
+				)
+				delivered = False
+			if delivered:
+				self.spool.commit(self.consumer, position)
+				self.delivered += len(documents)
+				SPOOL_DOCUMENTS.labels(self.consumer).inc(len(documents))
+				delay = 0
+				continue
+			delay = min(max(self.backoff, delay * 2), self.max_backoff)
+			logger.warning(
+				'Spooled tweets were not delivered to ' + self.consumer + ', ' + str(self.spool.backlog(self.consumer)) +
+				' bytes wait. Retrying in ' + str(delay) + 'sec'
+			)
+			self.stopped.wait(delay)
+
+	def close(self, timeout=None):
+		"""
+		Waits up to timeout seconds (forever with None) for the spooled documents to be delivered and stops the
+		drainer. Documents that are not delivered by then stay in the spool for the next run
+		"""
+		self.closing.set()
+		self.thread.join(timeout)
+		if self.thread.is_alive():
+			logger.warning(
+				str(self.spool.backlog(self.consumer)) + ' spooled bytes are left for ' + self.consumer + ' until the next run'
+			)
+			self.stopped.set()
+			self.thread.join()
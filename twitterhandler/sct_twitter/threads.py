@@ -0,0 +1,150 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# threads
+#  - batched resolution of the missing parent tweets of replies.
+# -----------------------------------------------------------------------
+
+import time
+import logging
+import threading
+import tweepy
+
+from sct_twitter.metrics import ELASTIC_ERRORS, PARENT_TWEETS, STAGE_SECONDS
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Stream name of the parent tweets in the totals and the metrics
+PARENTS = 'parents'
+
+# statuses/lookup accepts up to 100 tweet ids per call
+STATUSES_LOOKUP_BATCH_SIZE = 100
+
+
+class ParentResolver(object):
+	"""
+	Parent resolver collects the in_reply_to_status_id of the replies saved during a run and resolves the parents
+	that are missing at once, when the run is over. The collected ids are first checked against elastic with one
+	_mget per mget_batch ids, then against the ids that twitter no longer returns (deleted or protected tweets),
+	which are kept in a redis sorted set scored by their expiry time for missing_ttl seconds. The rest are looked
+	up 100 ids per twitter call
+	"""
+
+	def __init__(
+		self, redis_client, elastic_endpoint, index_name, http, key='sct:missing_parents', missing_ttl=2592000,
+		mget_batch=1000, seen_ids=None
+	):
+		self.redis_client = redis_client
+		self.mget_path = elastic_endpoint + index_name + '/_mget'
+		self.http = http
+		self.key = key
+		self.missing_ttl = missing_ttl
+		self.mget_batch = mget_batch
+		self.seen_ids = seen_ids
+		self.lock = threading.Lock()
+		self.pending = set()
+		self.stats = {'collected': 0, 'stored': 0, 'known_missing': 0, 'fetched': 0, 'missing': 0, 'lookups': 0}
+
+	def collect(self, statuses):
+		"""
+		Collects the parent ids of the replies among the statuses, except those of parents in the same statuses
+		"""
+		ids = set(status.id_str for status in statuses)
+		parents = set(
+			status.in_reply_to_status_id_str for status in statuses
+			if getattr(status, 'in_reply_to_status_id_str', None) and status.in_reply_to_status_id_str not in ids
+		)
+		if not parents:
+			return
+		with self.lock:
+			self.stats['collected'] += len(parents - self.pending)
+			self.pending.update(parents)
+
+	def stored(self, ids):
+		"""
+		Returns the ids that are stored in elastic, one _mget request per mget_batch ids
+		"""
+		stored = set()
+		for start in range(0, len(ids), self.mget_batch):
+			batch = ids[start:start + self.mget_batch]
+			with STAGE_SECONDS.labels('elastic_mget').time():
+				response = self.http.post(
+					self.mget_path, json={'ids': batch}, params={'_source': 'false', 'filter_path': 'docs._id,docs.found'}
+				)
+			if response.status_code >= 300:
+				ELASTIC_ERRORS.labels('status').inc()
+				raise IOError('Elastic _mget responded ' + str(response.status_code) + ': ' + response.text[:500])
+			stored.update(document['_id'] for document in response.json().get('docs', []) if document.get('found'))
+		return stored
+
+	def known_missing(self, ids):
+		"""
+		Returns the ids that twitter did not return within the last missing_ttl seconds
+		"""
+		self.redis_client.zremrangebyscore(self.key, '-inf', time.time())
+		pipeline = self.redis_client.pipeline(transaction=False)
+		for tweet_id in ids:
+			pipeline.zscore(self.key, tweet_id)
+		return set(tweet_id for tweet_id, expiry in zip(ids, pipeline.execute()) if expiry is not None)
+
+	def remember_missing(self, ids):
+		if ids:
+			expiry = time.time() + self.missing_ttl
+			self.redis_client.zadd(self.key, dict((tweet_id, expiry) for tweet_id in ids))
+
+	def resolve(self, lookup):
+		"""
+		Resolve returns the collected parents that are neither stored nor known to be missing, fetched with lookup,
+		a function that returns the statuses of up to 100 ids. The collected ids are cleared, those elastic could not
+		be asked about are kept for the next resolve
+		"""
+		with self.lock:
+			ids = sorted(self.pending)
+			self.pending = set()
+		if not ids:
+			return []
+		if self.seen_ids is not None:
+			# parents written earlier in the run may not be searchable yet
+			seen = self.seen_ids.seen(ids, record=False)
+			ids = [tweet_id for tweet_id in ids if tweet_id not in seen]
+		try:
+			stored = self.stored(ids)
+		except (IOError, ValueError) as ex:
+			logger.error('Checking ' + str(len(ids)) + ' parent tweets against elastic failed: ' + str(ex))
+			with self.lock:
+				self.pending.update(ids)
+			return []
+		known_missing = self.known_missing([tweet_id for tweet_id in ids if tweet_id not in stored])
+		unknown = [tweet_id for tweet_id in ids if tweet_id not in stored and tweet_id not in known_missing]
+
+		statuses = []
+		missing = []
+		lookups = 0
+		for start in range(0, len(unknown), STATUSES_LOOKUP_BATCH_SIZE):
+			batch = unknown[start:start + STATUSES_LOOKUP_BATCH_SIZE]
+			try:
+				found = lookup(batch)
+			except tweepy.TweepError as ex:
+				logger.warning('Twitter statuses lookup failed for ' + str(len(batch)) + ' parent tweets: ' + str(ex))
+				continue
+			lookups += 1
+			statuses.extend(found)
+			found_ids = set(status.id_str for status in found)
+			missing.extend(tweet_id for tweet_id in batch if tweet_id not in found_ids)
+		self.remember_missing(missing)
+
+		counts = {
+			'stored': len(stored), 'known_missing': len(known_missing), 'fetched': len(statuses), 'missing': len(missing)
+		}
+		logger.info('Resolved ' + str(len(ids)) + ' parent tweet ids with ' + str(lookups) + ' lookup(s): ' + str(counts))
+		with self.lock:
+			for name, count in counts.items():
+				self.stats[name] += count
+				PARENT_TWEETS.labels(name).inc(count)
+			self.stats['lookups'] += lookups
+		return statuses
+
+	def summary(self):
+		with self.lock:
+			return dict(self.stats)
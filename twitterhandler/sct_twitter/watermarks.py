@@ -0,0 +1,108 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# watermarks
+#  - since_id watermarks of every screen name kept in redis.
+# -----------------------------------------------------------------------
+
+import json
+
+# Tweet ids do not fit in a lua number without losing precision, so they are compared as decimal strings:
+# a longer id is always the larger one and ids of the same length compare lexicographically
+_ADVANCE_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+local candidate = ARGV[2]
+if (not current) or string.len(candidate) > string.len(current)
+	or (string.len(candidate) == string.len(current) and candidate > current) then
+	redis.call('HSET', KEYS[1], ARGV[1], candidate)
+	return 1
+end
+return 0
+"""
+
+TIMELINE = 'timeline'
+REPLIES = 'replies'
+
+
+class WatermarkStore(object):
+	"""
+	Watermark store keeps the highest indexed tweet id per screen name and per stream (timeline or replies) in a
+	redis hash per stream. A watermark only ever moves forward and the move is a single atomic script call, so
+	concurrent workers never lower it
+	"""
+
+	def __init__(self, redis_client, prefix='sct:watermark'):
+		self.redis_client = redis_client
+		self.prefix = prefix
+		self._advance = redis_client.register_script(_ADVANCE_SCRIPT)
+
+	def _key(self, stream):
+		return self.prefix + ':' + stream
+
+	def get_many(self, screen_name, streams):
+		"""
+		Returns a dict of stream to the watermark of the screen name, read in a single round trip. Streams with a
+		cold miss are left out
+		"""
+		pipeline = self.redis_client.pipeline(transaction=False)
+		for stream in streams:
+			pipeline.hget(self._key(stream), screen_name.lower())
+		watermarks = {}
+		for stream, value in zip(streams, pipeline.execute()):
+			if value is not None:
+				watermarks[stream] = int(value)
+		return watermarks
+
+	def advance(self, screen_name, stream, tweet_id):
+		"""
+		Moves the watermark of the screen name to tweet_id unless it already is at a higher id. Returns whether the
+		watermark was moved
+		"""
+		return bool(self._advance(keys=[self._key(stream)], args=[screen_name.lower(), str(tweet_id)]))
+
+	def reset(self, screen_name, streams):
+		"""
+		Drops the watermark of the screen name of every stream, so that it is rebuilt from elasticsearch even when it
+		is higher than the newest stored tweet
+		"""
+		pipeline = self.redis_client.pipeline(transaction=False)
+		for stream in streams:
+			pipeline.hdel(self._key(stream), screen_name.lower())
+		pipeline.execute()
+
+
+class PaginationCursors(object):
+	"""
+	Pagination cursors keep how far the max_id pagination of an account and stream got, a redis key per screen name
+	and stream that expires after ttl seconds. A cursor holds the since_id the pagination runs down to, the max_id of
+	its next page, the newest tweet id it fetched and the pages written so far. It is saved once a page is written
+	and cleared once the pagination is over and the watermark moved, so that an interrupted pagination is resumed
+	instead of started over
+	"""
+
+	def __init__(self, redis_client, prefix='sct:cursor', ttl=604800):
+		self.redis_client = redis_client
+		self.prefix = prefix
+		self.ttl = ttl
+
+	def _key(self, screen_name, stream):
+		return self.prefix + ':' + stream + ':' + screen_name.lower()
+
+	def get_many(self, screen_name, streams):
+		"""
+		Returns a dict of stream to the cursor of the screen name, read in a single round trip. Streams without an
+		interrupted pagination are left out
+		"""
+		values = self.redis_client.mget([self._key(screen_name, stream) for stream in streams])
+		cursors = {}
+		for stream, value in zip(streams, values):
+			if value is not None:
+				cursors[stream] = json.loads(value.decode('utf-8'))
+		return cursors
+
+	def save(self, screen_name, stream, cursor):
+		self.redis_client.setex(self._key(screen_name, stream), self.ttl, json.dumps(cursor))
+
+	def clear(self, screen_name, streams):
+		self.redis_client.delete(*[self._key(screen_name, stream) for stream in streams])
@@ -0,0 +1,184 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# workers
+#  - in-process pool of concurrent account workers.
+# -----------------------------------------------------------------------
+
+import hashlib
+import logging
+import threading
+import collections
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Key of the accounts that have no oauth token of their own and share the config.py credentials
+DEFAULT_CREDENTIAL = 'default'
+
+
+def service_credential(service):
+	"""
+	Service credential returns the key of the oauth credential a queued service is fetched with. The token itself
+	is never used as a key, only a short digest of it
+	"""
+	token = service['_source'].get('twitter_oauth_token')
+	if not token:
+		return DEFAULT_CREDENTIAL
+	return hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]
+
+
+class AccountWorkerPool(object):
+	"""
+	Account worker pool keeps up to worker_count accounts in flight on threads of a single process. Accounts are
+	keyed by the oauth credential they are fetched with and a credential is held by one worker at a time, so two
+	workers never spend the same rate limit budget concurrently. The optional delay callable returns how many
+	seconds an account has to wait for the rate limit budget of its credential, accounts with a delay are passed
+	over for accounts that can start right away. While every pending account waits on a busy or exhausted
+	credential the pool reads ahead from the queue, up to lookahead accounts, to find one it can start. The optional
+	capacity callable returns how many workers may hold a key at once, e.g. the size of the credential pool the
+	accounts without an oauth token of their own share
+	"""
+
+	def __init__(
+		self, worker_count, handle, credential_key=service_credential, lookahead=None, delay=None, capacity=None
+	):
+		self.worker_count = max(1, worker_count)
+		self.handle = handle
+		self.credential_key = credential_key
+		self.delay = delay
+		self.capacity = capacity
+		self.lookahead = lookahead or self.worker_count * 4
+		self.condition = threading.Condition()
+		self.pending = []
+		self.busy = collections.Counter()
+		self.drained = False
+		self.stopped = False
+		self.reading = False
+		# bumped whenever a credential is released or an account is read, see _claim
+		self.changes = 0
+		self.next_item = None
+
+	def run(self, next_item):
+		"""
+		Run pulls accounts with next_item, which returns None once the queue is drained, and returns when every
+		account has been handled
+		"""
+		self.next_item = next_item
+		self.drained = False
+		self.stopped = False
+		self.reading = False
+		workers = []
+		for number in range(self.worker_count):
+			worker = threading.Thread(target=self._work, name='account-worker-' + str(number + 1))
+			worker.daemon = True
+			worker.start()
+			workers.append(worker)
+		for worker in workers:
+			worker.join()
+
+	def _claim(self):
+		"""
+		Blocks until an account whose credential is free can be handed out and returns (credential, account),
+		or None once the queue is drained and nothing is pending. The budget delays and the queue are read in
+		redis, so the condition is only held while the in-memory bookkeeping is checked and updated
+		"""
+		while True:
+			with self.condition:
+				if self.stopped:
+					return None
+				candidates = list(self._free_pending())
+				changes = self.changes
+			ready = None
+			shortest_delay = None
+			for item, key in candidates:
+				delay = self.delay(item) if self.delay else 0
+				if delay <= 0:
+					ready = item, key
+					break
+				shortest_delay = delay if shortest_delay is None else min(shortest_delay, delay)
+			with self.condition:
+				if self.stopped:
+					return None
+				if ready is not None:
+					item, key = ready
+					# another worker may have taken the account or its credential in the meantime, then look again
+					index = next((index for index, pending in enumerate(self.pending) if pending is item), None)
+					if index is not None and not self._full(key):
+						del self.pending[index]
+						self.busy[key] += 1
+						return key, item
+					continue
+				read = not self.drained and not self.reading and len(self.pending) < self.lookahead
+				if read:
+					self.reading = True
+				elif self.drained and not self.pending:
+					return None
+				else:
+					# a release or read while the delays were looked up is not waited for, its notify is already gone
+					if self.changes == changes:
+						# woken up by a release or a read, or once the shortest budget delay is over
+						self.condition.wait(shortest_delay)
+					continue
+			try:
+				item = self.next_item()
+			except Exception as ex:
+				logger.error('Reading the next account failed: ' + str(ex))
+				item = None
+			with self.condition:
+				self.reading = False
+				self.changes += 1
+				if item is None:
+					self.drained = True
+				else:
+					self.pending.append(item)
+				self.condition.notify_all()
+
+	def _full(self, key):
+		return self.busy[key] >= (self.capacity(key) if self.capacity else 1)
+
+	def _free_pending(self):
+		"""
+		Returns the (account, credential) pairs of the pending accounts whose credential is not held by as many
+		workers as it allows, called with the condition held
+		"""
+		for item in self.pending:
+			key = self.credential_key(item)
+			if not self._full(key):
+				yield item, key
+
+	def stop(self):
+		"""
+		Stops handing out accounts, the accounts in flight are completed and run returns once they are. Returns the
+		accounts that were read ahead but never started
+		"""
+		with self.condition:
+			self.stopped = True
+			pending = self.pending
+			self.pending = []
+			self.condition.notify_all()
+		return pending
+
+	def _release(self, key):
+		with self.condition:
+			self.busy[key] -= 1
+			if self.busy[key] <= 0:
+				del self.busy[key]
+			self.changes += 1
+			self.condition.notify_all()
+
+	def _work(self):
+		while True:
+			claimed = self._claim()
+			if claimed is None:
+				# wake up the workers that wait on busy credentials so that they can exit as well
+				with self.condition:
+					self.condition.notify_all()
+				return
+			key, item = claimed
+			try:
+				self.handle(item)
+			except Exception as ex:
+				logger.error('Exception while handling account: ' + str(ex))
+			finally:
+				self._release(key)
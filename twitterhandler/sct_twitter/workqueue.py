@@ -0,0 +1,144 @@
+# encoding: utf-8
+
+# -----------------------------------------------------------------------
+# SoCaTel Twitter Handler
+# workqueue
+#  - leased batch consumer of the redis services lists.
+# -----------------------------------------------------------------------
+
+import os
+import time
+import socket
+import logging
+import threading
+
+logger = logging.getLogger('TWITTER_HANDLER')
+
+# Moves up to ARGV[1] items from the head of the list into the consumer's in-flight list and renews its lease
+_CLAIM_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+	redis.call('LTRIM', KEYS[1], #items, -1)
+	redis.call('RPUSH', KEYS[2], unpack(items))
+end
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[2])
+return items
+"""
+
+# Puts the in-flight items of every consumer whose lease expired back at the head of the list
+_RECLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+local reclaimed = 0
+for _, consumer in ipairs(expired) do
+	local in_flight = ARGV[2] .. consumer
+	local items = redis.call('LRANGE', in_flight, 0, -1)
+	for index = #items, 1, -1 do
+		redis.call('LPUSH', KEYS[1], items[index])
+	end
+	reclaimed = reclaimed + #items
+	redis.call('DEL', in_flight)
+	redis.call('ZREM', KEYS[2], consumer)
+end
+return reclaimed
+"""
+
+
+def consumer_name():
+	"""
+	Consumer name returns a name that is unique to this process, the container host name and the process id
+	"""
+	return socket.gethostname() + ':' + str(os.getpid())
+
+
+class LeasedWorkQueue(object):
+	"""
+	Leased work queue claims the items of a redis list in batches. Every claim atomically moves the items into an
+	in-flight list of this consumer, so that no two consumers get the same item, and an item is only dropped once
+	it is acknowledged. The consumer holds a lease that a heartbeat thread renews while the process is alive. The
+	in-flight items of a consumer whose lease expired (a crashed or killed container, or items that were never
+	acknowledged) are put back at the head of the list by the next consumer that claims
+	"""
+
+	def __init__(self, redis_client, list_name, consumer=None, lease=900, batch_size=10):
+		self.redis_client = redis_client
+		self.list_name = list_name
+		self.consumer = consumer or consumer_name()
+		self.lease = lease
+		self.batch_size = batch_size
+		self.in_flight_prefix = list_name + ':inflight:'
+		self.in_flight = self.in_flight_prefix + self.consumer
+		self.leases = list_name + ':leases'
+		self._claim = redis_client.register_script(_CLAIM_SCRIPT)
+		self._reclaim = redis_client.register_script(_RECLAIM_SCRIPT)
+		self.closed = threading.Event()
+		self.heartbeat = threading.Thread(target=self._renew_periodically, name='queue-heartbeat')
+		self.heartbeat.daemon = True
+		self.heartbeat.start()
+
+	def claim(self, count=None, wait=0):
+		"""
+		Claims up to count items (batch_size by default) and returns them as a list of raw bytes. When the list is
+		empty it blocks for up to wait seconds for the next item to be pushed, an empty list is returned when none
+		arrives
+		"""
+		reclaimed = self.reclaim()
+		if reclaimed:
+			logger.warning('Reclaimed ' + str(reclaimed) + ' item(s) of expired leases on ' + self.list_name)
+		items = self._claim(
+			keys=[self.list_name, self.in_flight, self.leases],
+			args=[count or self.batch_size, self.consumer, repr(time.time() + self.lease)]
+		)
+		if items or wait <= 0:
+			return items
+		item = self.redis_client.brpoplpush(self.list_name, self.in_flight, int(max(1, wait)))
+		return [item] if item is not None else []
+
+	def ack(self, item):
+		"""
+		Acknowledges a claimed item once it has been handled, dropping it from the in-flight list
+		"""
+		self.redis_client.lrem(self.in_flight, 1, item)
+
+	def release(self, items):
+		"""
+		Puts claimed items that were never handled back at the head of the list, in their original order
+		"""
+		if not items:
+			return
+		pipeline = self.redis_client.pipeline()
+		for item in reversed(items):
+			pipeline.lrem(self.in_flight, 1, item)
+			pipeline.lpush(self.list_name, item)
+		pipeline.execute()
+
+	def in_flight_items(self):
+		"""
+		Returns the items this consumer claimed and has not acknowledged yet
+		"""
+		return self.redis_client.lrange(self.in_flight, 0, -1)
+
+	def reclaim(self):
+		"""
+		Puts the in-flight items of every expired lease back on the list and returns how many there were
+		"""
+		return self._reclaim(keys=[self.list_name, self.leases], args=[repr(time.time()), self.in_flight_prefix])
+
+	def renew(self):
+		self.redis_client.zadd(self.leases, {self.consumer: time.time() + self.lease})
+
+	def close(self):
+		"""
+		Stops renewing the lease. The lease of a consumer without unacknowledged items is dropped right away, any
+		unacknowledged items are reclaimed by another consumer once the lease expires
+		"""
+		self.closed.set()
+		self.heartbeat.join()
+		if not self.redis_client.llen(self.in_flight):
+			self.redis_client.zrem(self.leases, self.consumer)
+
+	def _renew_periodically(self):
+		while not self.closed.wait(self.lease / 3.0):
+			try:
+				self.renew()
+			except Exception as ex:
+				logger.error('Renewing the lease of ' + self.consumer + ' failed: ' + str(ex))